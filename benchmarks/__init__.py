@@ -0,0 +1,34 @@
+"""Benchmarks for the hot paths of the QWB API.
+
+Each benchmark module can be run on its own, e.g.:
+```
+python -m benchmarks.bench_analysis
+```
+The suite runs all the hot paths and compares them to a recorded baseline:
+```
+python -m benchmarks.suite
+```
+"""
+import timeit
+import typing as t
+
+
+def measure(function: t.Callable[[], t.Any], repeat: int = 5, number: int = 1) -> float:
+    """Return the best time, in seconds, of a single call to function.
+
+    Args:
+        function (Callable): The function to time, called without arguments.
+        repeat (int): Number of timing runs, the best one is kept. Defaults to 5.
+        number (int): Number of calls per timing run. Defaults to 1.
+    """
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number
+
+
+def report(title: str, header: t.List[str], rows: t.List[t.List[t.Any]]) -> None:
+    """Print the results of a benchmark as an aligned table."""
+    cells = [header] + [[f"{cell:.6f}" if isinstance(cell, float) else str(cell) for cell in row]
+                        for row in rows]
+    widths = [max(len(row[ix]) for row in cells) for ix in range(len(header))]
+    print(f"=== {title} ===")
+    for row in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
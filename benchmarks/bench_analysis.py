@@ -0,0 +1,69 @@
+"""Benchmark of the variant analysis of a collation table at increasing witness counts.
+"""
+import random
+
+from collatex.core_classes import AlignmentTable, Column, Row, Token
+from textdistance import levenshtein
+
+from backend.contexts.collations.utils import analyze_collations, combine_values, \
+    compute_letter_difference, detect_omission
+
+from . import measure, report
+
+WITNESS_COUNTS = [5, 10, 20, 40, 80]
+COLUMN_COUNT = 30
+LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+
+
+def legacy_analyze_collations(alignment_table: AlignmentTable):
+    """Variant analysis as previously implemented, kept as a reference."""
+    variant_analysis = {}
+    for ix, col in enumerate(alignment_table.columns):
+        if col.variant:
+            variants = dict(col.tokens_per_witness)
+            for key, val in variants.items():
+                variants[key] = [""] if val == [] else list(val)
+            for key, value in combine_values(variants).items():
+                string_value = [val if isinstance(val, str) else val.token_string for val in value]
+                if string_value[0] != string_value[1]:
+                    variant_analysis[str(ix) + ":" + key] = {
+                        "guessed_type": "omission" if detect_omission(string_value) else "unknown",
+                        "distance": levenshtein(string_value[0], string_value[1]),
+                        "letter_difference": compute_letter_difference(string_value[0],
+                                                                       string_value[1]),
+                        "reading_1": string_value[0],
+                        "reading_2": string_value[1],
+                    }
+    return variant_analysis
+
+
+def synthetic_table(witnesses: int, columns: int = COLUMN_COUNT, seed: int = 0) -> AlignmentTable:
+    """Build an alignment table where each column holds a few competing readings."""
+    rng = random.Random(seed)
+    table = AlignmentTable(collation=None)
+    table.rows = [Row(f"W{witness}") for witness in range(witnesses)]
+    for _ in range(columns):
+        readings = ["".join(rng.choices(LETTERS, k=rng.randint(2, 7))) for _ in range(3)] + [""]
+        column = Column()
+        for witness in range(witnesses):
+            reading = rng.choice(readings)
+            tokens = [Token({"t": reading, "n": reading})] if reading else []
+            column.put(f"W{witness}", tokens)
+            table.rows[witness].append(tokens)
+        column.variant = True
+        table.columns.append(column)
+    return table
+
+
+def main():
+    rows = []
+    for witnesses in WITNESS_COUNTS:
+        table = synthetic_table(witnesses)
+        legacy = measure(lambda: legacy_analyze_collations(table), repeat=3)
+        current = measure(lambda: analyze_collations(table), repeat=3)
+        rows.append([witnesses, legacy, current, f"{legacy / current:.1f}x"])
+    report("analyze_collations", ["witnesses", "legacy (s)", "current (s)", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
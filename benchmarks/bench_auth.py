@@ -0,0 +1,32 @@
+"""Benchmark of the verification of a token, with and without the claims cache.
+"""
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from backend.api.oidc.oidc_auth_client import OIDCAuthClient
+
+from . import measure, report
+
+
+def main():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode({
+        "given_name": "reader",
+        "resource_access": {"qwb-api": {"roles": ["read"]}},
+        "exp": int(time.time()) + 3600,
+    }, private_key, algorithm="RS256")
+    uncached = OIDCAuthClient(issuer_url="http://localhost", realm="theolab", client_id="qwb-api",
+                              enabled=False, claims_cache_size=0)
+    cached = OIDCAuthClient(issuer_url="http://localhost", realm="theolab", client_id="qwb-api",
+                            enabled=False)
+    uncached.public_key = cached.public_key = private_key.public_key()
+    legacy = measure(lambda: uncached.verify_token(token), number=1000)
+    current = measure(lambda: cached.verify_token(token), number=1000)
+    report("token verification", ["uncached (s)", "cached (s)", "speedup"],
+           [[legacy, current, f"{legacy / current:.1f}x"]])
+
+
+if __name__ == "__main__":
+    main()
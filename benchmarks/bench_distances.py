@@ -0,0 +1,40 @@
+"""Benchmark of the witness distance matrix and clustering at verse and chapter scale.
+"""
+import random
+
+from backend.contexts.collations.distances import cluster_order, distance_matrix
+
+from . import measure, report
+
+WITNESS_COUNTS = [10, 50, 100, 300]
+LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+
+
+def synthetic_witnesses(witnesses: int, words: int, seed: int = 0):
+    """Build witnesses of a same text with word substitutions and missing beginnings."""
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices(LETTERS, k=rng.randint(2, 7))) for _ in range(words)]
+    text = rng.choices(vocabulary, k=words)
+    texts = []
+    for _ in range(witnesses):
+        witness = list(text)
+        for _ in range(words // 10):
+            witness[rng.randrange(words)] = rng.choice(vocabulary)
+        texts.append(" ".join(witness[rng.randrange(words // 5 + 1):]))
+    return texts
+
+
+def main():
+    rows = []
+    for scale, words in [("verse", 15), ("chapter", 300)]:
+        for witnesses in WITNESS_COUNTS:
+            texts = synthetic_witnesses(witnesses, words)
+            matrix = distance_matrix(texts)
+            rows.append([scale, witnesses,
+                         measure(lambda: distance_matrix(texts), repeat=3),
+                         measure(lambda: cluster_order(matrix), repeat=3)])
+    report("witness distances", ["scale", "witnesses", "matrix (s)", "clustering (s)"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Profile of the imports of the application factory, run in a fresh interpreter with
+-X importtime. Reports the total import time and the slowest modules, with the package
+importing them.
+"""
+import subprocess
+import sys
+
+from . import report
+
+STATEMENT = "from backend.api.app import AppSettings, create_app; create_app(AppSettings())"
+TOP = 15
+
+
+def import_times(statement: str = STATEMENT):
+    """Return the cumulative import time, in seconds, of each module imported by a statement
+    in a fresh interpreter, along with its depth in the import tree."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (int(cumulative) / 1e6, depth)
+    return times
+
+
+def main():
+    times = import_times()
+    rows = [[name, depth, time]
+            for name, (time, depth) in sorted(times.items(), key=lambda item: -item[1][0])
+            if depth <= 2][:TOP]
+    rows.append(["total", 0, sum(time for time, depth in times.values() if depth == 0)])
+    report("create_app imports", ["module", "depth", "cumulative (s)"], rows)
+
+
+if __name__ == "__main__":
+    main()
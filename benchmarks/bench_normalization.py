@@ -0,0 +1,42 @@
+"""Micro-benchmark of the normalization of the witnesses of a parallel.
+"""
+import random
+
+from backend.contexts.collations.normalization import brackets_balanced, get_pipeline
+
+from . import measure, report
+from .legacy import legacy_check_matched_bracket, legacy_unpack
+
+RECORD_COUNTS = [100, 1000, 10000]
+READINGS = ["[--]", "[--", "עלו]הי", "עננא", "ביו]מ֯י", "מ֯[ו]עה", "[מפ]ר֯ק[ן?]", "בְּרֵאשִׁ֖ית",
+            "אלהים", "השמים", "ואת", "הארץ"]
+
+
+def synthetic_records(count: int, seed: int = 0):
+    """Build records of a few witnesses, ordered by manuscript."""
+    rng = random.Random(seed)
+    return [{
+        "manuscript": f"4Q{ix * 10 // count}",
+        "reading": rng.choice(READINGS),
+        "followed_by": rng.choice(["space", "space", "space", "break"]),
+        "is_fully_reconstructed": rng.random() < 0.05,
+    } for ix in range(count)]
+
+
+def main():
+    rows = []
+    for count in RECORD_COUNTS:
+        records = synthetic_records(count)
+        legacy = measure(lambda: legacy_unpack(records, False, True), repeat=5)
+        pipeline = get_pipeline(False, True)
+        current = measure(lambda: pipeline.unpack(records), repeat=5)
+        rows.append(["unpack", count, legacy, current, f"{legacy / current:.1f}x"])
+    words = [record["reading"] for record in synthetic_records(10000)]
+    legacy = measure(lambda: [legacy_check_matched_bracket(word) for word in words])
+    current = measure(lambda: [brackets_balanced(word) for word in words])
+    rows.append(["brackets", len(words), legacy, current, f"{legacy / current:.1f}x"])
+    report("witness normalization", ["step", "records", "legacy (s)", "current (s)", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
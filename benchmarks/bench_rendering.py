@@ -0,0 +1,42 @@
+"""Benchmark of the rendering of a collation table at increasing witness counts, as HTML
+as well as a compact alignment matrix.
+"""
+import json
+
+from collatex.core_classes import create_table_visualization
+
+from backend.contexts.collations.rendering import alignment_matrix, html_table
+from backend.tools.msgpack import packb
+
+from . import measure, report
+from .bench_analysis import synthetic_table
+
+WITNESS_COUNTS = [5, 20, 80, 320]
+COLUMN_COUNT = 200
+
+
+def main():
+    rows = []
+    sizes = []
+    for witnesses in WITNESS_COUNTS:
+        table = synthetic_table(witnesses, columns=COLUMN_COUNT)
+        matrix = alignment_matrix(table)
+        html_size = len(html_table(table).encode("utf8"))
+        json_size = len(json.dumps(matrix, ensure_ascii=False, separators=(",", ":")).encode("utf8"))
+        msgpack_size = len(packb(matrix))
+        sizes.append([witnesses, html_size, json_size, msgpack_size,
+                      f"{html_size / json_size:.1f}x", f"{html_size / msgpack_size:.1f}x"])
+        legacy = measure(
+            lambda: create_table_visualization(table).get_html_string(formatting=True), repeat=3
+        )
+        current = measure(lambda: html_table(table), repeat=3)
+        encoded = measure(lambda: packb(alignment_matrix(table)), repeat=3)
+        rows.append([witnesses, legacy, current, encoded, f"{legacy / current:.1f}x"])
+    report("collation table rendering",
+           ["witnesses", "prettytable (s)", "renderer (s)", "msgpack (s)", "speedup"], rows)
+    report("collation table size",
+           ["witnesses", "html (B)", "json (B)", "msgpack (B)", "json ratio", "msgpack ratio"], sizes)
+
+
+if __name__ == "__main__":
+    main()
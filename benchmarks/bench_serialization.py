@@ -0,0 +1,52 @@
+"""Benchmark of the JSON serialization of the largest payloads of the API.
+"""
+import json
+import random
+
+from backend.api.responses import dumps
+
+from . import measure, report
+from .bench_analysis import LETTERS
+
+
+def manuscript_payload(words: int = 200000, seed: int = 0):
+    """Whole manuscript text, as returned by /manuscript/{manuscript_name}."""
+    rng = random.Random(seed)
+    text = " ".join("".join(rng.choices(LETTERS, k=rng.randint(2, 7))) for _ in range(words))
+    return {"1QIsaa": text}
+
+
+def lexicometric_payload(occurrences: int = 20000, seed: int = 0):
+    """Morphological analysis of all the occurrences of a frequent word, as returned by
+    /lexicometric/{word}."""
+    rng = random.Random(seed)
+    analysis = [{
+        "position": {
+            "manuscript_sign_cluster_reading_id": rng.randint(1, 10 ** 7),
+            "manuscript": f"4Q{rng.randint(1, 500)}",
+            "column": str(rng.randint(1, 60)),
+            "line": str(rng.randint(1, 30)),
+            "sequence_in_line": rng.randint(1, 15),
+        },
+        "morphological_analysis": {
+            "word_1": {
+                "lemma": "ו",
+                "word_class": "Konjunktion",
+                "short_definition": "und",
+            },
+        },
+    } for _ in range(occurrences)]
+    return {"ו": analysis}
+
+
+def main():
+    rows = []
+    for name, payload in [("manuscript", manuscript_payload()), ("lexicometric", lexicometric_payload())]:
+        legacy = measure(lambda: json.dumps(payload, ensure_ascii=False).encode("utf8"))
+        current = measure(lambda: dumps(payload))
+        rows.append([name, len(dumps(payload)), legacy, current, f"{legacy / current:.1f}x"])
+    report("json serialization", ["payload", "size (B)", "json (s)", "current (s)", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
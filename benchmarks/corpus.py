@@ -0,0 +1,277 @@
+"""Generator of synthetic corpora, scaled relatively to the size of the QWB database.
+
+A corpus is made of traditions, split into chapters and verses, and of witness manuscripts
+holding variant copies of their verses, split into columns and lines. Each verse copied by a
+witness is a parallel phrase, its words being linked to the readings of the witness. The
+corpora are written as SQL dumps, that qwb-api-load-sqlite loads into a SQLite database, or
+as snapshots opened by the API:
+```
+python -m benchmarks.corpus --scale 10 --fan-out 8 --dump corpus.sql --snapshot corpus.snap
+```
+At scale 1, the corpus approximates the size of QD, i.e. about 180k readings of the
+traditions, and as many parallel readings as the fan-out.
+"""
+import argparse
+import random
+import typing as t
+
+from .fixtures import LETTERS
+
+# Size of the corpus at scale 1
+TRADITIONS = 20
+CHAPTERS = 30
+VERSES = 25
+WORDS = 12
+# Number of witness manuscripts at scale 1
+MANUSCRIPTS = 900
+# Number of lines of a column, and of words of a line, of the witness manuscripts
+LINES = 20
+LINE_WORDS = 8
+# Probabilities of the variants of the copied readings
+VARIANT_PROBABILITY = 0.08
+OMISSION_PROBABILITY = 0.03
+# Probabilities of the reconstructions of the readings of the witnesses
+LACUNA_PROBABILITY = 0.15
+RECONSTRUCTION_PROBABILITY = 0.05
+# Tables of the corpus
+TABLES = ["manuscript_view", "manuscript_sign_cluster", "manuscript_sign_cluster_reading",
+          "parallel_phrase_group_view", "parallel_word_of_phrase"]
+# Number of rows of each INSERT statement of the dumps
+ROWS_PER_STATEMENT = 1000
+
+Row = t.Dict[str, t.Any]
+Tables = t.Dict[str, t.List[Row]]
+
+
+def random_word(rng: random.Random) -> str:
+    """Draw a Hebrew word, its length following the distribution of the QD readings."""
+    length = min(2 + int(rng.expovariate(1 / 2.5)), 12)
+    return "".join(rng.choices(LETTERS, k=length))
+
+
+def unique_ordered_id(manuscript_id: int, column: int, line: int, sequence: int) -> int:
+    """Build the unique ordered id of a reading, following the layout of QD."""
+    return ((manuscript_id * 10_000 + column) * 1_000 + line) * 1_000 + sequence
+
+
+def reconstruct(reading: str, rng: random.Random, line_edge: bool) -> t.Tuple[str, bool]:
+    """Draw the reconstruction of a reading, more likely at the edges of the lines, and
+    return it along with whether the reading is fully reconstructed."""
+    draw = rng.random()
+    probability = LACUNA_PROBABILITY if line_edge else RECONSTRUCTION_PROBABILITY
+    if draw < probability / 2:
+        return f"[{reading}]", True
+    if draw < probability and len(reading) > 2:
+        cut = rng.randint(1, len(reading) - 1)
+        return (f"{reading[:cut]}[{reading[cut:]}]" if rng.random() < 0.5
+                else f"[{reading[:cut]}]{reading[cut:]}"), False
+    return reading, False
+
+
+class Witness:
+    """Witness manuscript, filled line by line with copies of verses."""
+
+    def __init__(self, manuscript_id: int, name: str) -> None:
+        self.manuscript_id = manuscript_id
+        self.name = name
+        self.column = 1
+        self.line = 1
+        self.sequence = 0
+
+    def next_position(self) -> t.Tuple[str, str, int]:
+        """Return the column, the line and the sequence of the next reading."""
+        self.sequence += 1
+        return f"col. {self.column}", str(self.line), self.sequence
+
+    def end_line(self) -> None:
+        """Start a new line, and a new column once the column is full."""
+        self.line += 1
+        self.sequence = 0
+        if self.line > LINES:
+            self.column += 1
+            self.line = 1
+
+
+class CorpusGenerator:
+    """Generate the rows of the tables of a synthetic corpus, verse by verse."""
+
+    def __init__(self, scale: float = 1, fan_out: int = 4, seed: int = 0) -> None:
+        """
+        Args:
+            scale (float): Size of the corpus relatively to QD. Defaults to 1.
+            fan_out (int): Mean number of witnesses of a verse. Defaults to 4.
+            seed (int): Seed of the random generator. Defaults to 0.
+        """
+        self.rng = random.Random(seed)
+        self.scale = scale
+        self.fan_out = fan_out
+        self.reading_id = 0
+        self.phrase_id = 0
+        self.traditions = max(1, round(TRADITIONS * scale))
+        self.witnesses = [Witness(1000 + ix, f"{1 + ix % 11}Q{ix // 11 + 1:03d}")
+                          for ix in range(max(fan_out, round(MANUSCRIPTS * scale)))]
+
+    def reading(self, tables: Tables, manuscript_id: int, manuscript: str, column: str, line: str,
+                sequence: int, reading: str, followed_by: str, fully_reconstructed: bool) -> int:
+        """Add a reading to the tables and return its id."""
+        self.reading_id += 1
+        tables["manuscript_view"].append({
+            "manuscript": manuscript, "column": column, "line": line, "reading": reading,
+            "followed_by": followed_by, "sequence_in_line": sequence, "language_id": 1,
+            "manuscript_id": manuscript_id, "manuscript_sign_cluster_id": self.reading_id,
+            "manuscript_sign_cluster_reading_id": self.reading_id, "position_in_reference": 0,
+            "unique_ordered_id": unique_ordered_id(manuscript_id, int(column.split()[-1]),
+                                                   int(line), sequence),
+        })
+        tables["manuscript_sign_cluster"].append({
+            "manuscript_sign_cluster_id": self.reading_id,
+            "is_fully_reconstructed": int(fully_reconstructed),
+        })
+        tables["manuscript_sign_cluster_reading"].append({
+            "manuscript_sign_cluster_reading_id": self.reading_id, "reading": reading,
+        })
+        return self.reading_id
+
+    def copy(self, tables: Tables, witness: Witness, words: t.List[t.Tuple[int, str]]) -> None:
+        """Copy the words of a verse within a witness, as a parallel phrase."""
+        rng = self.rng
+        self.phrase_id += 1
+        copied = [(anchor, random_word(rng) if rng.random() < VARIANT_PROBABILITY else word)
+                  for anchor, word in words if rng.random() >= OMISSION_PROBABILITY]
+        for ix, (anchor, word) in enumerate(copied):
+            column, line, sequence = witness.next_position()
+            line_end = sequence >= LINE_WORDS or (ix == len(copied) - 1 and rng.random() < 0.3)
+            reading, fully_reconstructed = reconstruct(word, rng, sequence == 1 or line_end)
+            reading_id = self.reading(tables, witness.manuscript_id, witness.name, column, line,
+                                      sequence, reading, "break" if line_end else "space",
+                                      fully_reconstructed)
+            tables["parallel_phrase_group_view"].append({
+                "anchor_reading_id": anchor, "manuscript_sign_cluster_reading_id": reading_id,
+                "parallel_phrase_id": self.phrase_id,
+            })
+            tables["parallel_word_of_phrase"].append({
+                "parallel_phrase_id": self.phrase_id, "manuscript_sign_cluster_reading_id": reading_id,
+            })
+            if line_end:
+                witness.end_line()
+        for anchor, _ in words:
+            tables["parallel_phrase_group_view"].append({
+                "anchor_reading_id": anchor, "manuscript_sign_cluster_reading_id": anchor,
+                "parallel_phrase_id": self.phrase_id,
+            })
+
+    def verses(self) -> t.Iterator[Tables]:
+        """Generate the rows of the corpus, one verse and its copies at a time."""
+        rng = self.rng
+        for tradition in range(self.traditions):
+            name = f"T{tradition + 1:03d}"
+            manuscript_id = tradition + 1
+            for chapter in range(1, CHAPTERS + 1):
+                for verse in range(1, VERSES + 1):
+                    tables: Tables = {table: [] for table in TABLES}
+                    length = max(3, round(rng.gauss(WORDS, WORDS / 3)))
+                    words = []
+                    for sequence in range(1, length + 1):
+                        word = random_word(rng)
+                        anchor = self.reading(tables, manuscript_id, name, f"chap. {chapter}", str(verse),
+                                              sequence, word, "break" if sequence == length else "space",
+                                              False)
+                        words.append((anchor, word))
+                    fan_out = min(len(self.witnesses), max(0, round(rng.expovariate(1 / self.fan_out))))
+                    for witness in rng.sample(self.witnesses, fan_out):
+                        self.copy(tables, witness, words)
+                    yield tables
+
+
+def sql_literal(value: t.Any) -> str:
+    """Encode a value as a MySQL literal."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def write_insert(file: t.TextIO, table: str, rows: t.List[Row]) -> None:
+    """Write the rows of a table as an INSERT statement."""
+    columns = list(rows[0])
+    file.write(f"INSERT INTO `{table}` ({', '.join(f'`{column}`' for column in columns)}) VALUES\n")
+    file.write(",\n".join("(" + ", ".join(sql_literal(row.get(column)) for column in columns) + ")"
+                          for row in rows))
+    file.write(";\n")
+
+
+def write_dump(path: str, verses: t.Iterable[Tables]) -> t.Dict[str, int]:
+    """Write the rows of a corpus as a SQL dump, buffering the rows of each table.
+
+    Returns:
+        Dict[str, int]: The number of rows of each table.
+    """
+    buffers: Tables = {}
+    counts: t.Dict[str, int] = {}
+    with open(path, "w", encoding="utf8") as file:
+        file.write("-- Synthetic corpus generated by benchmarks.corpus\n")
+        for tables in verses:
+            for table, rows in tables.items():
+                buffer = buffers.setdefault(table, [])
+                buffer.extend(rows)
+                counts[table] = counts.get(table, 0) + len(rows)
+                if len(buffer) >= ROWS_PER_STATEMENT:
+                    write_insert(file, table, buffer)
+                    buffer.clear()
+        for table, buffer in buffers.items():
+            if buffer:
+                write_insert(file, table, buffer)
+    return counts
+
+
+def write_snapshot(path: str, verses: t.Iterable[Tables]) -> str:
+    """Write the parallel index and the catalog of a corpus as a snapshot.
+
+    Returns:
+        str: The version of the snapshot.
+    """
+    from backend.contexts.collations.index import ParallelIndex
+    from backend.contexts.snapshot import write_corpus_snapshot
+    readings: t.List[Row] = []
+    groups: t.List[Row] = []
+    words: t.List[Row] = []
+    reconstructed: t.Dict[int, int] = {}
+    for tables in verses:
+        readings.extend(tables["manuscript_view"])
+        groups.extend(tables["parallel_phrase_group_view"])
+        words.extend(tables["parallel_word_of_phrase"])
+        reconstructed.update((cluster["manuscript_sign_cluster_id"], cluster["is_fully_reconstructed"])
+                             for cluster in tables["manuscript_sign_cluster"])
+    for reading in readings:
+        reading["is_fully_reconstructed"] = reconstructed[reading["manuscript_sign_cluster_id"]]
+    catalog: t.Dict[str, t.Dict[str, None]] = {}
+    for reading in readings:
+        catalog.setdefault(reading["manuscript"], {})[reading["column"]] = None
+    index = ParallelIndex.build(readings, groups, words)
+    return write_corpus_snapshot(path, index, {name: list(columns) for name, columns in catalog.items()})
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1, help="Size of the corpus relatively to QD, e.g. 1, 10 or 100.")
+    parser.add_argument("--fan-out", type=int, default=4, help="Mean number of witnesses of a verse.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    parser.add_argument("--dump", help="Path of the SQL dump to write.")
+    parser.add_argument("--snapshot", help="Path of the snapshot to write.")
+    args = parser.parse_args(argv)
+    if not args.dump and not args.snapshot:
+        parser.error("Expected --dump or --snapshot")
+
+    def generate() -> t.Iterator[Tables]:
+        return CorpusGenerator(args.scale, args.fan_out, args.seed).verses()
+
+    if args.dump:
+        for table, count in write_dump(args.dump, generate()).items():
+            print(f"{table}: {count} rows")
+    if args.snapshot:
+        print(f"Snapshot version: {write_snapshot(args.snapshot, generate())}")
+
+
+if __name__ == "__main__":
+    main()
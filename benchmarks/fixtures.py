@@ -0,0 +1,71 @@
+"""Offline fixtures of the benchmarks, derived from the test dump of the database and scaled
+up with synthetic witnesses.
+"""
+import os
+import random
+import typing as t
+from functools import lru_cache
+
+from backend.tools.dump import load_dump
+
+DUMP_PATH = os.path.join(os.path.dirname(__file__), "..", "deploy", "dump", "test_dump.sql")
+LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+VOWELS = "ְִֵֶַָֹּ֑֖"
+
+
+@lru_cache(maxsize=None)
+def manuscript_records() -> t.List[t.Dict[str, t.Any]]:
+    """Return the readings of the manuscripts of the test dump, in reading order."""
+    records = load_dump(DUMP_PATH)["manuscript_view"]
+    return sorted(records, key=lambda record: record["unique_ordered_id"])
+
+
+def is_fully_reconstructed(reading: str) -> bool:
+    """Whether a reading is entirely within a single reconstruction."""
+    return reading.startswith("[") and reading.endswith("]") and reading.count("[") == 1
+
+
+def parallel_records(witnesses: int, seed: int = 0) -> t.List[t.Dict[str, t.Any]]:
+    """Build the ordered records of a parallel of several witnesses, each one being a variant
+    of the readings of the test dump where a reading is occasionally replaced or omitted."""
+    rng = random.Random(seed)
+    readings = [(record["reading"], record["followed_by"]) for record in manuscript_records()]
+    records = []
+    for witness in range(witnesses):
+        for reading, followed_by in readings:
+            draw = rng.random()
+            if draw < 0.05:
+                continue
+            if draw < 0.15:
+                reading = "".join(rng.choices(LETTERS, k=len(reading)))
+            records.append({
+                "manuscript": f"W{witness}",
+                "reading": reading,
+                "followed_by": followed_by,
+                "is_fully_reconstructed": is_fully_reconstructed(reading),
+            })
+    return records
+
+
+def pointed_text(words: int, seed: int = 0) -> str:
+    """Build a Hebrew text of pointed words, i.e., carrying vowels and cantillation marks."""
+    rng = random.Random(seed)
+    return " ".join(
+        "".join(letter + rng.choice(VOWELS) for letter in rng.choices(LETTERS, k=rng.randint(2, 6)))
+        for _ in range(words)
+    )
+
+
+def witness_texts(witnesses: int, seed: int = 0) -> t.Dict[str, str]:
+    """Build the texts of the witnesses of a parallel, unpacked from the test dump."""
+    from backend.contexts.collations.normalization import get_pipeline
+    return get_pipeline(reconstructed=True).unpack(parallel_records(witnesses, seed))
+
+
+def morphological_analyses(readings: int, analyses: int = 4, seed: int = 0) -> t.List[t.Dict[str, t.Any]]:
+    """Build the morphological analyses of the occurrences of a word, most of them repeated."""
+    rng = random.Random(seed)
+    distinct = [{"lemma": "".join(rng.choices(LETTERS, k=3)), "part_of_speech": rng.choice("nvp"),
+                 "person": rng.choice("123"), "gender": rng.choice("mf"), "number": rng.choice("sp")}
+                for _ in range(analyses)]
+    return [{"morphological_analysis": rng.choice(distinct)} for _ in range(readings)]
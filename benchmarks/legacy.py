@@ -0,0 +1,68 @@
+"""Previous implementation of the normalization of the witnesses of a parallel, kept as a
+reference for the regression tests and the benchmarks of the normalization pipeline.
+"""
+import re
+
+from backend.contexts.collations.models import FOLLOWED_BY_MAPPER, FRAGMENTATION_PLACEHOLDER
+
+
+def legacy_check_matched_bracket(word):
+    """Previous implementation of the bracket check."""
+    s = []
+    balanced = True
+    index = 0
+    while index < len(word) and balanced:
+        token = word[index]
+        if token == "[":
+            s.append(token)
+        elif token == "]":
+            if len(s) == 0:
+                balanced = False
+            else:
+                s.pop()
+        index += 1
+    return balanced and len(s) == 0
+
+
+def legacy_unpack_parallel_data(records, reconstructed=False):
+    """Previous implementation of the unpacking of the parallels."""
+    parallels = {}
+    for record in records:
+        if not reconstructed:
+            if record["is_fully_reconstructed"]:
+                reading = FRAGMENTATION_PLACEHOLDER
+            elif "[" in record["reading"] or "]" in record["reading"]:
+                bracket_word = record["reading"]
+                nbr_closed_brackets = bracket_word.count("]")
+                nbr_opened_brackets = bracket_word.count("[")
+                if nbr_closed_brackets < nbr_opened_brackets:
+                    bracket_word = f"{bracket_word}]"
+                elif nbr_closed_brackets > nbr_opened_brackets:
+                    bracket_word = f"[{bracket_word}"
+                elif not legacy_check_matched_bracket(record['reading']):
+                    bracket_word = f"[{record['reading']}]"
+                reading = re.sub(r'\[.*?\]', f'{FRAGMENTATION_PLACEHOLDER}', bracket_word)
+            else:
+                reading = record["reading"]
+        else:
+            reading = record["reading"]
+        try:
+            parallels[record["manuscript"]] += reading + FOLLOWED_BY_MAPPER[record["followed_by"]]
+        except KeyError:
+            parallels[record["manuscript"]] = reading + FOLLOWED_BY_MAPPER[record["followed_by"]]
+    return {man: context.strip() for man, context in parallels.items()}
+
+
+def legacy_strip_hebrew_vowels(hebrew_string):
+    """Previous implementation of the vowels stripping."""
+    vowels_pattern = re.compile('[\u05B0-\u05C3\u05C7-\u05C8\u05F0-\u05F4\u05BC\u05B0-\u05B9\u05F3-\u05F4\u0591-\u05AF]')
+    return re.sub(vowels_pattern, '', hebrew_string)
+
+
+def legacy_unpack(records, reconstructed=False, strip_vowels=False):
+    """Previous implementation of the unpacking of the parallels followed by the vowels
+    stripping, as run for a collation."""
+    parallels = legacy_unpack_parallel_data(records, reconstructed)
+    if strip_vowels:
+        parallels = {man: legacy_strip_hebrew_vowels(context) for man, context in parallels.items()}
+    return parallels
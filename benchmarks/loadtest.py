@@ -0,0 +1,305 @@
+"""Load test of the API, replaying a weighted mix of requests at a target concurrency or rate.
+
+The API is started in process, with OIDC disabled, on a SQLite database loaded with
+qwb-api-load-sqlite (e.g. from a corpus of benchmarks.corpus), or requested at a given URL:
+```
+python -m benchmarks.loadtest --database data/QD.sqlite --concurrency 16 --duration 30
+python -m benchmarks.loadtest --database data/QD.sqlite --rps 200 --output after.json --compare before.json
+python -m benchmarks.loadtest --url http://localhost:8000 --concurrency 64
+```
+The throughput and the latency percentiles of each route are reported, along with the lag of
+the event loop when the API runs in process, and saved as JSON to compare versions.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import time
+import typing as t
+import urllib.parse
+
+import httpx
+
+from . import report
+
+# Weights of the routes within the mix of requests
+DEFAULT_MIX = {
+    "manuscript": 3,
+    "parallels_list": 3,
+    "parallels_count": 2,
+    "lexicometric": 2,
+    "collation": 1,
+}
+# Number of manuscripts whose columns and words are requested as targets
+DISCOVERED_MANUSCRIPTS = 20
+LAG_INTERVAL = 0.01
+
+Verse = t.Tuple[str, str, str]
+Word = t.Tuple[str, str, str]
+
+
+def quote(value: str) -> str:
+    """Quote a path segment."""
+    return urllib.parse.quote(value, safe="")
+
+
+class Targets:
+    """Manuscripts, verses with parallels and words requested by the load test."""
+
+    def __init__(self,
+                 columns: t.List[t.Tuple[str, str]],
+                 verses: t.List[Verse],
+                 words: t.List[Word]) -> None:
+        self.columns = columns
+        self.verses = verses
+        self.words = words
+
+    @classmethod
+    async def discover(cls, client: httpx.AsyncClient, rng: random.Random) -> "Targets":
+        """Discover the targets from the API itself."""
+        density = (await client.get("/parallels/density")).json()
+        verses = [(tradition, chapter, verse)
+                  for tradition, chapters in density.items()
+                  for chapter, verses in chapters.items()
+                  for verse in verses]
+        manuscripts = (await client.get("/manuscript/")).json()["manuscripts"]
+        columns = []
+        words = []
+        for manuscript in rng.sample(manuscripts, min(DISCOVERED_MANUSCRIPTS, len(manuscripts))):
+            response = await client.get(f"/manuscript/{quote(manuscript)}/attributes/column")
+            manuscript_columns = response.json()[manuscript]["column"]
+            columns.extend((manuscript, column) for column in manuscript_columns)
+            column = rng.choice(manuscript_columns)
+            response = await client.get(f"/manuscript/{quote(manuscript)}", params={"column": column})
+            if response.status_code == 200:
+                text = response.json()[manuscript][column]
+                words.extend((word, manuscript, column) for word in set(text.split()))
+        if not columns:
+            raise RuntimeError("No manuscript found, is the database loaded?")
+        return cls(columns, verses, words)
+
+    def request(self, route: str, rng: random.Random) -> t.Tuple[str, t.Dict[str, str]]:
+        """Draw the path and the query parameters of a request to a route."""
+        if route == "manuscript":
+            manuscript, column = rng.choice(self.columns)
+            return f"/manuscript/{quote(manuscript)}", {"column": column}
+        if route == "lexicometric":
+            word, manuscript, column = rng.choice(self.words)
+            return f"/lexicometric/{quote(word)}", {"manuscript": manuscript, "column": column}
+        if not self.verses:
+            raise RuntimeError("No parallel found, is the database loaded?")
+        tradition, chapter, verse = rng.choice(self.verses)
+        if route == "parallels_list":
+            return "/parallels/list", {"tradition": tradition, "chapter": chapter, "verse": verse}
+        if route == "parallels_count":
+            return "/parallels/count", {"tradition": tradition, "chapter": chapter}
+        if route == "collation":
+            return (f"/parallels/{quote(tradition)}/{quote(chapter)}/{quote(verse)}/collation",
+                    {"reconstructed": "false", "strip_vowels": "false"})
+        raise ValueError(f"Unknown route {route}")
+
+
+class Recorder:
+    """Latencies and statuses of the requests of each route."""
+
+    def __init__(self) -> None:
+        self.latencies: t.Dict[str, t.List[float]] = {}
+        self.statuses: t.Dict[str, t.Dict[str, int]] = {}
+
+    def record(self, route: str, latency: float, status: str) -> None:
+        self.latencies.setdefault(route, []).append(latency)
+        statuses = self.statuses.setdefault(route, {})
+        statuses[status] = statuses.get(status, 0) + 1
+
+
+async def send(client: httpx.AsyncClient, recorder: Recorder, route: str, path: str,
+               params: t.Dict[str, str], started: float) -> None:
+    """Send a request and record its latency, measured from the time it was due."""
+    try:
+        response = await client.get(path, params=params)
+        status = str(response.status_code)
+    except httpx.HTTPError as exc:
+        status = type(exc).__name__
+    recorder.record(route, time.perf_counter() - started, status)
+
+
+async def closed_loop(client: httpx.AsyncClient, targets: Targets, mix: t.Dict[str, float],
+                      recorder: Recorder, concurrency: int, duration: float, rng: random.Random) -> None:
+    """Send requests from a fixed number of workers, each one waiting for its response
+    before sending the next request."""
+    deadline = time.perf_counter() + duration
+    routes, weights = list(mix), list(mix.values())
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0]
+            path, params = targets.request(route, rng)
+            await send(client, recorder, route, path, params, time.perf_counter())
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(client: httpx.AsyncClient, targets: Targets, mix: t.Dict[str, float],
+                    recorder: Recorder, rps: float, duration: float, rng: random.Random) -> None:
+    """Send requests at a fixed rate, whether the previous ones were answered or not, so that
+    the latencies include the time spent waiting for the API."""
+    routes, weights = list(mix), list(mix.values())
+    tasks = set()
+    start = time.perf_counter()
+    for ix in range(int(rps * duration)):
+        due = start + ix / rps
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        route = rng.choices(routes, weights)[0]
+        path, params = targets.request(route, rng)
+        task = asyncio.create_task(send(client, recorder, route, path, params, due))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+
+
+async def monitor_lag(lags: t.List[float], interval: float = LAG_INTERVAL) -> None:
+    """Measure the lag of the event loop, as the delay of the wake up of a periodic sleep."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+def percentile(values: t.Sequence[float], quantile: float) -> float:
+    """Return the nearest rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(quantile * len(values)) - 1))]
+
+
+def summarize(latencies: t.List[float], duration: float) -> t.Dict[str, float]:
+    """Summarize latencies, in milliseconds, along with the throughput."""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "throughput": len(values) / duration,
+        "mean": 1000 * sum(values) / len(values) if values else 0.0,
+        "p50": 1000 * percentile(values, 0.5),
+        "p95": 1000 * percentile(values, 0.95),
+        "p99": 1000 * percentile(values, 0.99),
+        "max": 1000 * values[-1] if values else 0.0,
+    }
+
+
+@contextlib.asynccontextmanager
+async def local_client(database: str, snapshot: t.Optional[str]):
+    """Start the API in process on a SQLite database, and yield a client requesting it."""
+    from backend.api.app import AppSettings, OIDCSettings, SnapshotSettings, create_app
+    directory, name = os.path.split(os.path.abspath(database))
+    app = create_app(AppSettings(
+        oidc=OIDCSettings(enabled=False),
+        snapshot=SnapshotSettings(path=snapshot, refresh_interval=0),
+        database_uri=f"sqlite:///{directory}",
+        database_name=name,
+    ))
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            yield client
+
+
+async def run(args: argparse.Namespace) -> t.Dict[str, t.Any]:
+    rng = random.Random(args.seed)
+    mix = {route: weight for route, weight in DEFAULT_MIX.items() if route not in args.exclude}
+    if args.url:
+        client_context = httpx.AsyncClient(base_url=args.url, timeout=None,
+                                           limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        client_context = local_client(args.database, args.snapshot)
+    async with client_context as client:
+        targets = await Targets.discover(client, rng)
+        # Warm up the caches and the lazy imports of each route
+        for route in mix:
+            path, params = targets.request(route, rng)
+            await client.get(path, params=params)
+        recorder = Recorder()
+        lags: t.List[float] = []
+        lag_monitor = asyncio.create_task(monitor_lag(lags))
+        started = time.perf_counter()
+        if args.rps:
+            await open_loop(client, targets, mix, recorder, args.rps, args.duration, rng)
+        else:
+            await closed_loop(client, targets, mix, recorder, args.concurrency, args.duration, rng)
+        duration = time.perf_counter() - started
+        lag_monitor.cancel()
+    lags.sort()
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "target": args.url or args.database,
+        "mode": {"rps": args.rps} if args.rps else {"concurrency": args.concurrency},
+        "duration": duration,
+        "routes": {route: {**summarize(latencies, duration), "statuses": recorder.statuses[route]}
+                   for route, latencies in sorted(recorder.latencies.items())},
+        "total": summarize([latency for latencies in recorder.latencies.values() for latency in latencies],
+                           duration),
+        # The lag only reflects the API when it runs within the event loop of the load test
+        "event_loop_lag": None if args.url else {
+            "p50": 1000 * percentile(lags, 0.5),
+            "p99": 1000 * percentile(lags, 0.99),
+            "max": 1000 * lags[-1] if lags else 0.0,
+        },
+    }
+
+
+def print_results(results: t.Dict[str, t.Any], previous: t.Optional[t.Dict[str, t.Any]] = None) -> None:
+    """Print the results, along with the ratios of their p50 and p99 to previous results."""
+    header = ["route", "requests", "req/s", "p50 (ms)", "p95 (ms)", "p99 (ms)", "statuses"]
+    if previous:
+        header += ["p50 ratio", "p99 ratio"]
+    rows = []
+    for route, summary in [*results["routes"].items(), ("total", results["total"])]:
+        row = [route, summary["requests"], f"{summary['throughput']:.1f}", f"{summary['p50']:.1f}",
+               f"{summary['p95']:.1f}", f"{summary['p99']:.1f}",
+               " ".join(f"{status}:{count}" for status, count in summary.get("statuses", {}).items())]
+        if previous:
+            reference = previous["total"] if route == "total" else previous["routes"].get(route)
+            for key in ("p50", "p99"):
+                row.append(f"{summary[key] / reference[key]:.2f}" if reference and reference[key] else "-")
+        rows.append(row)
+    report(f"load test ({results['duration']:.1f}s)", header, rows)
+    lag = results["event_loop_lag"]
+    if lag:
+        print(f"event loop lag: p50 {lag['p50']:.1f}ms, p99 {lag['p99']:.1f}ms, max {lag['max']:.1f}ms")
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--database", help="Path of the SQLite database of the API started in process.")
+    target.add_argument("--url", help="URL of a running API, with OIDC disabled.")
+    parser.add_argument("--snapshot", help="Path of the snapshot opened by the API started in process.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of concurrent workers.")
+    parser.add_argument("--rps", type=float, help="Target rate of requests, instead of a concurrency.")
+    parser.add_argument("--duration", type=float, default=10, help="Duration of the test, in seconds.")
+    parser.add_argument("--exclude", nargs="*", default=[], choices=list(DEFAULT_MIX),
+                        help="Routes excluded from the mix.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    parser.add_argument("--output", help="Path of the JSON file the results are saved to.")
+    parser.add_argument("--compare", help="Path of previous results to compare with.")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf8") as file:
+            previous = json.load(file)
+    print_results(results, previous)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Replay of the traffic captured by the API against a test instance.
+
+The requests captured with CAPTURE_ENABLED, to a file per worker of the API, are merged and
+re-issued in their original order, at their original pacing, at a scaled pacing, or as fast
+as possible from a number of workers. The latencies of each route are compared with the
+captured ones:
+```
+python -m benchmarks.replay captures/requests.jsonl --database data/QD.sqlite --speed 2
+python -m benchmarks.replay captures/requests.jsonl --url http://localhost:8000 --speed 0 --concurrency 16
+```
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import re
+import time
+import typing as t
+
+import httpx
+
+from . import report
+from .loadtest import Recorder, local_client, quote, send, summarize
+
+ROUTE_PARAMETER = re.compile(r"\{(\w+)(?::\w+)?\}")
+
+Capture = t.Dict[str, t.Any]
+
+
+def rotated_files(path: str) -> t.List[str]:
+    """Return the files of a rotated file, from the oldest rotated file to the current one."""
+    backups = [name for name in glob.glob(f"{glob.escape(path)}.*") if name[len(path) + 1:].isdigit()]
+    backups.sort(key=lambda name: int(name[len(path) + 1:]), reverse=True)
+    return backups + [path]
+
+
+def capture_files(path: str) -> t.List[str]:
+    """Return the files of a capture, i.e. the rotated files written by each worker to the
+    configured path with its pid inserted before the extension, see process_path."""
+    root, extension = os.path.splitext(path)
+    worker_paths = [name for name in glob.glob(f"{glob.escape(root)}.*{glob.escape(extension)}")
+                    if name[len(root) + 1:len(name) - len(extension)].isdigit()]
+    return [name for worker_path in sorted(worker_paths) + [path] for name in rotated_files(worker_path)]
+
+
+def load_capture(path: str) -> t.List[Capture]:
+    """Load the captured requests, ordered by time."""
+    captures = []
+    for name in capture_files(path):
+        try:
+            with open(name, encoding="utf8") as file:
+                captures.extend(json.loads(line) for line in file if line.strip())
+        except FileNotFoundError:
+            continue
+    return sorted(captures, key=lambda capture: capture["timestamp"])
+
+
+def request_path(capture: Capture) -> str:
+    """Rebuild the path of a captured request from its route and path parameters."""
+    return ROUTE_PARAMETER.sub(lambda match: quote(str(capture["path_params"][match.group(1)])),
+                               capture["route"])
+
+
+async def replay(client: httpx.AsyncClient, captures: t.List[Capture], recorder: Recorder,
+                 speed: float, concurrency: int) -> None:
+    """Re-issue the captured requests at their pacing divided by speed, or as fast as possible
+    from concurrent workers when speed is 0."""
+    if speed:
+        tasks = []
+        start = time.perf_counter()
+        origin = captures[0]["timestamp"]
+        for capture in captures:
+            due = start + (capture["timestamp"] - origin) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(
+                client, recorder, capture["route"], request_path(capture), capture["query_params"], due
+            )))
+        await asyncio.gather(*tasks)
+        return
+    queue = iter(captures)
+
+    async def worker():
+        for capture in queue:
+            await send(client, recorder, capture["route"], request_path(capture),
+                       capture["query_params"], time.perf_counter())
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def compare(captures: t.List[Capture], recorder: Recorder, duration: float) -> t.Dict[str, t.Any]:
+    """Compare the captured and replayed latencies of each route."""
+    captured: t.Dict[str, t.List[float]] = {}
+    for capture in captures:
+        captured.setdefault(capture["route"], []).append(capture["latency_ms"] / 1000)
+    span = max(captures[-1]["timestamp"] - captures[0]["timestamp"], 1e-9)
+    return {
+        route: {
+            "captured": summarize(captured[route], span),
+            "replayed": {**summarize(recorder.latencies.get(route, []), duration),
+                         "statuses": recorder.statuses.get(route, {})},
+        }
+        for route in sorted(captured)
+    }
+
+
+async def run(args: argparse.Namespace) -> t.Dict[str, t.Any]:
+    captures = [capture for capture in load_capture(args.capture) if capture["method"] == "GET"]
+    if args.limit:
+        captures = captures[:args.limit]
+    if not captures:
+        raise SystemExit(f"No request captured in {args.capture}")
+    if args.url:
+        client_context = httpx.AsyncClient(base_url=args.url, timeout=None)
+    else:
+        client_context = local_client(args.database, args.snapshot)
+    recorder = Recorder()
+    async with client_context as client:
+        started = time.perf_counter()
+        await replay(client, captures, recorder, args.speed, args.concurrency)
+        duration = time.perf_counter() - started
+    return {
+        "capture": args.capture,
+        "target": args.url or args.database,
+        "speed": args.speed,
+        "duration": duration,
+        "routes": compare(captures, recorder, duration),
+    }
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="Path of the capture file, its rotated files being replayed too.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--database", help="Path of the SQLite database of the API started in process.")
+    target.add_argument("--url", help="URL of a running API, with OIDC disabled.")
+    parser.add_argument("--snapshot", help="Path of the snapshot opened by the API started in process.")
+    parser.add_argument("--speed", type=float, default=1,
+                        help="Pacing of the replay relatively to the capture, 0 replaying as fast as possible.")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Number of concurrent workers when replaying as fast as possible.")
+    parser.add_argument("--limit", type=int, help="Number of requests replayed.")
+    parser.add_argument("--output", help="Path of the JSON file the results are saved to.")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    rows = []
+    for route, summary in results["routes"].items():
+        captured, replayed = summary["captured"], summary["replayed"]
+        rows.append([route, replayed["requests"],
+                     *(f"{captured[key]:.1f} / {replayed[key]:.1f}" for key in ("p50", "p95", "p99")),
+                     f"{replayed['p50'] / captured['p50']:.2f}" if captured["p50"] else "-",
+                     " ".join(f"{status}:{count}" for status, count in replayed["statuses"].items())])
+    report(f"replay ({results['duration']:.1f}s)",
+           ["route", "requests", "p50 (ms)", "p95 (ms)", "p99 (ms)", "p50 ratio", "statuses"], rows)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Benchmark suite of the text processing and collation hot paths, compared to a baseline.
+
+The results of each case are stored in benchmarks/results, and the run fails when a case is
+slower than its baseline by more than the tolerance:
+```
+python -m benchmarks.suite --save-baseline   # record the baseline of the machine
+python -m benchmarks.suite                   # compare with benchmarks/results/baseline.json
+python -m benchmarks.suite -k collation      # only run the matching cases
+```
+The baselines are versioned, keyed by machine, i.e. platform, processor and Python version. On
+a machine without a baseline, e.g. in CI, the results are compared with the baseline of another
+machine relatively to each other: each ratio is divided by the median ratio of all the cases,
+so that a case getting slower than the others is a regression, whatever the speed of the
+machine.
+Each timing run calls a case as many times as needed to last at least 0.2 seconds, so that
+the micro cases are not dominated by the resolution of the timer.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+import typing as t
+
+from . import measure, report
+from . import fixtures
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+BASELINE_PATH = os.path.join(RESULTS_DIRECTORY, "baseline.json")
+DEFAULT_TOLERANCE = 0.3
+COLLATION_WITNESSES = [2, 5, 10, 20, 50]
+
+# Each case builds its fixtures, then returns the function to time
+Case = t.Callable[[], t.Callable[[], t.Any]]
+CASES: t.Dict[str, Case] = {}
+
+
+def case(name: str):
+    """Register a benchmark case."""
+    def register(function: Case) -> Case:
+        CASES[name] = function
+        return function
+    return register
+
+
+@case("unpack_manuscript_data")
+def unpack_manuscript_data():
+    from backend.contexts.manuscripts.db import ManuscriptClient
+    client = ManuscriptClient("mysql://", "QD")
+    records = fixtures.manuscript_records() * 100
+    return lambda: client.unpack_manuscript_data(records)
+
+
+@case("unpack_parallel_data")
+def unpack_parallel_data():
+    from backend.contexts.collations.db import ParallelsClient
+    client = ParallelsClient("mysql://", "QD")
+    records = fixtures.parallel_records(50)
+    return lambda: client.unpack_parallel_data(records, reconstructed=False, strip_vowels=True)
+
+
+@case("check_matched_bracket")
+def check_matched_bracket():
+    from backend.contexts.collations.db import ParallelsClient
+    readings = [record["reading"] for record in fixtures.parallel_records(50)]
+    return lambda: [ParallelsClient.check_matched_bracket(reading) for reading in readings]
+
+
+@case("strip_hebrew_vowels")
+def strip_hebrew_vowels():
+    from backend.contexts.collations.utils import strip_hebrew_vowels
+    text = fixtures.pointed_text(10000)
+    return lambda: strip_hebrew_vowels(text)
+
+
+@case("combine_values")
+def combine_values():
+    from backend.contexts.collations.utils import combine_values
+    variants = {f"W{witness}": [f"reading{witness % 4}"] for witness in range(50)}
+    return lambda: combine_values(variants)
+
+
+@case("analyze_collations")
+def analyze_collations():
+    from backend.contexts.collations.utils import _compare_readings, analyze_collations
+    from .bench_analysis import synthetic_table
+    table = synthetic_table(40)
+
+    def analyze():
+        # Measure the comparison of the readings rather than the memoization
+        _compare_readings.cache_clear()
+        return analyze_collations(table)
+    return analyze
+
+
+@case("retrieve_morphological_analysis")
+def retrieve_morphological_analysis():
+    from backend.contexts.collations.utils import retrieve_morphological_analysis
+    analyses = fixtures.morphological_analyses(1000)
+    return lambda: retrieve_morphological_analysis(analyses)
+
+
+def collation_case(witnesses: int) -> Case:
+    def collation():
+        from collatex import Collation, collate
+        texts = fixtures.witness_texts(witnesses)
+
+        def align():
+            collation = Collation()
+            for sigil, text in texts.items():
+                collation.add_plain_witness(sigil, text)
+            return collate(collation, output="table", segmentation=False, near_match=True)
+        return align
+    return collation
+
+
+for count in COLLATION_WITNESSES:
+    case(f"collation[{count}]")(collation_case(count))
+
+
+@case("json_serialization")
+def json_serialization():
+    from collatex import Collation, collate
+    from backend.api.responses import dumps
+    from backend.contexts.collations.rendering import alignment_matrix
+    from backend.contexts.collations.utils import analyze_collations
+    collation = Collation()
+    for sigil, text in fixtures.witness_texts(10).items():
+        collation.add_plain_witness(sigil, text)
+    table = collate(collation, output="table", segmentation=False, near_match=True)
+    content = {"matrix": alignment_matrix(table), "analysis": analyze_collations(table)}
+    return lambda: dumps(content)
+
+
+def run(names: t.Iterable[str], repeat: int = 5) -> t.Dict[str, float]:
+    """Run the given cases and return the best time of each of them, in seconds."""
+    results = {}
+    for name in names:
+        function = CASES[name]()
+        # Warm up the caches and lazy imports before timing
+        function()
+        number, _ = timeit.Timer(function).autorange()
+        results[name] = measure(function, repeat=repeat, number=number)
+    return results
+
+
+def compare(results: t.Dict[str, float],
+            baseline: t.Dict[str, float],
+            tolerance: float = DEFAULT_TOLERANCE,
+            relative: bool = False) -> t.List[t.List[t.Any]]:
+    """Compare results with a baseline, as rows of name, baseline, result, ratio and status,
+    the status being "regression" when the ratio exceeds 1 + tolerance. When relative, e.g.
+    for the baseline of another machine, the ratios are divided by their median."""
+    scale = 1.0
+    if relative:
+        ratios = [seconds / baseline[name] for name, seconds in results.items() if name in baseline]
+        scale = statistics.median(ratios) if ratios else 1.0
+    rows = []
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            rows.append([name, "-", seconds, "-", "new"])
+            continue
+        ratio = seconds / reference / scale
+        status = "regression" if ratio > 1 + tolerance else "ok"
+        rows.append([name, reference, seconds, f"{ratio:.2f}", status])
+    return rows
+
+
+def machine_key() -> str:
+    """Return the key of the baseline of the machine: its platform, processor and Python
+    version."""
+    processor = platform.processor()
+    try:
+        with open("/proc/cpuinfo", encoding="utf8") as cpuinfo:
+            processor = next((line.split(":", 1)[1].strip() for line in cpuinfo
+                              if line.startswith("model name")), processor)
+    except OSError:
+        pass
+    python = ".".join(platform.python_version_tuple()[:2])
+    return f"{platform.system()} {platform.machine()} {processor or 'unknown'} / Python {python}"
+
+
+def load_baselines(path: str) -> t.Dict[str, t.Dict[str, float]]:
+    """Load the baselines stored at a path, by machine."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf8") as file:
+        return json.load(file)["machines"]
+
+
+def save_baselines(path: str, baselines: t.Dict[str, t.Dict[str, float]]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf8") as file:
+        json.dump({"machines": baselines}, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def save_results(path: str, results: t.Dict[str, float]) -> None:
+    """Store results, along with the description of the machine."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf8") as file:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "results": results,
+        }, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="pattern", default="", help="Only run the cases matching the pattern.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing runs of each case.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative slowdown above which a case is a regression.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Path of the baseline.")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Record the results as the baseline of the machine.")
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if args.pattern in name]
+    results = run(names, repeat=args.repeat)
+    save_results(os.path.join(RESULTS_DIRECTORY, "latest.json"), results)
+    baselines = load_baselines(args.baseline)
+    machine = machine_key()
+    if args.save_baseline:
+        baselines[machine] = {**baselines.get(machine, {}), **results}
+        save_baselines(args.baseline, baselines)
+        report("benchmark suite", ["case", "seconds"], [[name, seconds] for name, seconds in results.items()])
+        return 0
+    if not baselines:
+        print(f"No baseline at {args.baseline}, record one with --save-baseline", file=sys.stderr)
+        return 1
+    relative = machine not in baselines
+    if relative:
+        # The baseline of the machine sharing the most cases
+        reference = max(sorted(baselines), key=lambda key: len(results.keys() & baselines[key].keys()))
+        print(f"No baseline of {machine}, comparing the cases relatively to each other with the "
+              f"baseline of {reference}", file=sys.stderr)
+    else:
+        reference = machine
+    rows = compare(results, baselines[reference], args.tolerance, relative)
+    report("benchmark suite", ["case", "baseline (s)", "current (s)", "ratio", "status"], rows)
+    regressions = [row[0] for row in rows if row[-1] == "regression"]
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""Admission control of the expensive routes of the API.
+
+The routes are grouped into classes, e.g. the collation routes which run heavy queries then
+CollateX. Each class admits a bounded number of concurrent requests, the following ones
+waiting in a bounded queue, so that a few clients cannot saturate the workers and starve the
+cheap routes. The requests which cannot be queued, or wait too long, are answered at once with
+a 503 and a Retry-After header. Each user can also be rate limited by a token bucket, its
+requests exceeding the rate being answered with a 429.
+"""
+import asyncio
+import collections
+import math
+import time
+import typing as t
+
+import fastapi
+from fastapi import FastAPI
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from starlette.status import HTTP_429_TOO_MANY_REQUESTS, HTTP_503_SERVICE_UNAVAILABLE
+
+from backend.tools.metrics import Counter, Gauge
+from .oidc.models import UserClaims
+from .oidc.provider import user
+
+# Class of the routes performing collations
+COLLATION = "collation"
+
+REJECTIONS = Counter("qwb_admission_rejections_total", "Number of requests rejected by the admission control.",
+                     ["route_class", "reason"])
+QUEUED = Gauge("qwb_admission_queued_requests", "Number of requests waiting to be admitted.",
+               ["route_class"])
+
+
+class AdmissionSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="ADMISSION_")
+
+    enabled: bool = False
+    # Number of concurrent requests of each class of routes, e.g. '{"collation": 4}'
+    concurrency: t.Dict[str, int] = {COLLATION: 4}
+    # Number of requests of each class of routes waiting to be admitted
+    queue_size: t.Dict[str, int] = {COLLATION: 16}
+    # Time, in seconds, a request waits to be admitted before being rejected
+    queue_timeout: float = 10
+    # Delay, in seconds, advertised to the rejected clients
+    retry_after: int = 5
+    # Requests per second of each user on the limited routes, 0 disabling the rate limit
+    user_rate: float = 0
+    user_burst: int = 10
+    max_users: int = 10000
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Admit a bounded number of concurrent requests, the following ones waiting in a bounded
+    queue for a bounded time."""
+
+    def __init__(self, concurrency: int, queue_size: int, timeout: float) -> None:
+        """
+        Args:
+            concurrency (int): Number of requests admitted at once.
+            queue_size (int): Number of requests waiting to be admitted.
+            timeout (float): Time, in seconds, a request waits to be admitted.
+        """
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def acquire(self) -> None:
+        """Wait for a slot.
+
+        Raises:
+            AdmissionRejected: If the queue is full, or no slot was freed within the timeout.
+        """
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return
+        if self.waiting >= self.queue_size:
+            raise AdmissionRejected("queue_full", self.timeout)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected("timeout", self.timeout) from None
+        finally:
+            self.waiting -= 1
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+class TokenBuckets:
+    """Rate limit each user by a token bucket, the least recently seen users being forgotten."""
+
+    def __init__(self, rate: float, burst: int, max_users: int = 10000) -> None:
+        """
+        Args:
+            rate (float): Number of tokens added to the buckets each second.
+            burst (int): Capacity of the buckets.
+            max_users (int): Number of buckets kept. Defaults to 10000.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: t.OrderedDict[str, t.Tuple[float, float]] = collections.OrderedDict()
+
+    def take(self, key: str) -> float:
+        """Take a token from the bucket of a user.
+
+        Returns:
+            float: 0 if a token was taken, else the time, in seconds, until a token is available.
+        """
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController:
+    """Admission control of the classes of routes of an application."""
+
+    def __init__(self, settings: AdmissionSettings) -> None:
+        self.retry_after = settings.retry_after
+        self.limiters = {
+            route_class: ConcurrencyLimiter(concurrency, settings.queue_size.get(route_class, 0),
+                                            settings.queue_timeout)
+            for route_class, concurrency in settings.concurrency.items()
+        }
+        self.buckets = (TokenBuckets(settings.user_rate, settings.user_burst, settings.max_users)
+                        if settings.user_rate else None)
+
+    @staticmethod
+    def user_key(request: fastapi.Request, user_: UserClaims) -> str:
+        """Identify a user by the subject of its claims, else by its address."""
+        subject = getattr(user_, "sub", None)
+        if subject:
+            return f"sub:{subject}"
+        return f"client:{request.client.host if request.client else 'unknown'}"
+
+    async def admit(self, route_class: str, key: str) -> t.Optional[ConcurrencyLimiter]:
+        """Admit a request of a class of routes.
+
+        Returns:
+            Optional[ConcurrencyLimiter]: The limiter to release once the request is
+                answered, if the class is limited.
+
+        Raises:
+            AdmissionRejected: If the request cannot be admitted.
+        """
+        if self.buckets:
+            wait = self.buckets.take(key)
+            if wait:
+                raise AdmissionRejected("rate_limited", wait)
+        limiter = self.limiters.get(route_class)
+        if limiter is None:
+            return None
+        QUEUED.inc(route_class=route_class)
+        try:
+            await limiter.acquire()
+        finally:
+            QUEUED.dec(route_class=route_class)
+        return limiter
+
+
+def admission(route_class: str):
+    """Admit the requests of a route within a class of routes.
+
+    Args:
+        route_class (str): The class of the route, e.g. COLLATION.
+
+    Returns:
+        The admission wrapped in a FastAPI Depends, to be given to the dependencies of a route.
+    """
+    async def admit_request(request: fastapi.Request, user_: UserClaims = fastapi.Security(user)):
+        controller: t.Optional[AdmissionController] = getattr(request.app.state, "admission", None)
+        if controller is None:
+            yield
+            return
+        try:
+            limiter = await controller.admit(route_class, controller.user_key(request, user_))
+        except AdmissionRejected as exc:
+            REJECTIONS.inc(route_class=route_class, reason=exc.reason)
+            rate_limited = exc.reason == "rate_limited"
+            raise fastapi.HTTPException(
+                status_code=HTTP_429_TOO_MANY_REQUESTS if rate_limited else HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many requests" if rate_limited else "Server busy",
+                headers={"Retry-After": str(math.ceil(exc.retry_after if rate_limited else controller.retry_after))},
+            ) from exc
+        try:
+            yield
+        finally:
+            # Released once the response is sent, streamed responses holding their slot
+            if limiter is not None:
+                limiter.release()
+    return fastapi.Depends(admit_request)
+
+
+def admission_provider(app: FastAPI) -> None:
+    """Attach the admission control to an application."""
+    app.state.admission = AdmissionController(app.state.settings.admission)
@@ -0,0 +1,81 @@
+"""Opt-in capture of the traffic of the API, to replay real access patterns.
+
+Each request is recorded as a JSON line holding its route, path and query parameters,
+status, latency and response size, without any header nor client address, to a local file
+of each worker, rotated once it reaches a maximum size. Captures are replayed with
+benchmarks.replay.
+"""
+import random
+import time
+import urllib.parse
+
+from fastapi import FastAPI
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from backend.tools.tracing import BackgroundExporter, Exporter, JSONLExporter
+from .metrics import METRICS_PATH
+from .profiling import route_path
+
+
+class CaptureSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="CAPTURE_")
+
+    enabled: bool = False
+    path: str = "captures/requests.jsonl"
+    max_bytes: int = 50 * 2 ** 20
+    backup_count: int = 10
+    # Fraction of the requests captured
+    sample_rate: float = 1.0
+
+
+class CaptureMiddleware:
+    """ASGI middleware recording the requests, once answered, to an exporter."""
+
+    def __init__(self, app, exporter: Exporter, sample_rate: float = 1.0) -> None:
+        self.app = app
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH or (
+            self.sample_rate < 1 and random.random() >= self.sample_rate
+        ):
+            return await self.app(scope, receive, send)
+        status = 500
+        size = 0
+
+        async def send_with_size(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        timestamp = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_size)
+        finally:
+            self.exporter.export([{
+                "timestamp": timestamp,
+                "method": scope["method"],
+                "route": route_path(scope),
+                "path_params": scope.get("path_params", {}),
+                "query_params": urllib.parse.parse_qsl(scope["query_string"].decode("latin-1"),
+                                                       keep_blank_values=True),
+                "status": status,
+                "latency_ms": round(1000 * (time.perf_counter() - started), 3),
+                "size": size,
+            }])
+
+
+def capture_provider(app: FastAPI):
+    """Capture the requests of an application, the exporter being kept in its state so that
+    it is shut down along with the application."""
+    settings = app.state.settings.capture
+    exporter = BackgroundExporter([
+        JSONLExporter(settings.path, settings.max_bytes, settings.backup_count)
+    ])
+    app.state.capture = exporter
+    app.add_middleware(CaptureMiddleware, exporter=exporter, sample_rate=settings.sample_rate)
@@ -0,0 +1,149 @@
+"""Metrics of the API, exposed on /metrics in the Prometheus text format.
+"""
+import asyncio
+import time
+import typing as t
+
+from fastapi import FastAPI, Request, Response
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from starlette.routing import Match
+
+from backend.tools.metrics import REGISTRY, Counter, Gauge, Histogram, MetricsDirectory, Registry
+
+METRICS_PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = Counter("qwb_http_requests_total", "Number of handled requests.",
+                   ["method", "route", "status"])
+REQUEST_DURATION = Histogram("qwb_http_request_duration_seconds", "Duration of the requests.",
+                             ["method", "route"])
+IN_FLIGHT = Gauge("qwb_http_requests_in_flight", "Number of requests being handled.",
+                  ["method", "route"])
+
+
+class MetricsSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="METRICS_")
+
+    enabled: bool = False
+    # Directory shared by the worker processes to aggregate their metrics, required when the
+    # API runs several workers
+    directory: t.Optional[str] = None
+    # Time, in seconds, between two writes of the metrics of a worker to the directory
+    write_interval: float = 5
+
+
+def match_route(scope: t.Mapping[str, t.Any]) -> str:
+    """Return the path template of the route matching a request, else "unmatched", so that
+    the cardinality of the labels stays bounded."""
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware measuring the number, the duration and the concurrency of the requests
+    of each route."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        route = match_route(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc(method=method, route=route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.observe(time.perf_counter() - started, method=method, route=route)
+            REQUESTS.inc(method=method, route=route, status=status)
+            IN_FLIGHT.dec(method=method, route=route)
+
+
+def cache_stats(app: FastAPI) -> t.Dict[str, t.Tuple[int, int]]:
+    """Return the hits and misses of the caches of the API."""
+    from backend.contexts.collations import normalization
+    from backend.contexts.collations.utils import compare_readings_cache_stats
+    stats = {}
+    claims_cache = getattr(getattr(app.state, "oidc", None), "claims_cache", None)
+    if claims_cache is not None:
+        stats["claims"] = (claims_cache.hits, claims_cache.misses)
+    stats["readings"] = compare_readings_cache_stats()
+    stats["normalization"] = normalization.cache_stats()
+    return stats
+
+
+def app_registry(app: FastAPI) -> Registry:
+    """Create the registry of the metrics computed from the state of an application."""
+    registry = Registry()
+    Gauge("qwb_cache_hits", "Number of hits of the caches.", ["cache"], registry=registry,
+          callback=lambda: {(cache,): hits for cache, (hits, _) in cache_stats(app).items()})
+    Gauge("qwb_cache_misses", "Number of misses of the caches.", ["cache"], registry=registry,
+          callback=lambda: {(cache,): misses for cache, (_, misses) in cache_stats(app).items()})
+    Gauge("qwb_cache_hit_ratio", "Ratio of hits of the caches.", ["cache"], registry=registry,
+          callback=lambda: {(cache,): hits / (hits + misses)
+                            for cache, (hits, misses) in cache_stats(app).items() if hits + misses},
+          multiprocess_mode="all")
+    Gauge("qwb_db_pool_connections", "Connections of the database pool.", ["state"],
+          registry=registry,
+          callback=lambda: {(state,): value for state, value in app.state.database.pool_stats().items()})
+    return registry
+
+
+async def write_metrics(directory: MetricsDirectory, interval: float) -> None:
+    """Periodically write the metrics of the worker to the shared directory, and once more
+    when cancelled so that its counters are kept once it exited.
+
+    Args:
+        directory (MetricsDirectory): The directory shared by the workers.
+        interval (float): Time, in seconds, between two writes.
+    """
+    try:
+        while True:
+            directory.write()
+            await asyncio.sleep(interval)
+    finally:
+        directory.write()
+
+
+def start_metrics_writer(app: FastAPI) -> t.Optional["asyncio.Task[None]"]:
+    """Start writing the metrics of the worker to the shared directory, if any."""
+    directory = getattr(app.state, "metrics_directory", None)
+    if directory is None:
+        return None
+    return asyncio.create_task(write_metrics(directory, app.state.settings.metrics.write_interval))
+
+
+def metrics_provider(app: FastAPI) -> None:
+    """Measure the requests of an application and expose its metrics on /metrics, aggregated
+    over the workers when a directory is set."""
+    settings = app.state.settings.metrics
+    app.state.metrics = app_registry(app)
+    app.state.metrics_directory = None
+    if settings.directory:
+        app.state.metrics_directory = MetricsDirectory(settings.directory,
+                                                       [REGISTRY, app.state.metrics])
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get(METRICS_PATH, include_in_schema=False)
+    async def get_metrics(request: Request):
+        """Render the metrics in the Prometheus text format."""
+        directory = request.app.state.metrics_directory
+        if directory is not None:
+            content = await asyncio.to_thread(directory.render)
+        else:
+            content = REGISTRY.render() + request.app.state.metrics.render()
+        return Response(content=content, media_type=CONTENT_TYPE)
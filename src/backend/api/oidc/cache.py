@@ -0,0 +1,78 @@
+"""This module provides a cache of the claims of verified tokens, so that the signature of a
+token is only verified the first time it is received.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .models import UserClaims
+
+
+class ClaimsCache:
+    """Bounded least recently used cache of the claims of verified tokens, keyed by the digest
+    of the tokens. The claims are held until the token expires, minus a skew.
+    """
+
+    def __init__(self, max_size: int = 4096, skew: int = 30) -> None:
+        """Create a new ClaimsCache.
+
+        Args:
+            max_size (int, optional): Maximum number of tokens held. Defaults to 4096.
+            skew (int, optional): Number of seconds before the expiration of a token from which
+                its claims are no longer served from the cache. Defaults to 30.
+        """
+        self.max_size = max_size
+        self.skew = skew
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, Tuple[UserClaims, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        """Return the key of a token in the cache."""
+        return hashlib.sha256(token.encode("utf8")).digest()
+
+    def get(self, token: str) -> Optional[UserClaims]:
+        """Return the claims of a token if they are held and the token has not expired,
+        else None.
+        """
+        key = self.digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        claims, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: UserClaims) -> None:
+        """Hold the claims of a verified token until it expires. Tokens without expiration
+        are never held.
+        """
+        if not self.max_size:
+            return
+        expiration = getattr(claims, "exp", None)
+        if expiration is None:
+            return
+        expires_at = float(expiration) - self.skew
+        if time.time() >= expires_at:
+            return
+        key = self.digest(token)
+        self._entries[key] = (claims, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all the claims held, e.g. when the signing keys change."""
+        self._entries.clear()
@@ -23,3 +23,19 @@ class NotAllowedError(AuthorizationError):
     """
     code = 403
     details = "Not allowed"
+
+
+class UnknownKeyError(InvalidCredentialsError):
+    """Exceptions that will be raised when a token is signed by a key that is not
+    published by the OIDC server.
+    """
+    code = 403
+    details = "Unknown signing key"
+
+
+class OIDCUnavailableError(Exception):
+    """Exceptions that will be raised when the keys of the OIDC server have not been
+    retrieved yet.
+    """
+    code = 503
+    details = "Authentication unavailable"
@@ -2,10 +2,11 @@
 user claims.
 """
 
+import asyncio
+import contextlib
 import json
 import time
-from typing import Any, Dict, List, Optional
-from cryptography.hazmat.backends.openssl.rsa import _RSAPublicKey
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 import fastapi
 import httpx
@@ -21,11 +22,21 @@ from fastapi.openapi.models import (
 from fastapi.openapi.models import OAuthFlows as OAuthFlowsModel
 from fastapi.security.base import SecurityBase
 from fastapi.security.utils import get_authorization_scheme_param
-from starlette.status import HTTP_401_UNAUTHORIZED
+from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_503_SERVICE_UNAVAILABLE
 
-from .errors import AuthorizationError, InvalidCredentialsError
+from backend.tools.tracing import span
+
+from .cache import ClaimsCache
+from .errors import AuthorizationError, InvalidCredentialsError, OIDCUnavailableError, \
+    UnknownKeyError
 from .models import UserClaims, GrantType
 
+if TYPE_CHECKING:
+    from cryptography.hazmat.backends.openssl.rsa import _RSAPublicKey
+
+# Fields of the server metadata read by the client
+REQUIRED_METADATA = ["jwks_uri", "grant_types_supported", "authorization_endpoint", "token_endpoint"]
+
 
 class Singleton(type):
     """The singleton class allows to create a class which will mutate
@@ -42,6 +53,9 @@ class Singleton(type):
 class OIDCAuthClient:
     """The OIDCAuthClient provides authentification mechanisms through
     an OIDC provider.
+
+    The server metadata and keys are retrieved asynchronously once the client is started,
+    then the keys are refreshed periodically in the background.
     """
 
     def __init__(
@@ -52,9 +66,16 @@ class OIDCAuthClient:
         algorithms: Optional[List[str]] = ["RS256"],
         retry: bool = False,
         enabled: bool = True,
-        max_attempts: int = 500
+        max_attempts: int = 500,
+        claims_cache_size: int = 4096,
+        claims_cache_skew: int = 30,
+        retry_delay: float = 5,
+        keys_refresh_interval: float = 3600,
+        keys_refetch_interval: float = 60,
+        http_client: Optional[httpx.AsyncClient] = None
     ) -> None:
-        """Create a new OIDCAuthClient.
+        """Create a new OIDCAuthClient. No request is made to the OIDC server before the
+        client is started.
 
         Args:
             issuer_url (str): The URL that will issue authentification.
@@ -62,9 +83,23 @@ class OIDCAuthClient:
             algorithms (Optional[List[str]], optional): The algorithms used for decoding.
                 Defaults to "RS256".
             retry (bool, optional): Whether or not to retry connection to keycloak when there is
-                a failure. Defaults to False.
+                a failure. If set to True, the connection is made in the background. Else the
+                client fails to start on the first failure. Defaults to False.
             max_attempts (int, optional): Maximum number of attempts to try connecting the OIDC
                 server. Defaults to 500.
+            claims_cache_size (int, optional): Maximum number of verified tokens whose claims
+                are cached. Defaults to 4096.
+            claims_cache_skew (int, optional): Number of seconds before the expiration of a
+                token from which its claims are no longer cached. Defaults to 30.
+            retry_delay (float, optional): Number of seconds between two connection attempts.
+                Defaults to 5.
+            keys_refresh_interval (float, optional): Number of seconds between two refreshes
+                of the keys. Disabled if 0. Defaults to 3600.
+            keys_refetch_interval (float, optional): Minimum number of seconds between two
+                refetches of the keys triggered by tokens signed by an unknown key.
+                Defaults to 60.
+            http_client (Optional[httpx.AsyncClient], optional): The client used to request
+                the OIDC server. Defaults to a client not verifying SSL certificates.
         """
         self.issuer_url = issuer_url
         self.realm = realm
@@ -74,40 +109,111 @@ class OIDCAuthClient:
         self.token_alg = "RS256"
         self.client_id = client_id
         self.enabled = enabled
-        # Create http client to make corresponding requests
+        self.retry = retry
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.keys_refresh_interval = keys_refresh_interval
+        self.keys_refetch_interval = keys_refetch_interval
         # Do not verify SSL certificates because ours are self signed
-        self.http_client = httpx.Client(verify=False)
-        if self.enabled:
-            # If retry is enabled, retry until connected
-            # Wait time is 5 seconds before retrying connexion to the OIDC server
-
-            if retry:
-                connected = False
-                attempts = 1
-                while not connected and attempts < max_attempts:
-                    try:
-                        self.well_known = self.get_server_metadata()
-                        self.public_key = self.get_public_key()
-                        connected = True
-                        logger.info("Successfully retrieved OIDC metadata from "
-                                    f"{self.well_known_uri} after {attempts} attempt")
-                    except ValueError:
-                        time.sleep(5)
-                        logger.info("Failed to retrieve OIDC metadata from "
-                                    f"{self.well_known_uri} after {attempts} attempt")
-                        attempts += 1
-                # Last attempt, if this fails the code breaks
-                if not connected:
-                    self.well_known = self.get_server_metadata()
-                    self.public_key = self.get_public_key()
-            # Else fail on first attempt
-            else:
-                self.well_known = self.get_server_metadata()
-                self.public_key = self.get_public_key()
-                logger.info("Successfully retrieved OIDC metadata from "
-                            f"{self.well_known_uri}")
-
-    def get_server_metadata(self) -> Dict[str, Any]:
+        self.http_client = http_client
+        self._owns_http_client = http_client is None
+        self.well_known: Optional[Dict[str, Any]] = None
+        # Cache the claims of verified tokens, flushed whenever the keys change
+        self.claims_cache = ClaimsCache(max_size=claims_cache_size, skew=claims_cache_skew)
+        # Public keys, by key id
+        self.keys: Dict[Optional[str], "_RSAPublicKey"] = {}
+        self._jwks: Optional[List[Dict[str, Any]]] = None
+        self._last_fetch = float("-inf")
+        self._refetch_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether the keys have been retrieved."""
+        return bool(self.keys)
+
+    @property
+    def public_key(self) -> Optional["_RSAPublicKey"]:
+        """The public key used to decode the tokens, when a single one is used."""
+        return next(iter(self.keys.values()), None)
+
+    @public_key.setter
+    def public_key(self, public_key: "_RSAPublicKey") -> None:
+        self.set_keys({None: public_key})
+
+    def set_keys(self, keys: Dict[Optional[str], "_RSAPublicKey"]) -> None:
+        """Replace the public keys, by key id."""
+        # Claims verified with the previous keys are no longer trusted
+        self.keys = keys
+        self.claims_cache.clear()
+
+    async def start(self) -> None:
+        """Start retrieving the server metadata and the keys, then refreshing the keys in the
+        background.
+
+        If retry is disabled, the first attempt is awaited and its failure is raised. Else all
+        attempts are made in the background, so that the application is ready without
+        waiting for the OIDC server.
+        """
+        if not self.enabled:
+            return
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(verify=False)
+        if not self.retry:
+            await self.discover()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop refreshing the keys and close the HTTP client."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._owns_http_client and self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    async def _run(self) -> None:
+        """Connect to the OIDC server if not connected yet, then refresh the keys
+        periodically."""
+        attempts = 1
+        while not self.ready and attempts <= self.max_attempts:
+            try:
+                await self.discover()
+            except Exception as exc:
+                if isinstance(exc, ValueError):
+                    logger.info(f"Failed to retrieve OIDC metadata from {self.well_known_uri} "
+                                f"after {attempts} attempt: {exc}")
+                else:
+                    # Unexpected errors are retried too, rather than ending the task
+                    logger.exception(f"Failed to retrieve OIDC metadata from {self.well_known_uri} "
+                                     f"after {attempts} attempt")
+                attempts += 1
+                await asyncio.sleep(self.retry_delay)
+        if not self.ready:
+            logger.error(f"Could not retrieve OIDC metadata from {self.well_known_uri} after "
+                         f"{self.max_attempts} attempts")
+        if not self.keys_refresh_interval:
+            return
+        while True:
+            await asyncio.sleep(self.keys_refresh_interval)
+            try:
+                await self.fetch_keys()
+            except ValueError as exc:
+                logger.warning(f"Failed to refresh the OIDC keys: {exc}")
+            except Exception:
+                # Keep refreshing rather than ending the task on an unexpected error
+                logger.exception("Failed to refresh the OIDC keys")
+
+    async def discover(self) -> None:
+        """Retrieve the server metadata and the keys, then update the OAuth model."""
+        self.well_known = await self.get_server_metadata()
+        await self.fetch_keys()
+        APIOIDCAuth.update_model(self)
+        logger.info(f"Successfully retrieved OIDC metadata from {self.well_known_uri}")
+
+    async def get_server_metadata(self) -> Dict[str, Any]:
         """Get the metadata from the well know uri, and return the well_known
         dictionary.
 
@@ -115,34 +221,82 @@ class OIDCAuthClient:
             Dict[str, Any]: The information from the server.
         """
         try:
-            resp = self.http_client.get(self.well_known_uri)
+            resp = await self.http_client.get(self.well_known_uri)
         except httpx.HTTPError as err:
             raise ValueError("Failed to fetch OIDC well known config") from err
         if resp.status_code != 200:
             raise ValueError(
                 f"Could not fetch OIDC server metadata with status code {resp.status_code}")
-        return resp.json()
-
-    def get_public_key(self) -> _RSAPublicKey:
-        """Load the public key that will be used to decode the token.
-
-        Returns:
-            str: The public key
+        well_known = resp.json()
+        if not isinstance(well_known, dict):
+            raise ValueError("OIDC server metadata is not an object")
+        missing = [field for field in REQUIRED_METADATA if field not in well_known]
+        if missing:
+            raise ValueError(f"OIDC server metadata lacks {', '.join(missing)}")
+        return well_known
+
+    async def fetch_keys(self) -> None:
+        """Retrieve the keys of the server that will be used to decode the tokens. The claims
+        cache is flushed when the keys changed.
         """
-        resp = self.http_client.get(self.well_known["jwks_uri"])
-        jwks = resp.json()
-        # Check if the decoding algorithm is supported.
-        for jwk in jwks["keys"]:
-            if jwk["alg"].upper() in self.algorithms:
-                # When found, store it for decoding
-                self.token_alg = jwk["alg"].upper()
-                break
-        else:
-            raise Exception(
+        self._last_fetch = time.monotonic()
+        if self.well_known is None:
+            return await self.discover()
+        try:
+            resp = await self.http_client.get(self.well_known["jwks_uri"])
+        except httpx.HTTPError as err:
+            raise ValueError("Failed to fetch OIDC keys") from err
+        if resp.status_code != 200:
+            raise ValueError(f"Could not fetch OIDC keys with status code {resp.status_code}")
+        keys = resp.json()
+        if not isinstance(keys, dict) or not isinstance(keys.get("keys"), list):
+            raise ValueError("OIDC keys lack a list of keys")
+        # Only keep the keys for supported algorithms
+        jwks = [jwk for jwk in keys["keys"]
+                if isinstance(jwk, dict) and str(jwk.get("alg", "")).upper() in self.algorithms]
+        if not jwks:
+            raise ValueError(
                 "OpenID Connect issuer does not support any of"
                 f"the accepted algorithms: {self.algorithms}")
-        # Load the public key after decoding
-        return jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+        if jwks == self._jwks:
+            return
+        try:
+            keys = {jwk.get("kid"): jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+                    for jwk in jwks}
+        except jwt.PyJWTError as err:
+            raise ValueError(f"Invalid OIDC key: {err}") from err
+        self.token_alg = jwks[0]["alg"].upper()
+        self.set_keys(keys)
+        self._jwks = jwks
+        logger.info(f"Loaded {len(jwks)} OIDC keys")
+
+    async def refetch_keys(self) -> None:
+        """Refetch the keys, at most once every keys_refetch_interval seconds."""
+        async with self._refetch_lock:
+            if time.monotonic() - self._last_fetch < self.keys_refetch_interval:
+                return
+            try:
+                await self.fetch_keys()
+            except ValueError as exc:
+                logger.warning(f"Failed to refetch the OIDC keys: {exc}")
+
+    def get_signing_key(self, token: str) -> "_RSAPublicKey":
+        """Get the public key that signed a token, given its key id.
+
+        Raises:
+            OIDCUnavailableError: The keys have not been retrieved yet.
+            UnknownKeyError: The token is signed by an unknown key.
+        """
+        if not self.keys:
+            raise OIDCUnavailableError("The OIDC keys have not been retrieved yet.")
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except jwt.DecodeError as exc:
+            raise InvalidCredentialsError("Error decoding the token.") from exc
+        key = self.keys.get(kid, self.keys.get(None))
+        if key is None:
+            raise UnknownKeyError(f"Unknown signing key {kid}.")
+        return key
 
     def decode_token(self, token: str) -> Dict[str, Any]:
         """Decode a token access.
@@ -156,13 +310,13 @@ class OIDCAuthClient:
         return dict(
             jwt.decode(
                 token,
-                key=self.public_key,
+                key=self.get_signing_key(token),
                 algorithms=[self.token_alg],
                 options={"verify_aud": False}
             )
         )
 
-    def get_user_claim(self, token: str) -> UserClaims:
+    def verify_token(self, token: str) -> UserClaims:
         """Validate JWT token signature and parse it into a UserClaims model
 
         Args:
@@ -173,14 +327,42 @@ class OIDCAuthClient:
                 of an error when decoding or in the case of an expired signature.
 
         Returns:
-            UserClaims: _description_
+            UserClaims: The claims of the user, served from the cache when the token has
+                already been verified.
         """
+        claims = self.claims_cache.get(token)
+        if claims is not None:
+            return claims
         try:
-            return UserClaims(**self.decode_token(token))
+            claims = UserClaims(**self.decode_token(token))
         except jwt.DecodeError as exc:
             raise InvalidCredentialsError("Error decoding the token.") from exc
         except jwt.ExpiredSignatureError as exc:
             raise InvalidCredentialsError("Token has expired.") from exc
+        self.claims_cache.put(token, claims)
+        return claims
+
+    async def get_user_claim(self, token: str) -> UserClaims:
+        """Validate JWT token signature and parse it into a UserClaims model. The keys are
+        refetched when the token is signed by an unknown key, or when they have not been
+        retrieved yet.
+
+        Args:
+            token (str): The token to be decoded.
+
+        Raises:
+            InvalidCredentialsError: An invalid credential error, either in the case
+                of an error when decoding or in the case of an expired signature.
+            OIDCUnavailableError: The keys could not be retrieved.
+
+        Returns:
+            UserClaims: The claims of the user.
+        """
+        try:
+            return self.verify_token(token)
+        except (UnknownKeyError, OIDCUnavailableError):
+            await self.refetch_keys()
+        return self.verify_token(token)
 
 
 class APIOIDCAuth(SecurityBase, metaclass=Singleton):
@@ -224,19 +406,26 @@ class APIOIDCAuth(SecurityBase, metaclass=Singleton):
         # Get the authorization from the request
         authorization = request.headers.get("Authorization")
         scheme, token = get_authorization_scheme_param(authorization)
-        try:
-            # If there is no authorization data and not in the case of a bearer
-            if not authorization or scheme.lower() != "bearer":
-                # Raise an invalid credentials
-                raise InvalidCredentialsError("No credentials found")
-            # Else get the user claim
-            return oidc.get_user_claim(token)
-        except AuthorizationError as exc:
-            raise fastapi.HTTPException(
-                status_code=HTTP_401_UNAUTHORIZED,
-                detail="Invalid credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            ) from exc
+        with span("auth"):
+            try:
+                # If there is no authorization data and not in the case of a bearer
+                if not authorization or scheme.lower() != "bearer":
+                    # Raise an invalid credentials
+                    raise InvalidCredentialsError("No credentials found")
+                # Else get the user claim
+                return await oidc.get_user_claim(token)
+            except OIDCUnavailableError as exc:
+                raise fastapi.HTTPException(
+                    status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication unavailable",
+                    headers={"Retry-After": str(int(oidc.retry_delay) or 1)},
+                ) from exc
+            except AuthorizationError as exc:
+                raise fastapi.HTTPException(
+                    status_code=HTTP_401_UNAUTHORIZED,
+                    detail="Invalid credentials",
+                    headers={"WWW-Authenticate": "Bearer"},
+                ) from exc
 
     @classmethod
     def update_model(cls, client: OIDCAuthClient) -> None:
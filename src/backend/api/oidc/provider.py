@@ -78,10 +78,14 @@ def oidc_provider(app) -> None:
         client_id=app.state.settings.oidc.client_id,
         retry=app.state.settings.oidc.retry,
         max_attempts=app.state.settings.oidc.max_attempts,
-        enabled=app.state.settings.oidc.enabled
+        enabled=app.state.settings.oidc.enabled,
+        claims_cache_size=app.state.settings.oidc.claims_cache_size,
+        claims_cache_skew=app.state.settings.oidc.claims_cache_skew,
+        retry_delay=app.state.settings.oidc.retry_delay,
+        keys_refresh_interval=app.state.settings.oidc.keys_refresh_interval,
+        keys_refetch_interval=app.state.settings.oidc.keys_refetch_interval
     )
-    # Update the Auth provider with this information
-    if app.state.settings.oidc.enabled:
-        APIOIDCAuth.update_model(oidc)
+    # The server metadata and keys are retrieved when the application starts, then the Auth
+    # provider is updated with this information
     # Attach oidc provider to app
     app.state.oidc = oidc
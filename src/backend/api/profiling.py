@@ -0,0 +1,246 @@
+"""Opt-in profiling of the requests.
+
+A sampling profiler periodically captures the stack of the thread running the event loop
+while a request is handled, along with the stacks of the threads running the work it offloads
+through asyncio.to_thread, e.g. the collations. The samples are stored on local disk as a
+speedscope profile, with a profile for each thread, which can be opened on
+https://www.speedscope.app. Profiles are stored in a directory for each route, named after
+their latency, and listed in an index.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import typing as t
+import uuid
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from loguru import logger
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+# Header requesting the profiling of a request, whose value must be the profiling token
+PROFILE_HEADER = b"x-profile"
+# Header giving the path of the profile of a request, relative to the profiles directory
+PROFILE_ID_HEADER = b"x-profile-id"
+
+Frame = t.Tuple[str, str, int]
+
+
+class ProfilingSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="PROFILING_")
+
+    enabled: bool = False
+    # Secret expected in the X-Profile header of the requests to profile
+    token: t.Optional[str] = None
+    # Fraction of the requests profiled without the header
+    sample_rate: float = 0.0
+    # Time, in seconds, between two samples
+    interval: float = 0.002
+    directory: str = "profiles"
+
+
+def route_path(scope: t.Mapping[str, t.Any]) -> str:
+    """Return the path template of the route which handled a request, else its path."""
+    return getattr(scope.get("route"), "path", scope["path"])
+
+
+class SamplingProfiler:
+    """Sample the stack of a thread at a regular interval, from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = 0.002) -> None:
+        """
+        Args:
+            thread_id (int): The identifier of the thread to sample.
+            interval (float): Time, in seconds, between two samples. Defaults to 0.002.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        # Samples by name of the sampled thread, the first one being the given thread
+        self.samples: t.Dict[str, t.Counter[t.Tuple[Frame, ...]]] = {}
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._threads = {thread_id: next((thread.name for thread in threading.enumerate()
+                                          if thread.ident == thread_id), str(thread_id))}
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def sample_thread(self, fn: t.Callable[..., t.Any], *args: t.Any, **kwargs: t.Any) -> t.Any:
+        """Call a function, sampling the calling thread meanwhile along with the given thread."""
+        thread_id = threading.get_ident()
+        with self._threads_lock:
+            self._threads[thread_id] = threading.current_thread().name
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._threads_lock:
+                self._threads.pop(thread_id, None)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                threads = list(self._threads.items())
+            frames = sys._current_frames()
+            for thread_id, thread_name in threads:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                if stack:
+                    self.samples.setdefault(thread_name, Counter())[tuple(reversed(stack))] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def speedscope(self, name: str) -> t.Dict[str, t.Any]:
+        """Return the samples as speedscope sampled profiles, one for each sampled thread,
+        weighted in milliseconds."""
+        frame_ids: t.Dict[Frame, int] = {}
+        profiles = []
+        for ix, (thread_name, thread_samples) in enumerate(self.samples.items()):
+            samples = []
+            weights = []
+            for stack, count in thread_samples.items():
+                samples.append([frame_ids.setdefault(frame, len(frame_ids)) for frame in stack])
+                weights.append(count * self.interval * 1000)
+            profiles.append({
+                "type": "sampled",
+                "name": name if ix == 0 else f"{name} ({thread_name})",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": self.duration * 1000,
+                "samples": samples,
+                "weights": weights,
+            })
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "qwb-api",
+            "shared": {
+                "frames": [{"name": function, "file": file, "line": line}
+                           for function, file, line in frame_ids],
+            },
+            "profiles": profiles,
+        }
+
+
+# Profiler of the request being handled, copied to the work it offloads to threads
+_profiler: contextvars.ContextVar[t.Optional[SamplingProfiler]] = contextvars.ContextVar(
+    "profiler", default=None
+)
+
+
+class ProfiledExecutor(ThreadPoolExecutor):
+    """Default executor of the event loop, sampling its threads while they run the work of a
+    profiled request, e.g. submitted through asyncio.to_thread."""
+
+    def submit(self, fn: t.Callable[..., t.Any], /, *args: t.Any, **kwargs: t.Any) -> Future:
+        profiler = _profiler.get()
+        if profiler is None:
+            return super().submit(fn, *args, **kwargs)
+        return super().submit(profiler.sample_thread, fn, *args, **kwargs)
+
+
+def write_profile(directory: str, profile: t.Dict[str, t.Any], entry: t.Dict[str, t.Any]) -> None:
+    """Write a profile to the profiles directory and add its entry to the index."""
+    path = os.path.join(directory, entry["profile"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf8") as profile_file:
+        json.dump(profile, profile_file)
+    with open(os.path.join(directory, "index.jsonl"), "a", encoding="utf8") as index_file:
+        index_file.write(json.dumps(entry) + "\n")
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests carrying the profiling token in their X-Profile
+    header, as well as a random sample of all the requests.
+
+    A single request is profiled at a time. As the event loop is shared, the samples may
+    include the frames of concurrent requests. The work the request offloads to the default
+    executor of the event loop, e.g. through asyncio.to_thread, is sampled, while the work
+    offloaded to other threads, such as synchronous endpoints run by Starlette, is not.
+    """
+
+    def __init__(self, app, settings: ProfilingSettings) -> None:
+        self.app = app
+        self.settings = settings
+        self._profiling = False
+        self._loop: t.Optional[asyncio.AbstractEventLoop] = None
+
+    def install_executor(self) -> None:
+        """Set the default executor of the event loop to one sampling the work of the profiled
+        requests, once for each loop, i.e. on the startup of the application."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            loop.set_default_executor(ProfiledExecutor(thread_name_prefix="asyncio"))
+            self._loop = loop
+
+    def requested(self, scope: t.Mapping[str, t.Any]) -> bool:
+        """Whether a request should be profiled."""
+        if self._profiling:
+            return False
+        token = self.settings.token
+        if token and dict(scope["headers"]).get(PROFILE_HEADER) == token.encode():
+            return True
+        return random.random() < self.settings.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        self.install_executor()
+        if scope["type"] != "http" or not self.requested(scope):
+            return await self.app(scope, receive, send)
+        self._profiling = True
+        profile_id = uuid.uuid4().hex[:12]
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []),
+                                      (PROFILE_ID_HEADER, profile_id.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler(threading.get_ident(), self.settings.interval).start()
+        token = _profiler.set(profiler)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _profiler.reset(token)
+            profiler.stop()
+            self._profiling = False
+            route = route_path(scope)
+            latency = profiler.duration * 1000
+            name = f"{scope['method']} {scope['path']}"
+            entry = {
+                "id": profile_id,
+                "route": route,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "latency_ms": round(latency, 3),
+                "time": time.time(),
+                "profile": os.path.join(re.sub(r"[^\w.-]+", "_", route).strip("_") or "root",
+                                        f"{int(latency):08d}ms-{profile_id}.speedscope.json"),
+            }
+            try:
+                await asyncio.to_thread(write_profile, self.settings.directory,
+                                        profiler.speedscope(name), entry)
+            except OSError:
+                logger.exception(f"Failed to write the profile of {name}")
@@ -0,0 +1,67 @@
+"""Tracing of the requests of the API, broken into nested spans exported to a rotating JSONL
+file of each worker, and to an OTLP/HTTP collector when configured.
+"""
+import typing as t
+
+from fastapi import FastAPI
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from backend.tools.tracing import BackgroundExporter, Exporter, JSONLExporter, OTLPExporter, trace
+from .metrics import METRICS_PATH, match_route
+
+
+class TracingSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="TRACING_")
+
+    enabled: bool = False
+    path: str = "traces/spans.jsonl"
+    max_bytes: int = 10 * 2 ** 20
+    backup_count: int = 5
+    otlp_endpoint: t.Optional[str] = None
+    service_name: str = "qwb-api"
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each request, carrying the route, the path
+    parameters and the status of the response."""
+
+    def __init__(self, app, exporter: Exporter) -> None:
+        self.app = app
+        self.exporter = exporter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            return await self.app(scope, receive, send)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+            await send(message)
+
+        with trace(self.exporter, "request", **{
+            "http.method": scope["method"],
+            "http.route": match_route(scope),
+        }) as root:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # The path parameters are only known once the request is routed
+                root.set_attributes(scope.get("path_params", {}))
+
+
+def create_exporter(settings: TracingSettings) -> BackgroundExporter:
+    """Create the exporter of the spans described by the settings."""
+    exporters: t.List[Exporter] = [
+        JSONLExporter(settings.path, settings.max_bytes, settings.backup_count)
+    ]
+    if settings.otlp_endpoint:
+        exporters.append(OTLPExporter(settings.otlp_endpoint, settings.service_name))
+    return BackgroundExporter(exporters)
+
+
+def tracing_provider(app: FastAPI):
+    """Trace the requests of an application, the exporter being kept in its state so that it
+    is shut down along with the application."""
+    exporter = create_exporter(app.state.settings.tracing)
+    app.state.tracing = exporter
+    app.add_middleware(TracingMiddleware, exporter=exporter)
@@ -2,14 +2,16 @@ from fastapi import Request
 from .manuscripts.router import router as manuscript_router
 from .collations.router import router as text_router
 from .morphological_analysis.router import router as morphological_analysis_router
+from .jobs.router import router as jobs_router
 from .manuscripts.db import ManuscriptClient
 from .morphological_analysis.db import MorphologicalAnalysisClient
 from .collations.db import ParallelsClient
+from .snapshot import SnapshotClient
 
-ROUTERS = [manuscript_router, text_router, morphological_analysis_router]
+ROUTERS = [manuscript_router, text_router, morphological_analysis_router, jobs_router]
 
 
-class APISQLClient(ManuscriptClient, MorphologicalAnalysisClient, ParallelsClient):
+class APISQLClient(ManuscriptClient, MorphologicalAnalysisClient, ParallelsClient, SnapshotClient):
     """Create MixIn of all databases.
     """
 
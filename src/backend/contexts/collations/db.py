@@ -1,17 +1,32 @@
 """DB client to fetch textual data from the QWB API.
 """
-import re
-from typing import Optional
+import asyncio
+import time
+from typing import Dict, Optional
+from loguru import logger
+from backend.tools.metrics import SIZE_BUCKETS, Histogram
+from backend.tools.singleflight import singleflight
 from backend.tools.sql_client import SQLClient
-from collatex import Collation, collate
-from collatex.core_classes import create_table_visualization
-from .models import FOLLOWED_BY_MAPPER, FRAGMENTATION_PLACEHOLDER
-from .utils import strip_hebrew_vowels
+from backend.tools.tracing import span
+from .density import DensityTable
+from .index import ParallelIndex
+from .normalization import brackets_balanced, get_pipeline
+from .rendering import html_table
+
+COLLATION_DURATION = Histogram("qwb_collation_duration_seconds", "Duration of the CollateX alignments.")
+COLLATION_WITNESSES = Histogram("qwb_collation_witnesses", "Number of witnesses of the collations.",
+                                buckets=SIZE_BUCKETS)
+COLLATION_COLUMNS = Histogram("qwb_collation_columns", "Number of columns of the alignment tables.",
+                              buckets=SIZE_BUCKETS)
 
 
 class ParallelsClient(SQLClient):
     """Manipulate textual data from the QWB API.
     """
+    # In-memory index of the parallels, used instead of the ordered parallels query once loaded
+    parallel_index: Optional[ParallelIndex] = None
+    # Precomputed density of the parallels of all traditions
+    density_table: Optional[DensityTable] = None
 
     def parallel_query(self,
                        name: str,
@@ -81,8 +96,6 @@ class ParallelsClient(SQLClient):
                         WHERE mv.manuscript = '{name}' AND mv.`column` = '{chapter}' AND mv.line = '{verse}'
                         GROUP BY par_mv.manuscript_id
                     )
-
-                    (
                         SELECT DISTINCT mv.manuscript
                                 , mv.`column`
                                 , mv.line
@@ -100,9 +113,7 @@ class ParallelsClient(SQLClient):
                             LEFT JOIN manuscript_view par_mv ON par_mv.manuscript_sign_cluster_reading_id = parallel_phrase_group_view.anchor_reading_id
                             LEFT JOIN manuscript_sign_cluster ON manuscript_sign_cluster.manuscript_sign_cluster_id = mv.manuscript_sign_cluster_id
                         WHERE par_mv.manuscript = '{name}' AND par_mv.`column` = '{chapter}' AND par_mv.line = '{verse}'
-                    )
                     UNION
-                    (
                         SELECT DISTINCT   mv.manuscript
                                         , mv.`column`
                                         , mv.line
@@ -114,7 +125,6 @@ class ParallelsClient(SQLClient):
                         FROM manuscript_view mv
                         LEFT JOIN manuscript_sign_cluster ON manuscript_sign_cluster.manuscript_sign_cluster_id = mv.manuscript_sign_cluster_id
                         WHERE mv.manuscript = '{name}' AND mv.`column` = '{chapter}' AND mv.line = '{verse}'
-                    )
                     ORDER BY unique_ordered_id
                     ;
                     """
@@ -131,15 +141,13 @@ class ParallelsClient(SQLClient):
                         WHERE mv.manuscript = '{name}' AND mv.`column` = '{chapter}'
                         GROUP BY par_mv.manuscript_id
                     )
-
-                    (
                         SELECT DISTINCT mv.manuscript
                                 , mv.`column`
                                 , mv.line
                                 , mv.reading
                                 , mv.followed_by
                                 , parallel_phrase_group_view.anchor_reading_id
-                                , mv.unique_ordered_id,
+                                , mv.unique_ordered_id
                                 , manuscript_sign_cluster.is_fully_reconstructed
                         FROM parallels
                             JOIN manuscript_view mv
@@ -150,9 +158,7 @@ class ParallelsClient(SQLClient):
                             LEFT JOIN manuscript_view par_mv ON par_mv.manuscript_sign_cluster_reading_id = parallel_phrase_group_view.anchor_reading_id
                             LEFT JOIN manuscript_sign_cluster ON manuscript_sign_cluster.manuscript_sign_cluster_id = mv.manuscript_sign_cluster_id
                         WHERE par_mv.manuscript = '{name}' AND par_mv.`column` = '{chapter}'
-                    )
                     UNION
-                    (
                         SELECT DISTINCT   mv.manuscript
                                         , mv.`column`
                                         , mv.line
@@ -164,7 +170,6 @@ class ParallelsClient(SQLClient):
                         FROM manuscript_view mv
                         LEFT JOIN manuscript_sign_cluster ON manuscript_sign_cluster.manuscript_sign_cluster_id = mv.manuscript_sign_cluster_id
                         WHERE mv.manuscript = '{name}' AND mv.`column` = '{chapter}'
-                    )
                     ORDER BY unique_ordered_id
                     ;
                     """)
@@ -180,8 +185,6 @@ class ParallelsClient(SQLClient):
                         WHERE mv.manuscript = '{name}'
                         GROUP BY par_mv.manuscript_id
                     )
-
-                    (
                         SELECT DISTINCT mv.manuscript
                                 , mv.`column`
                                 , mv.line
@@ -199,9 +202,7 @@ class ParallelsClient(SQLClient):
                             LEFT JOIN manuscript_view par_mv ON par_mv.manuscript_sign_cluster_reading_id = parallel_phrase_group_view.anchor_reading_id
                             LEFT JOIN manuscript_sign_cluster ON manuscript_sign_cluster.manuscript_sign_cluster_id = mv.manuscript_sign_cluster_id
                         WHERE par_mv.manuscript = '{name}'
-                    )
                     UNION
-                    (
                         SELECT DISTINCT   mv.manuscript
                                         , mv.`column`
                                         , mv.line
@@ -212,9 +213,42 @@ class ParallelsClient(SQLClient):
                                         , manuscript_sign_cluster.is_fully_reconstructed
                         FROM manuscript_view mv
                         LEFT JOIN manuscript_sign_cluster ON manuscript_sign_cluster.manuscript_sign_cluster_id = mv.manuscript_sign_cluster_id                        WHERE mv.manuscript = '{name}'
-                    )
                     ORDER BY unique_ordered_id;""")
 
+    def index_readings_query(self):
+        """Build the query to retrieve all the readings indexed by the parallel index.
+        """
+        return self.format_query("""
+                    SELECT    mv.manuscript_sign_cluster_reading_id
+                            , mv.manuscript
+                            , mv.`column`
+                            , mv.line
+                            , mv.reading
+                            , mv.followed_by
+                            , mv.unique_ordered_id
+                            , mv.language_id
+                            , mv.position_in_reference
+                            , manuscript_sign_cluster.is_fully_reconstructed
+                    FROM manuscript_view mv
+                    LEFT JOIN manuscript_sign_cluster ON manuscript_sign_cluster.manuscript_sign_cluster_id = mv.manuscript_sign_cluster_id;
+                    """)
+
+    def index_groups_query(self):
+        """Build the query to retrieve all the parallel phrase groups indexed by the parallel index.
+        """
+        return self.format_query("""
+                    SELECT anchor_reading_id, manuscript_sign_cluster_reading_id, parallel_phrase_id
+                    FROM parallel_phrase_group_view;
+                    """)
+
+    def index_words_query(self):
+        """Build the query to retrieve all the words of the parallel phrases indexed by the parallel index.
+        """
+        return self.format_query("""
+                    SELECT parallel_phrase_id, manuscript_sign_cluster_reading_id
+                    FROM parallel_word_of_phrase;
+                    """)
+
     def mt_query(self,
                  name: str,
                  chapter: Optional[str] = None,
@@ -224,7 +258,7 @@ class ParallelsClient(SQLClient):
         if chapter:
             if verse:
                 return self.format_query(f"""
-                                    SELECT DISTINCT ms_A.reading, ms_A.followed_by, CONCAT("TM_", ms_A.manuscript) as manuscript
+                                    SELECT DISTINCT ms_A.reading, ms_A.followed_by, {self.concat("'TM_'", 'ms_A.manuscript')} as manuscript
                                     from manuscript_view as ms_A
                                     left join parallel_phrase_group_view on anchor_reading_id = ms_A.manuscript_sign_cluster_reading_id
                                     left join parallel_word_of_phrase using(parallel_phrase_id)
@@ -238,7 +272,7 @@ class ParallelsClient(SQLClient):
                                     and  ms_B.position_in_reference=0;
                                     """)
             return self.format_query(f"""
-                                    SELECT DISTINCT ms_A.reading, ms_A.followed_by, CONCAT("TM_", ms_A.manuscript) as manuscript
+                                    SELECT DISTINCT ms_A.reading, ms_A.followed_by, {self.concat("'TM_'", 'ms_A.manuscript')} as manuscript
                                     from manuscript_view as ms_A
                                     left join parallel_phrase_group_view on anchor_reading_id = ms_A.manuscript_sign_cluster_reading_id
                                     left join parallel_word_of_phrase using(parallel_phrase_id)
@@ -251,7 +285,7 @@ class ParallelsClient(SQLClient):
                                     and  ms_B.position_in_reference=0;
                                      """)
         return self.format_query(f"""
-                        SELECT DISTINCT ms_A.reading, ms_A.followed_by, CONCAT("TM_", ms_A.manuscript) as manuscript
+                        SELECT DISTINCT ms_A.reading, ms_A.followed_by, {self.concat("'TM_'", 'ms_A.manuscript')} as manuscript
                         from manuscript_view as ms_A
                         left join parallel_phrase_group_view on anchor_reading_id = ms_A.manuscript_sign_cluster_reading_id
                         left join parallel_word_of_phrase using(parallel_phrase_id)
@@ -294,57 +328,65 @@ class ParallelsClient(SQLClient):
                     and  ms_B.position_in_reference=0
                     GROUP BY ms_A.`column`;""")
         
+    def density_query(self):
+        """SQL query to count the number of parallels of every verse of every tradition, in a single
+        grouped pass.
+        """
+        return self.format_query("""
+            SELECT ms_A.manuscript as tradition, ms_A.`column` as chapter, ms_A.`line` as verse,
+                   COUNT(DISTINCT ms_B.manuscript) as count_manuscript
+                    from manuscript_view as ms_A
+                    join parallel_phrase_group_view on anchor_reading_id = ms_A.manuscript_sign_cluster_reading_id
+                    join parallel_word_of_phrase using(parallel_phrase_id)
+                    join manuscript_view as ms_B on ms_B.manuscript_sign_cluster_reading_id=parallel_word_of_phrase.manuscript_sign_cluster_reading_id
+                    where ms_A.language_id=1
+                    and  ms_A.position_in_reference=0
+                    and  ms_B.language_id=1
+                    and  ms_B.position_in_reference=0
+                    GROUP BY ms_A.manuscript, ms_A.`column`, ms_A.`line`;""")
+
     @staticmethod
     def check_matched_bracket(word: str) -> bool:
         """Check if all opened bracket have been closed."""
-        s = []
-        balanced = True
-        index = 0
-        while index < len(word) and balanced:
-            token = word[index]
-            if token == "[":
-                s.append(token)
-            elif token == "]":
-                if len(s) == 0:
-                    balanced = False
-                else:
-                    s.pop()
-            index += 1
-
-        return balanced and len(s) == 0
+        return brackets_balanced(word)
 
-    def unpack_parallel_data(self, records, reconstructed=False):
+    def unpack_parallel_data(self, records, reconstructed=False, strip_vowels=False):
         """Unpack the manuscript data into a single string.
         If reconstructed is set to False, then remove all fully reconstructed readings
         as well as readings with either [ or ] and replace them with the fragment placeholder.
+        If strip_vowels is set to True, then vowels and cantillation marks are stripped.
+        """
+        return get_pipeline(reconstructed, strip_vowels).unpack(records)
+
+    async def load_parallel_index(self):
+        """Build the in-memory index of the parallels from the database, and swap it with the
+        current one once built.
+        """
+        readings = await self.fetch_all(self.index_readings_query(), "index_readings")
+        groups = await self.fetch_all(self.index_groups_query(), "index_groups")
+        words = await self.fetch_all(self.index_words_query(), "index_words")
+        self.parallel_index = await asyncio.to_thread(
+            ParallelIndex.build,
+            [dict(reading) for reading in readings],
+            [dict(group) for group in groups],
+            [dict(word) for word in words],
+        )
+        logger.info(f"Loaded parallel index of {len(readings)} readings "
+                    f"and {len(groups)} parallel phrase group members")
+        await self.refresh_parallels_density()
+
+    async def refresh_parallel_index(self, interval: float):
+        """Periodically rebuild the in-memory index of the parallels.
+
+        Args:
+            interval (float): Time, in seconds, between two refreshes.
         """
-        parallels = {}
-        for record in records:
-            if not reconstructed:
-                if record["is_fully_reconstructed"]: #or "[" in record["reading"] or "]" in record["reading"]:
-                    reading = FRAGMENTATION_PLACEHOLDER
-                elif "[" in record["reading"] or "]" in record["reading"]:
-                    bracket_word = record["reading"]
-                    nbr_closed_brackets = bracket_word.count("]")
-                    nbr_opened_brackets = bracket_word.count("[")
-                    if nbr_closed_brackets < nbr_opened_brackets:  # if there is a missing closing
-                        bracket_word = f"{bracket_word}]"
-                    elif nbr_closed_brackets > nbr_opened_brackets:
-                        bracket_word = f"[{bracket_word}"
-                    elif not self.check_matched_bracket(record['reading']):
-                        bracket_word = f"[{record['reading']}]"  # add brackets if they are missing
-                    reading = re.sub(r'\[.*?\]', f'{FRAGMENTATION_PLACEHOLDER}', bracket_word)
-                else:
-                    reading = record["reading"]
-            else:
-                reading = record["reading"]
+        while True:
+            await asyncio.sleep(interval)
             try:
-                parallels[record["manuscript"]] += reading +\
-                    FOLLOWED_BY_MAPPER[record["followed_by"]]
-            except KeyError:
-                parallels[record["manuscript"]] = reading +\
-                    FOLLOWED_BY_MAPPER[record["followed_by"]]
-        return {man: context.strip() for man, context in parallels.items()}
+                await self.load_parallel_index()
+            except Exception:
+                logger.exception("Failed to refresh the parallel index")
 
     async def get_parallels(self,
                             name: str,
@@ -352,23 +394,34 @@ class ParallelsClient(SQLClient):
                             verse: Optional[str] = None):
         """Get all the parallels as a dictionary of manuscript name and text.
         """
-        records = await self.database.fetch_all(query=self.parallel_query(name, chapter, verse))
+        if self.parallel_index is not None:
+            return self.parallel_index.parallel_locations(name, chapter, verse)
+        records = await self.fetch_all(self.parallel_query(name, chapter, verse), "parallels")
         dict_records = list([dict(record) for record in records])
         filtered_dict_records = [{k: record[k] for k in ["manuscript", "column", "line"]} for record in dict_records]
         return [dict(t) for t in {tuple(d.items()) for d in filtered_dict_records}]
 
+    @singleflight
     async def get_parallels_content(self,
                                     name: str,
                                     reconstructed: bool,
                                     chapter: Optional[str] = None,
-                                    verse: Optional[str] = None):
+                                    verse: Optional[str] = None,
+                                    strip_vowels: bool = False):
         """Get all the parallels as a list of text for a tradition, a chapter and a verse.
         If reconstructed is set to False, then reconstructed data is omitted from the parallel
         and replaced by the FRAG placeholder.
+        If strip_vowels is set to True, then vowels are stripped from the parallels.
         """
-        records = await self.database.fetch_all(query=self.parallel_query_ordered(name, chapter, verse))
-        results = [dict(record) for record in records]
-        parallels = self.unpack_parallel_data(results, reconstructed)
+        if self.parallel_index is not None:
+            results = self.parallel_index.resolve(name, chapter, verse)
+        else:
+            results = await self.fetch_dicts(self.parallel_query_ordered(name, chapter, verse),
+                                             "parallels_ordered")
+        with span("unpack_parallel_data", tradition=name, chapter=chapter, verse=verse,
+                  rows=len(results)) as current:
+            parallels = self.unpack_parallel_data(results, reconstructed, strip_vowels)
+            current.set_attribute("witnesses", len(parallels))
         return parallels
 
     async def get_parallels_count(self,
@@ -377,10 +430,40 @@ class ParallelsClient(SQLClient):
         """Count the number of parallels for a given tradition and either a given chapter or a given verse 
         within this chapter.
         """
+        if self.parallel_index is not None:
+            return self.parallel_index.parallels_count(name, chapter)
         query = self.count_parallels_query(name, chapter)
-        records = await self.database.fetch_all(query=query)
-        return [dict(record) for record in records]
+        return await self.fetch_dicts(query, "parallels_count")
+
+    async def refresh_parallels_density(self):
+        """Refresh the density of the parallels of all traditions, from the parallel index when
+        loaded, else from the database.
+        """
+        if self.density_table is None:
+            self.density_table = DensityTable()
+        if self.parallel_index is not None:
+            counts = list(self.parallel_index.density())
+        else:
+            records = await self.fetch_all(self.density_query(), "parallels_density")
+            counts = [(record["tradition"], record["chapter"], record["verse"], record["count_manuscript"])
+                      for record in records]
+        changed = self.density_table.update(counts)
+        if changed:
+            logger.info(f"Refreshed parallels density of {len(changed)} traditions")
+
+    async def get_parallels_density(self, max_age: Optional[float] = None) -> DensityTable:
+        """Get the density of the parallels of all traditions. When the parallel index is not loaded,
+        the density is computed on first access, then refreshed once older than max_age seconds.
+        """
+        table = self.density_table
+        if table is None or table.empty or (
+            self.parallel_index is None and max_age is not None
+            and time.monotonic() - table.updated_at > max_age
+        ):
+            await self.refresh_parallels_density()
+        return self.density_table
 
+    @singleflight
     async def get_collation(self,
                             name: str,
                             chapter: str,
@@ -389,16 +472,72 @@ class ParallelsClient(SQLClient):
                             strip_vowels: bool):
         """Get the collation of the parallels of a tradition for a chapter and a verse.
         """
-        collation = Collation()
         records = await self.get_parallels_content(name=name, 
                                                    chapter=chapter, 
                                                    verse=verse,
-                                                   reconstructed=reconstructed)
+                                                   reconstructed=reconstructed,
+                                                   strip_vowels=strip_vowels)
+        # Collated in a thread so that the event loop keeps serving the other requests
+        return await asyncio.to_thread(self.collate_parallels, name, chapter, verse, records)
+
+    @staticmethod
+    def collate_parallels(name: str,
+                          chapter: Optional[str],
+                          verse: Optional[str],
+                          records: Dict[str, str]):
+        """Collate the texts of the parallels of a tradition, given by manuscript name.
+        """
+        # The collation stack is slow to import, hence only imported when first used
+        from collatex import Collation, collate
+        collation = Collation()
         for manuscript_name, content in records.items():
-            if strip_vowels:
-                content = strip_hebrew_vowels(content)
             collation.add_plain_witness(manuscript_name, content)
-        return collate(collation, output="table", segmentation=False, near_match=True)
+        with span("collation", tradition=name, chapter=chapter, verse=verse,
+                  witnesses=len(records)) as current:
+            started = time.perf_counter()
+            table = collate(collation, output="table", segmentation=False, near_match=True)
+            COLLATION_DURATION.observe(time.perf_counter() - started)
+            current.set_attribute("columns", len(table.columns))
+        COLLATION_WITNESSES.observe(len(records))
+        COLLATION_COLUMNS.observe(len(table.columns))
+        return table
+
+    async def get_parallels_distances(self,
+                                      name: str,
+                                      chapter: str,
+                                      verse: str,
+                                      reconstructed: bool,
+                                      strip_vowels: bool):
+        """Get the edit distances between the parallels of a tradition for a chapter and a verse,
+        along with the order of the parallels given by their clustering.
+        """
+        from .distances import witness_distances
+        records = await self.get_parallels_content(name=name,
+                                                   chapter=chapter,
+                                                   verse=verse,
+                                                   reconstructed=reconstructed,
+                                                   strip_vowels=strip_vowels)
+        with span("distances", tradition=name, chapter=chapter, verse=verse, witnesses=len(records)):
+            return await asyncio.to_thread(witness_distances, records)
+
+    @staticmethod
+    def warm_up_collations():
+        """Import the collation stack and collate a single verse, so that the first collation
+        request does not pay for it.
+        """
+        from collatex import Collation, collate
+        from .distances import witness_distances
+        collation = Collation()
+        collation.add_plain_witness("A", "a b")
+        collation.add_plain_witness("B", "a c")
+        collate(collation, output="table", segmentation=False, near_match=True)
+        witness_distances({"A": "a b", "B": "a c"})
+
+    async def warm_up(self):
+        """Warm up the collation stack in a thread."""
+        started = time.monotonic()
+        await asyncio.to_thread(self.warm_up_collations)
+        logger.info(f"Warmed up the collation stack in {time.monotonic() - started:.2f}s")
 
     async def get_html_collation(self,
                                  name: str,
@@ -409,4 +548,4 @@ class ParallelsClient(SQLClient):
         """Get the collation of the parallels of a tradition for a chapter and a verse as an XML.
         """
         collation = await self.get_collation(name, chapter, verse, reconstructed, strip_vowels)
-        return create_table_visualization(collation).get_html_string(formatting=True)
+        return await asyncio.to_thread(html_table, collation)
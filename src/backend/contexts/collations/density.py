@@ -0,0 +1,61 @@
+"""Density of the parallels of every verse of every tradition.
+"""
+import gzip
+import hashlib
+import json
+import time
+import typing as t
+
+# Number of parallel manuscripts of a verse, given as tradition, chapter, verse and count
+VerseCount = t.Tuple[str, str, str, int]
+
+
+class DensityTable:
+    """Precomputed number of parallel manuscripts of every verse of every tradition, encoded once
+    as a compact JSON payload, along with its gzipped version.
+
+    The table is refreshed incrementally: only the traditions whose counts changed are encoded
+    again.
+    """
+
+    def __init__(self) -> None:
+        self.densities: t.Dict[str, t.Dict[str, t.Dict[str, int]]] = {}
+        self.fragments: t.Dict[str, bytes] = {}
+        self.payload = b"{}"
+        self.gzipped = gzip.compress(self.payload)
+        self.etag = 'W/"empty"'
+        self.updated_at: t.Optional[float] = None
+
+    @property
+    def empty(self) -> bool:
+        """Whether the table has never been computed."""
+        return self.updated_at is None
+
+    def update(self, counts: t.Iterable[VerseCount]) -> t.List[str]:
+        """Update the table with the counts of all the verses of all the traditions.
+
+        Args:
+            counts (Iterable[VerseCount]): The number of parallel manuscripts of each verse.
+
+        Returns:
+            List[str]: The traditions whose counts changed.
+        """
+        densities: t.Dict[str, t.Dict[str, t.Dict[str, int]]] = {}
+        for tradition, chapter, verse, count in counts:
+            densities.setdefault(tradition, {}).setdefault(chapter, {})[verse] = count
+        changed = [tradition for tradition, density in densities.items()
+                   if self.densities.get(tradition) != density]
+        removed = [tradition for tradition in self.densities if tradition not in densities]
+        for tradition in changed:
+            self.fragments[tradition] = json.dumps(
+                {tradition: densities[tradition]}, ensure_ascii=False, separators=(",", ":")
+            ).encode("utf8")[1:-1]
+        for tradition in removed:
+            del self.fragments[tradition]
+        self.densities = densities
+        if changed or removed or self.empty:
+            self.payload = b"{" + b",".join(self.fragments[tradition] for tradition in densities) + b"}"
+            self.gzipped = gzip.compress(self.payload)
+            self.etag = f'W/"{hashlib.sha1(self.payload).hexdigest()}"'
+        self.updated_at = time.monotonic()
+        return changed + removed
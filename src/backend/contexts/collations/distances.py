@@ -0,0 +1,66 @@
+"""Distances between the witnesses of a parallel.
+"""
+import typing as t
+
+import numpy as np
+from rapidfuzz.distance import Levenshtein
+from rapidfuzz.process import cdist
+
+
+def tokenize_witnesses(texts: t.List[str]) -> t.List[t.List[int]]:
+    """Split each witness into words and map every distinct word to an integer.
+    """
+    vocabulary: t.Dict[str, int] = {}
+    return [[vocabulary.setdefault(word, len(vocabulary)) for word in text.split()]
+            for text in texts]
+
+
+def distance_matrix(texts: t.List[str]) -> np.ndarray:
+    """Compute the witness x witness edit distance matrix, counted in words.
+
+    The distances of all pairs are computed in a single batched call over the interned
+    word sequences.
+    """
+    sequences = tokenize_witnesses(texts)
+    return cdist(sequences, sequences, scorer=Levenshtein.distance, dtype=np.int32, workers=-1)
+
+
+def cluster_order(matrix: np.ndarray) -> t.List[int]:
+    """Order the witnesses by average linkage hierarchical clustering of a distance matrix,
+    so that close witnesses are next to each other.
+    """
+    size = len(matrix)
+    if size <= 2:
+        return list(range(size))
+    distances = matrix.astype(np.float64)
+    np.fill_diagonal(distances, np.inf)
+    weights = np.ones(size)
+    leaves = [[ix] for ix in range(size)]
+    for _ in range(size - 1):
+        first, second = sorted(divmod(int(np.argmin(distances)), size))
+        # Merge the second cluster within the first one
+        merged = (distances[first] * weights[first] + distances[second] * weights[second]) \
+            / (weights[first] + weights[second])
+        distances[first, :] = merged
+        distances[:, first] = merged
+        distances[first, first] = np.inf
+        distances[second, :] = np.inf
+        distances[:, second] = np.inf
+        weights[first] += weights[second]
+        leaves[first] += leaves[second]
+        leaves[second] = []
+        last = first
+    return leaves[last]
+
+
+def witness_distances(parallels: t.Dict[str, str]) -> t.Dict[str, t.Any]:
+    """Given the text of each witness, return the distance matrix as well as the order of
+    the witnesses given by their clustering.
+    """
+    witnesses = list(parallels)
+    matrix = distance_matrix([parallels[witness] for witness in witnesses])
+    return {
+        "witnesses": witnesses,
+        "distances": matrix.tolist(),
+        "order": [witnesses[ix] for ix in cluster_order(matrix)],
+    }
@@ -0,0 +1,417 @@
+"""In-memory index of the parallels.
+
+The index resolves the parallels of a tradition, a chapter and a verse without the range join
+of the ordered parallels query: for each anchor reading, the span of unique ordered ids covered
+by its parallel readings is precomputed for every witness manuscript, and the readings are kept
+sorted by unique ordered id so that each span is resolved by bisection.
+
+It also holds the graph of the parallel phrases, from the anchor readings to their parallel
+readings and to the manuscripts, columns and lines of those, from which the locations of the
+parallels and their counts are precomputed for every tradition, chapter and verse.
+
+All the data is held in flat arrays, strings being referenced by their index in a table of
+interned strings. The mappings keyed by tradition, chapter and verse are flattened into arrays
+of keys sorted by the string of their location, of offsets and of values, and are looked up by
+bisection, so that they are shared as is through the snapshots.
+"""
+import typing as t
+from array import array
+from bisect import bisect_left, bisect_right
+
+from backend.tools.snapshot import NULL, Interner, KeyStrings
+
+# Arrays holding the string fields of the readings
+ROW_FIELDS = {
+    "manuscript": "manuscripts",
+    "column": "columns",
+    "line": "lines",
+    "reading": "readings",
+    "followed_by": "followed_by",
+}
+
+Location = t.Tuple[t.Optional[str], ...]
+# Separator of the parts of the string of a location, and string of NULL parts
+LOCATION_SEPARATOR = "\x1f"
+LOCATION_NULL = "\x00"
+
+
+def _csr(keys: t.Dict[int, t.List[int]], typecode: str = "Q"):
+    """Flatten a mapping of integer keys to lists into a sorted array of keys, an array of
+    offsets and an array of values.
+    """
+    sorted_keys = array("Q", sorted(keys))
+    offsets = array("Q", [0])
+    values = array(typecode)
+    for key in sorted_keys:
+        values.extend(keys[key])
+        offsets.append(len(values))
+    return sorted_keys, offsets, values
+
+
+def _location_string(location: Location) -> str:
+    """Return the string keying a location within the flattened mappings."""
+    return LOCATION_SEPARATOR.join(LOCATION_NULL if part is None else part for part in location)
+
+
+def _string_location(string: str) -> Location:
+    """Return the location keyed by a string, see _location_string."""
+    return tuple(None if part == LOCATION_NULL else part
+                 for part in string.split(LOCATION_SEPARATOR))
+
+
+def _location_csr(locations: t.Dict[Location, t.Sequence[int]], intern: Interner, typecode: str = "Q"):
+    """Flatten a mapping of locations to lists into an array of the interned strings of the
+    locations sorted by string, an array of offsets and an array of values.
+    """
+    keys = sorted((_location_string(location), values) for location, values in locations.items())
+    location_keys = array("L", (intern(key) for key, _ in keys))
+    offsets = array("Q", [0])
+    values = array(typecode)
+    for _, location_values in keys:
+        values.extend(location_values)
+        offsets.append(len(values))
+    return location_keys, offsets, values
+
+
+def _reading_arrays(readings: t.Iterable[t.Mapping[str, t.Any]],
+                    intern: Interner) -> t.Dict[str, t.Sequence[int]]:
+    """Sort the readings by unique ordered id into flat arrays, their strings being interned
+    into the given table of strings."""
+    rows = sorted(
+        ((reading["unique_ordered_id"] or 0,
+          reading["manuscript_sign_cluster_reading_id"],
+          *(intern(reading[field]) for field in ROW_FIELDS),
+          1 if reading["is_fully_reconstructed"] else 0,
+          1 if reading["language_id"] == 1 and reading["position_in_reference"] == 0 else 0)
+         for reading in readings),
+        key=lambda row: row[0],
+    )
+    reading_ids = array("Q", (row[1] for row in rows))
+    reading_order = array("Q", sorted(range(len(rows)), key=reading_ids.__getitem__))
+    return {
+        "ordered_ids": array("Q", (row[0] for row in rows)),
+        "reading_ids": reading_ids,
+        **{name: array("L", (row[2 + ix] for row in rows)) for ix, name in enumerate(ROW_FIELDS.values())},
+        "reconstructed": array("B", (row[-2] for row in rows)),
+        # Whether the reading is counted as a parallel, i.e. in the main language and reference
+        "counted": array("B", (row[-1] for row in rows)),
+        "reading_order": reading_order,
+        "sorted_reading_ids": array("Q", (reading_ids[position] for position in reading_order)),
+    }
+
+
+class ParallelIndex:
+    """Index of the readings of the manuscripts and of their parallel phrase groups.
+    """
+
+    def __init__(self, strings: t.Sequence[str], arrays: t.Dict[str, t.Sequence[int]]) -> None:
+        """
+        Args:
+            strings (Sequence[str]): The table of interned strings.
+            arrays (Dict[str, Sequence[int]]): The flat arrays of the index, see build. For
+                each manuscript, chapter and verse, the location_* arrays map to the positions
+                of their readings, the parallel_* arrays to the manuscripts, columns and lines
+                of their parallels, and the count_* arrays, for each manuscript and each
+                chapter, to the pairs of chapter or verse and number of parallel manuscripts.
+        """
+        self.strings = strings
+        self.arrays = arrays
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+    @classmethod
+    def build(cls,
+              readings: t.Iterable[t.Mapping[str, t.Any]],
+              groups: t.Iterable[t.Mapping[str, t.Any]],
+              words: t.Iterable[t.Mapping[str, t.Any]] = ()) -> "ParallelIndex":
+        """Build the index.
+
+        Args:
+            readings (Iterable[Mapping]): The readings of manuscript_view, with their
+                manuscript_sign_cluster_reading_id, manuscript, column, line, reading,
+                followed_by, unique_ordered_id, language_id, position_in_reference and
+                is_fully_reconstructed.
+            groups (Iterable[Mapping]): The rows of parallel_phrase_group_view, with their
+                anchor_reading_id, manuscript_sign_cluster_reading_id and parallel_phrase_id.
+            words (Iterable[Mapping]): The rows of parallel_word_of_phrase, with their
+                parallel_phrase_id and manuscript_sign_cluster_reading_id.
+        """
+        intern = Interner()
+        index = cls(intern.strings, _reading_arrays(readings, intern))
+        index._build_locations(intern)
+        phrases, phrase_words = index._build_groups(groups, words)
+        index._build_spans()
+        index._build_parallels(intern)
+        index._build_counts(intern, phrases, phrase_words)
+        return index
+
+    def _add_arrays(self, **arrays: t.Sequence[int]) -> None:
+        self.arrays.update(arrays)
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+    def _location_of(self, position: int) -> Location:
+        """Return the manuscript, column and line of the reading at a given position."""
+        return (self.string(self.manuscripts[position]), self.string(self.columns[position]),
+                self.string(self.lines[position]))
+
+    def _build_locations(self, intern: Interner) -> None:
+        """Group the rows of each tradition, chapter and verse."""
+        location_positions: t.Dict[Location, t.List[int]] = {}
+        for position in range(len(self.reading_ids)):
+            manuscript, column, line = self._location_of(position)
+            for location in [(manuscript,), (manuscript, column), (manuscript, column, line)]:
+                location_positions.setdefault(location, []).append(position)
+        location_keys, location_offsets, location_rows = _location_csr(location_positions, intern)
+        self._add_arrays(location_keys=location_keys, location_offsets=location_offsets,
+                         location_rows=location_rows)
+
+    def _build_groups(self,
+                      groups: t.Iterable[t.Mapping[str, t.Any]],
+                      words: t.Iterable[t.Mapping[str, t.Any]]) -> t.Tuple[t.Dict[int, t.Set[int]],
+                                                                           t.Dict[int, t.List[int]]]:
+        """Index the parallel phrase groups in both directions.
+
+        Returns:
+            The parallel phrases of each anchor, and the words of each parallel phrase.
+        """
+        members: t.Dict[int, t.List[int]] = {}
+        anchors: t.Dict[int, t.List[int]] = {}
+        phrases: t.Dict[int, t.Set[int]] = {}
+        for group in groups:
+            anchor, member = group["anchor_reading_id"], group["manuscript_sign_cluster_reading_id"]
+            anchors.setdefault(member, []).append(anchor)
+            phrases.setdefault(anchor, set()).add(group["parallel_phrase_id"])
+            if anchor != member:
+                members.setdefault(anchor, []).append(member)
+        phrase_words: t.Dict[int, t.List[int]] = {}
+        for word in words:
+            phrase_words.setdefault(word["parallel_phrase_id"], []).append(
+                word["manuscript_sign_cluster_reading_id"]
+            )
+        anchor_ids, member_offsets, member_ids = _csr(members)
+        grouped_ids, anchor_offsets, group_anchor_ids = _csr(anchors)
+        self._add_arrays(anchor_ids=anchor_ids, member_offsets=member_offsets, member_ids=member_ids,
+                         grouped_ids=grouped_ids, anchor_offsets=anchor_offsets,
+                         group_anchor_ids=group_anchor_ids)
+        return phrases, phrase_words
+
+    def _build_spans(self) -> None:
+        """Compute the span of the parallel readings of each anchor within each witness
+        manuscript."""
+        spans: t.Dict[int, t.List[int]] = {}
+        for anchor in self.anchor_ids:
+            bounds: t.Dict[int, t.List[int]] = {}
+            for member in self.parallels_of(anchor):
+                for position in self.positions_of(member):
+                    ordered_id = self.ordered_ids[position]
+                    if not ordered_id:
+                        continue
+                    bound = bounds.setdefault(self.manuscripts[position], [ordered_id, ordered_id])
+                    bound[0] = min(bound[0], ordered_id)
+                    bound[1] = max(bound[1], ordered_id)
+            spans[anchor] = [value for manuscript, (low, high) in bounds.items()
+                             for value in (manuscript, low, high)]
+        _, span_offsets, span_bounds = _csr(spans)
+        self._add_arrays(span_offsets=span_offsets, span_bounds=span_bounds)
+
+    def _build_parallels(self, intern: Interner) -> None:
+        """Compute the locations of the parallels of each tradition, chapter and verse."""
+        parallel_locations: t.Dict[Location, t.Dict[Location, None]] = {}
+        for anchor in self.anchor_ids:
+            targets = {self._location_of(position): None
+                       for member in self.parallels_of(anchor)
+                       for position in self.positions_of(member)}
+            for position in self.positions_of(anchor):
+                manuscript, column, line = self._location_of(position)
+                for location in [(manuscript,), (manuscript, column), (manuscript, column, line)]:
+                    parallel_locations.setdefault(location, {}).update(targets)
+        parallel_keys, parallel_offsets, parallel_targets = _location_csr(
+            {location: [intern(part) for target in targets for part in target]
+             for location, targets in parallel_locations.items()},
+            intern, "L")
+        self._add_arrays(parallel_keys=parallel_keys, parallel_offsets=parallel_offsets,
+                         parallel_targets=parallel_targets)
+
+    def _build_counts(self, intern: Interner, phrases: t.Dict[int, t.Set[int]],
+                      phrase_words: t.Dict[int, t.List[int]]) -> None:
+        """Count the manuscripts with parallels for each chapter of each tradition, and each of
+        its verses."""
+        witnesses: t.Dict[Location, t.Dict[str, t.Set[int]]] = {}
+        for position in range(len(self.reading_ids)):
+            if not self.counted[position]:
+                continue
+            manuscripts = {self.manuscripts[word_position]
+                           for phrase in phrases.get(self.reading_ids[position], ())
+                           for word in phrase_words.get(phrase, ())
+                           for word_position in self.positions_of(word)
+                           if self.counted[word_position]}
+            if not manuscripts:
+                continue
+            manuscript, column, line = self._location_of(position)
+            witnesses.setdefault((manuscript,), {}).setdefault(column, set()).update(manuscripts)
+            witnesses.setdefault((manuscript, column), {}).setdefault(line, set()).update(manuscripts)
+        count_keys, count_offsets, count_values = _location_csr(
+            {location: [value for key, manuscripts in keys.items()
+                        for value in (intern(key), len(manuscripts))]
+             for location, keys in witnesses.items()},
+            intern)
+        self._add_arrays(count_keys=count_keys, count_offsets=count_offsets, count_values=count_values)
+
+    @classmethod
+    def from_snapshot(cls,
+                      strings: t.Sequence[str],
+                      arrays: t.Dict[str, t.Sequence[int]]) -> "ParallelIndex":
+        """Create the index from the strings and arrays of a snapshot.
+
+        Raises:
+            ValueError: The snapshot does not hold the arrays of the index.
+        """
+        missing = {"location_keys", "parallel_keys", "count_keys"} - set(arrays)
+        if missing:
+            raise ValueError(f"Snapshot lacks the arrays {', '.join(sorted(missing))} of the "
+                             f"parallel index, it must be written again")
+        return cls(strings, arrays)
+
+    def string(self, ix: int) -> t.Optional[str]:
+        """Return the string of the given index."""
+        return None if ix == NULL else self.strings[ix]
+
+    @staticmethod
+    def location(name: str,
+                 chapter: t.Optional[str] = None,
+                 verse: t.Optional[str] = None) -> Location:
+        """Return the key of a tradition, a chapter and a verse. The verse is ignored when no
+        chapter is given.
+        """
+        if chapter:
+            return (name, chapter, verse) if verse else (name, chapter)
+        return (name,)
+
+    def location_positions(self,
+                           name: str,
+                           chapter: t.Optional[str] = None,
+                           verse: t.Optional[str] = None) -> t.Sequence[int]:
+        """Return the positions of the readings of a tradition, a chapter and a verse."""
+        return self._find(self.location_keys, self.location_offsets, self.location_rows,
+                          self.location(name, chapter, verse))
+
+    def _lookup(self, keys: t.Sequence[int], offsets: t.Sequence[int],
+                values: t.Sequence[int], key: int) -> t.Sequence[int]:
+        """Return the values of a key within a flattened mapping."""
+        ix = bisect_left(keys, key)
+        if ix == len(keys) or keys[ix] != key:
+            return values[0:0]
+        return values[offsets[ix]:offsets[ix + 1]]
+
+    def _find(self, keys: t.Sequence[int], offsets: t.Sequence[int],
+              values: t.Sequence[int], location: Location) -> t.Sequence[int]:
+        """Return the values of a location within a flattened mapping of locations."""
+        key_strings = KeyStrings(keys, self.strings)
+        string = _location_string(location)
+        ix = bisect_left(key_strings, string)
+        if ix == len(keys) or key_strings[ix] != string:
+            return values[0:0]
+        return values[offsets[ix]:offsets[ix + 1]]
+
+    def anchors_of(self, reading_id: int) -> t.Sequence[int]:
+        """Return the anchors of the parallel phrase groups of a reading."""
+        return self._lookup(self.grouped_ids, self.anchor_offsets, self.group_anchor_ids,
+                            reading_id)
+
+    def parallels_of(self, anchor_id: int) -> t.Sequence[int]:
+        """Return the readings parallel to an anchor reading."""
+        return self._lookup(self.anchor_ids, self.member_offsets, self.member_ids, anchor_id)
+
+    def spans_of(self, anchor_id: int) -> t.Sequence[int]:
+        """Return the spans of the parallels of an anchor, as a flat sequence of manuscript,
+        minimum and maximum unique ordered id.
+        """
+        return self._lookup(self.anchor_ids, self.span_offsets, self.span_bounds, anchor_id)
+
+    def positions_of(self, reading_id: int) -> t.Sequence[int]:
+        """Return the positions of the rows of a reading."""
+        start = bisect_left(self.sorted_reading_ids, reading_id)
+        end = bisect_right(self.sorted_reading_ids, reading_id)
+        return self.reading_order[start:end]
+
+    def record(self, position: int, anchor_id: int) -> t.Dict[str, t.Any]:
+        """Return the record of the reading at a given position."""
+        return {
+            "manuscript": self.string(self.manuscripts[position]),
+            "column": self.string(self.columns[position]),
+            "line": self.string(self.lines[position]),
+            "reading": self.string(self.readings[position]),
+            "followed_by": self.string(self.followed_by[position]),
+            "anchor_reading_id": anchor_id,
+            "unique_ordered_id": self.ordered_ids[position] or None,
+            "is_fully_reconstructed": self.reconstructed[position],
+        }
+
+    def resolve(self,
+                name: str,
+                chapter: t.Optional[str] = None,
+                verse: t.Optional[str] = None) -> t.List[t.Dict[str, t.Any]]:
+        """Return the ordered records of the parallels of a tradition, a chapter and a verse, as
+        returned by the ordered parallels query.
+        """
+        location = self.location_positions(name, chapter, verse)
+        anchors = {self.reading_ids[position] for position in location}
+        # Merge the spans of all anchors for each manuscript
+        bounds: t.Dict[int, t.List[int]] = {}
+        for anchor in anchors:
+            spans = self.spans_of(anchor)
+            for ix in range(0, len(spans), 3):
+                bound = bounds.setdefault(spans[ix], [spans[ix + 1], spans[ix + 2]])
+                bound[0] = min(bound[0], spans[ix + 1])
+                bound[1] = max(bound[1], spans[ix + 2])
+        keys: t.Set[t.Tuple[int, int]] = set()
+        for low, high in bounds.values():
+            for position in range(bisect_left(self.ordered_ids, low),
+                                  bisect_right(self.ordered_ids, high)):
+                for anchor in self.anchors_of(self.reading_ids[position]):
+                    if anchor in anchors:
+                        keys.add((position, anchor))
+        for position in location:
+            keys.add((position, self.reading_ids[position]))
+        # Deduplicate records as the union of the ordered parallels query does
+        records = {}
+        for position, anchor in sorted(keys):
+            record = self.record(position, anchor)
+            records.setdefault(tuple(record.values()), record)
+        return list(records.values())
+
+    def parallel_locations(self,
+                           name: str,
+                           chapter: t.Optional[str] = None,
+                           verse: t.Optional[str] = None) -> t.List[t.Dict[str, t.Any]]:
+        """Return the manuscripts, columns and lines of the parallels of a tradition, a chapter
+        and a verse.
+        """
+        targets = self._find(self.parallel_keys, self.parallel_offsets, self.parallel_targets,
+                             self.location(name, chapter, verse))
+        return [{"manuscript": self.string(targets[ix]), "column": self.string(targets[ix + 1]),
+                 "line": self.string(targets[ix + 2])}
+                for ix in range(0, len(targets), 3)]
+
+    def parallels_count(self,
+                        name: str,
+                        chapter: t.Optional[str] = None) -> t.List[t.Dict[str, t.Any]]:
+        """Return the number of parallel manuscripts of each chapter of a tradition, or of each
+        verse of a chapter.
+        """
+        key = "verse" if chapter else "chapter"
+        counts = self._find(self.count_keys, self.count_offsets, self.count_values,
+                            self.location(name, chapter))
+        return [{"count_manuscript": counts[ix + 1], key: self.string(counts[ix])}
+                for ix in range(0, len(counts), 2)]
+
+    def density(self) -> t.Iterator[t.Tuple[str, str, str, int]]:
+        """Yield the number of parallel manuscripts of every verse of every tradition."""
+        for ix, key in enumerate(self.count_keys):
+            location = _string_location(self.strings[key])
+            if len(location) == 2:
+                tradition, chapter = location
+                for position in range(self.count_offsets[ix], self.count_offsets[ix + 1], 2):
+                    yield (tradition, chapter, self.string(self.count_values[position]),
+                           self.count_values[position + 1])
@@ -1,5 +1,6 @@
 """Data model for text manipulation.
 """
+from enum import Enum
 
 FOLLOWED_BY_MAPPER = {
     "space": " ",
@@ -7,4 +8,11 @@ FOLLOWED_BY_MAPPER = {
     "none": "",
 }
 
-FRAGMENTATION_PLACEHOLDER = "φ"
\ No newline at end of file
+FRAGMENTATION_PLACEHOLDER = "φ"
+
+
+class CollationFormat(str, Enum):
+    """Output formats of a collation."""
+    HTML = "html"
+    JSON = "json"
+    MSGPACK = "msgpack"
@@ -0,0 +1,161 @@
+"""Normalization pipeline turning the readings of the witnesses into texts to collate.
+
+The pipeline is built once for each combination of options, with precompiled patterns and
+translation tables, and is applied to the readings in a single pass.
+"""
+import re
+import typing as t
+from functools import lru_cache
+from .models import FOLLOWED_BY_MAPPER, FRAGMENTATION_PLACEHOLDER
+
+# Hebrew vowels and cantillation marks unicode ranges
+HEBREW_VOWELS_RANGES = [
+    ("\u05B0", "\u05C3"),
+    ("\u05C7", "\u05C8"),
+    ("\u05F0", "\u05F4"),
+    ("\u05BC", "\u05BC"),
+    ("\u05B0", "\u05B9"),
+    ("\u05F3", "\u05F4"),
+    ("\u0591", "\u05AF"),
+]
+
+HEBREW_VOWELS_TABLE = str.maketrans({
+    chr(code): None
+    for start, end in HEBREW_VOWELS_RANGES
+    for code in range(ord(start), ord(end) + 1)
+})
+
+BRACKETS_PATTERN = re.compile(r"[\[\]]")
+FRAGMENT_PATTERN = re.compile(r"\[.*?\]")
+
+Step = t.Callable[[str], str]
+
+
+def remove_vowels(text: str) -> str:
+    """Strip vowels and cantillation marks from a Hebrew string."""
+    return text.translate(HEBREW_VOWELS_TABLE)
+
+
+def brackets_balanced(reading: str) -> bool:
+    """Check if all opened brackets of a reading have been closed."""
+    depth = 0
+    for bracket in BRACKETS_PATTERN.findall(reading):
+        depth += 1 if bracket == "[" else -1
+        if depth < 0:
+            return False
+    return depth == 0
+
+
+def repair_brackets(reading: str) -> str:
+    """Add the opening or closing bracket missing from a reading split across a lacuna."""
+    closed = reading.count("]")
+    opened = reading.count("[")
+    if closed < opened:
+        return f"{reading}]"
+    if closed > opened:
+        return f"[{reading}"
+    if not brackets_balanced(reading):
+        return f"[{reading}]"
+    return reading
+
+
+def replace_fragments(reading: str) -> str:
+    """Replace the reconstructed parts of a reading by the fragmentation placeholder."""
+    return FRAGMENT_PATTERN.sub(FRAGMENTATION_PLACEHOLDER, reading)
+
+
+def mask_reconstructions(reading: str) -> str:
+    """Replace the reconstructed parts of a reading, once its brackets have been repaired."""
+    if "[" not in reading and "]" not in reading:
+        return reading
+    return replace_fragments(repair_brackets(reading))
+
+
+class NormalizationPipeline:
+    """Compose the normalization steps applied to the readings of the witnesses, then to the
+    text of each witness once joined.
+    """
+
+    def __init__(self,
+                 reading_steps: t.Sequence[Step] = (),
+                 text_steps: t.Sequence[Step] = (),
+                 mask_fully_reconstructed: bool = False) -> None:
+        """
+        Args:
+            reading_steps (Sequence[Step]): Steps applied to each reading.
+            text_steps (Sequence[Step]): Steps applied to the text of each witness.
+            mask_fully_reconstructed (bool): Whether the fully reconstructed readings are
+                replaced by the fragmentation placeholder. Defaults to False.
+        """
+        self.reading_steps = tuple(reading_steps)
+        self.text_steps = tuple(text_steps)
+        self.mask_fully_reconstructed = mask_fully_reconstructed
+        # Readings are highly repeated across witnesses, hence normalized only once
+        self._normalize = lru_cache(maxsize=65536)(self._apply_reading_steps)
+
+    def _apply_reading_steps(self, reading: str) -> str:
+        """Apply the reading steps to a reading."""
+        for step in self.reading_steps:
+            reading = step(reading)
+        return reading
+
+    def cache_stats(self) -> t.Tuple[int, int]:
+        """Return the hits and misses of the cache of the normalized readings."""
+        info = self._normalize.cache_info()
+        return info.hits, info.misses
+
+    def normalize_reading(self, record: t.Mapping[str, t.Any]) -> str:
+        """Normalize the reading of a record."""
+        if self.mask_fully_reconstructed and record["is_fully_reconstructed"]:
+            return FRAGMENTATION_PLACEHOLDER
+        if not self.reading_steps:
+            return record["reading"]
+        return self._normalize(record["reading"])
+
+    def unpack(self, records: t.Iterable[t.Mapping[str, t.Any]]) -> t.Dict[str, str]:
+        """Unpack records into the normalized text of each manuscript."""
+        normalize_reading = self.normalize_reading
+        parts: t.Dict[str, t.List[str]] = {}
+        manuscript = None
+        append = None
+        for record in records:
+            if record["manuscript"] != manuscript:
+                manuscript = record["manuscript"]
+                append = parts.setdefault(manuscript, []).append
+            append(normalize_reading(record))
+            append(FOLLOWED_BY_MAPPER[record["followed_by"]])
+        texts = {}
+        for manuscript, manuscript_parts in parts.items():
+            text = "".join(manuscript_parts).strip()
+            for step in self.text_steps:
+                text = step(text)
+            texts[manuscript] = text
+        return texts
+
+
+@lru_cache(maxsize=None)
+def get_pipeline(reconstructed: bool, strip_vowels: bool = False) -> NormalizationPipeline:
+    """Return the pipeline normalizing the witnesses according to the collation options.
+
+    Args:
+        reconstructed (bool): Whether the reconstructed data is held as true data. If set to
+            False, reconstructed readings are replaced by the fragmentation placeholder.
+        strip_vowels (bool): Whether vowels and cantillation marks are stripped.
+            Defaults to False.
+    """
+    return NormalizationPipeline(
+        reading_steps=() if reconstructed else (mask_reconstructions,),
+        text_steps=(remove_vowels,) if strip_vowels else (),
+        mask_fully_reconstructed=not reconstructed,
+    )
+
+
+def cache_stats() -> t.Tuple[int, int]:
+    """Return the hits and misses of the caches of the normalized readings of all the
+    pipelines."""
+    hits = misses = 0
+    for reconstructed in (True, False):
+        for strip_vowels in (True, False):
+            pipeline_hits, pipeline_misses = get_pipeline(reconstructed, strip_vowels).cache_stats()
+            hits, misses = hits + pipeline_hits, misses + pipeline_misses
+    return hits, misses
@@ -0,0 +1,116 @@
+"""Rendering of the collation tables.
+
+The alignment table is either rendered row by row as HTML fragments, so that the table is sent
+to the client as it is produced instead of being built as a whole beforehand, or as a compact
+witness x column matrix of token indices.
+"""
+import typing as t
+from html import escape
+
+if t.TYPE_CHECKING:
+    from collatex.core_classes import AlignmentTable
+
+# Placeholder of a witness without any token in a column
+EMPTY_CELL = "-"
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html><head>
+<meta http-equiv='Content-Type' content='text/html; charset=utf-8'>
+<title>html title</title>
+<style type='text/css' media='screen'>
+th, td {
+border-style: dotted;
+border-color: #96D4D4;
+}
+#container {
+    display: flex;
+    flex-direction: column;
+    justify-content: center;
+    align-items: center;
+    height: 300px;
+    border: 1px solid black;
+}
+</style>
+</head>
+<body>
+"""
+
+PAGE_TAIL = """
+</div></body></html>
+"""
+
+
+# Index of the missing tokens in the alignment matrix
+MISSING_TOKEN = -1
+
+
+def cell_text(cell: t.Optional[t.List[t.Any]]) -> str:
+    """Join the tokens of a witness in a column."""
+    return "".join(token.token_data["t"] for token in cell).rstrip() if cell else ""
+
+
+def render_cell(cell: t.Optional[t.List[t.Any]]) -> str:
+    """Render the tokens of a witness in a column as an escaped table cell."""
+    if not cell:
+        return f"<td>{EMPTY_CELL}</td>"
+    return f"<td>{escape(cell_text(cell))}</td>"
+
+
+def iter_html_table(table: "AlignmentTable") -> t.Iterator[str]:
+    """Yield the HTML fragments of an alignment table, one witness per row, its sigil first.
+    """
+    yield "<table>\n<tbody>\n"
+    for row in table.rows:
+        yield f"<tr><td>{escape(row.header)}</td>{''.join(map(render_cell, row.cells))}</tr>\n"
+    yield "</tbody>\n</table>"
+
+
+def html_table(table: "AlignmentTable") -> str:
+    """Render an alignment table as an HTML string."""
+    return "".join(iter_html_table(table))
+
+
+def alignment_matrix(table: "AlignmentTable") -> t.Dict[str, t.Any]:
+    """Encode an alignment table as a witness x column matrix of indices in the list of the
+    distinct tokens, MISSING_TOKEN standing for the witnesses without any token in a column.
+
+    Returns:
+        Dict[str, Any]: The witnesses, the distinct tokens, the matrix and whether each column
+            is a variant location, as {"witnesses", "tokens", "table", "variants"}.
+    """
+    tokens: t.Dict[str, int] = {}
+    matrix = [
+        [tokens.setdefault(cell_text(cell), len(tokens)) if cell else MISSING_TOKEN
+         for cell in row.cells]
+        for row in table.rows
+    ]
+    return {
+        "witnesses": [row.header for row in table.rows],
+        "tokens": list(tokens),
+        "table": matrix,
+        "variants": [bool(column.variant) for column in table.columns],
+    }
+
+
+def iter_html_page(tradition: str,
+                   chapter: str,
+                   verse: str,
+                   mt_text: str,
+                   table: "AlignmentTable") -> t.Iterator[str]:
+    """Yield the HTML page of the collation of a verse, the rows of the table being rendered
+    one at a time.
+
+    Args:
+        tradition (str): The tradition of the verse.
+        chapter (str): The chapter of the verse.
+        verse (str): The verse.
+        mt_text (str): The MT text of the verse.
+        table (AlignmentTable): The collation of the parallels of the verse.
+    """
+    yield PAGE_HEAD
+    yield (f"Collation for <b>{escape(tradition)}</b> chapter <b>{escape(chapter)}</b> "
+           f"verse <b>{escape(verse)}</b><br/>\n")
+    yield f"<b>MT text</b>: <div dir=\"rtl\">{escape(mt_text)}\n</div>\n"
+    yield "<div id=\"container\" dir=\"rtl\">\n"
+    yield from iter_html_table(table)
+    yield PAGE_TAIL
@@ -1,11 +1,17 @@
 """Create the HTTP router to retrieve the textual tradition.
 """
-import json
+import asyncio
 from typing import Optional
 from fastapi import APIRouter, Depends, Request, Response
-from fastapi.responses import HTMLResponse
+from fastapi.responses import StreamingResponse
+from backend.api.admission import COLLATION, admission
 from backend.api.oidc.provider import check_user
+from backend.api.responses import APIJSONResponse
 from backend.settings.settings import QWB_READ_ROLE, QWB_CLIENT_ID
+from backend.tools.msgpack import packb
+from backend.tools.tracing import span
+from .models import CollationFormat
+from .rendering import alignment_matrix, iter_html_page, iter_html_table
 from .utils import compute_letter_difference, compute_levensthein, retrieve_morphological_analysis, analyze_collations
 
 
@@ -14,6 +20,19 @@ def sql_database(request: Request):
     return request.app.state.database
 
 
+async def collation_page(database, tradition: str, chapter: str, verse: str, reconstructed: bool,
+                         strip_vowels: bool) -> StreamingResponse:
+    """Retrieve the MT text and the collation of a verse concurrently, then stream the HTML
+    page rendering them, so that errors are raised before the response starts."""
+    mt_text, table = await asyncio.gather(
+        database.get_manuscript(manuscript_name=tradition, column=chapter, line=verse),
+        database.get_collation(name=tradition, chapter=chapter, verse=verse,
+                               reconstructed=reconstructed, strip_vowels=strip_vowels),
+    )
+    return StreamingResponse(iter_html_page(tradition, chapter, verse, mt_text, table),
+                             media_type="text/html")
+
+
 router = APIRouter(tags=["parallels"])
 
 
@@ -29,10 +48,7 @@ async def get_parallel(
     result = await database.get_parallels_content(
         name=tradition, chapter=chapter, verse=verse, reconstructed=True
     )
-    return Response(
-        content=json.dumps(result, ensure_ascii=False).encode("utf8"),
-        media_type="application/json",
-    )
+    return APIJSONResponse(result)
 
 
 @router.get("/parallels/list")
@@ -47,13 +63,59 @@ async def available_parallels(
     results = await database.get_parallels(name=tradition,
                                            chapter=chapter,
                                            verse=verse)
-    return Response(
-        content=json.dumps({"parallels": results}, ensure_ascii=False).encode("utf8"),
-        media_type="application/json",
+    return APIJSONResponse({"parallels": results})
+
+
+@router.get("/parallels/density")
+async def get_parallels_density(
+    request: Request,
+    database=Depends(sql_database),
+    user=check_user(expected_roles=[QWB_READ_ROLE], client_id=QWB_CLIENT_ID),
+):
+    """Count the number of parallels of every verse of every chapter of every tradition, as
+    {tradition: {chapter: {verse: count}}}. The response is gzipped when accepted by the client.
+    """
+    table = await database.get_parallels_density(request.app.state.settings.density_max_age)
+    headers = {"ETag": table.etag, "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == table.etag:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=table.gzipped, media_type="application/json", headers=headers)
+    return Response(content=table.payload, media_type="application/json", headers=headers)
+
+
+@router.get("/parallels/{tradition}/{chapter}/{verse}/collation", dependencies=[admission(COLLATION)])
+async def get_collation(
+    tradition: str,
+    chapter: str,
+    verse: str,
+    reconstructed: bool,
+    strip_vowels: bool,
+    format: CollationFormat = CollationFormat.JSON,
+    database=Depends(sql_database),
+    user=check_user(expected_roles=[QWB_READ_ROLE], client_id=QWB_CLIENT_ID),
+):
+    """Retrieve all parallels associated with a tradition, a chapter and a verse and perform the collation.
+    If reconstructed is set to True, then the reconstructed data is held as true data.
+    The json and msgpack formats encode the alignment table as a witness x column matrix of
+    indices in the list of the distinct tokens, -1 standing for missing tokens, along with
+    whether each column is a variant location."""
+    if format == CollationFormat.HTML:
+        return await collation_page(database, tradition, chapter, verse, reconstructed, strip_vowels)
+    collation = await database.get_collation(
+        name=tradition, chapter=chapter, verse=verse, reconstructed=reconstructed, strip_vowels=strip_vowels
     )
+    matrix = alignment_matrix(collation)
+    if format == CollationFormat.MSGPACK:
+        with span("serialization", format=format.value) as current:
+            content = packb(matrix)
+            current.set_attribute("bytes", len(content))
+        return Response(content=content, media_type="application/x-msgpack")
+    return APIJSONResponse(matrix)
 
 
-@router.get("/parallels/{tradition}/{chapter}/{verse}/collation/html")
+@router.get("/parallels/{tradition}/{chapter}/{verse}/collation/html", dependencies=[admission(COLLATION)])
 async def perform_collation(
     tradition: str,
     chapter: str,
@@ -65,55 +127,10 @@ async def perform_collation(
 ):
     """Retrieve all parallels associated with a tradition, a chapter and a verse and perform the collation.
     If reconstructed is set to True, then the reconstructed data is held as true data."""
-    collation = await database.get_html_collation(
-        name=tradition, chapter=chapter, verse=verse, reconstructed=reconstructed, strip_vowels=strip_vowels
-    )
-    mt_text = await database.get_manuscript(manuscript_name=tradition, column=chapter, line=verse)
-    html_string = (
-        """
-        <head>
-        <meta http-equiv='Content-Type' content='text/html; charset=utf-8'>
-        <title>html title</title>
-        <style type='text/css' media='screen'>
-        th, td {
-        border-style: dotted;
-        border-color: #96D4D4;
-        }
-        #container {
-            display: flex;              
-            flex-direction: column;     
-            justify-content: center;    
-            align-items: center; 
-            height: 300px;
-            border: 1px solid black;
-        }
-        </style>
-        </head>
-        <html><body>
-        Collation for <b>"""
-        + tradition
-        + """</b> chapter <b>"""
-        + chapter
-        + """</b> verse <b>"""
-        + verse
-        + """</b><br/>
-        <b>MT text</b>: <div dir="rtl">"""
-        +
-        mt_text
-        +
-        """
-        </div>
-        <div id="container" dir="rtl">
-        """
-        + collation
-        + """
-        </div></body></html>
-        """
-    )
-    return HTMLResponse(content=html_string, media_type="text/html")
+    return await collation_page(database, tradition, chapter, verse, reconstructed, strip_vowels)
 
 
-@router.get("/parallels/{tradition}/{chapter}/{verse}/collation/rawhtml")
+@router.get("/parallels/{tradition}/{chapter}/{verse}/collation/rawhtml", dependencies=[admission(COLLATION)])
 async def perform_raw_collation(
     tradition: str,
     chapter: str,
@@ -125,13 +142,13 @@ async def perform_raw_collation(
 ):
     """Retrieve all parallels associated with a tradition, a chapter and a verse and perform the collation.
     If reconstructed is set to True, then the reconstructed data is held as true data."""
-    html_string = await database.get_html_collation(
+    collation = await database.get_collation(
         name=tradition, chapter=chapter, verse=verse, reconstructed=reconstructed, strip_vowels=strip_vowels
     )
-    return HTMLResponse(content=html_string, media_type="text/html")
+    return StreamingResponse(iter_html_table(collation), media_type="text/html")
 
 
-@router.get("/parallels/{tradition}/{chapter}/{verse}/collation/analysis")
+@router.get("/parallels/{tradition}/{chapter}/{verse}/collation/analysis", dependencies=[admission(COLLATION)])
 async def perform_collation_analysis(
     tradition: str,
     chapter: str,
@@ -146,7 +163,29 @@ async def perform_collation_analysis(
     collation = await database.get_collation(
         name=tradition, chapter=chapter, verse=verse, reconstructed=reconstructed, strip_vowels=strip_vowels
     )
-    return analyze_collations(collation)
+    with span("analysis", columns=len(collation.columns)):
+        analysis = await asyncio.to_thread(analyze_collations, collation)
+    return APIJSONResponse(analysis)
+
+
+@router.get("/parallels/{tradition}/{chapter}/{verse}/distances", dependencies=[admission(COLLATION)])
+async def get_parallels_distances(
+    tradition: str,
+    chapter: str,
+    verse: str,
+    reconstructed: bool,
+    strip_vowels: bool,
+    database=Depends(sql_database),
+    user=check_user(expected_roles=[QWB_READ_ROLE], client_id=QWB_CLIENT_ID),
+):
+    """Retrieve all parallels associated with a tradition, a chapter and a verse and compute the
+    witness x witness edit distance matrix (counted in words), along with the order of the
+    witnesses given by their hierarchical clustering.
+    If reconstructed is set to True, then the reconstructed data is held as true data."""
+    result = await database.get_parallels_distances(
+        name=tradition, chapter=chapter, verse=verse, reconstructed=reconstructed, strip_vowels=strip_vowels
+    )
+    return APIJSONResponse(result)
 
 
 @router.get("/parallels/analysis")
@@ -159,14 +198,14 @@ async def get_variants_analysis(
     """Perform the analysis of the variants."""
     morpho_analysis_1 = await database.get_word_morphological_analysis(reading_1)
     morpho_analysis_2 = await database.get_word_morphological_analysis(reading_2)
-    return {
+    return APIJSONResponse({
         "levensthein": compute_levensthein(reading_1, reading_2),
         "letter_differences": compute_letter_difference(reading_1, reading_2),
         "analysis": {
             "reading_1": retrieve_morphological_analysis(morpho_analysis_1),
             "reading_2": retrieve_morphological_analysis(morpho_analysis_2),
         },
-    }
+    })
 
 
 @router.get("/parallels/count")
@@ -180,10 +219,7 @@ async def get_parallels_count(
     within this chapter.
     """
     result = await database.get_parallels_count(name=tradition, chapter=chapter)
-    return Response(
-        content=json.dumps({tradition: {
-            "chapter": chapter,
-            "count": result
-        }}, ensure_ascii=False).encode("utf8"),
-        media_type="application/json",
-    )
\ No newline at end of file
+    return APIJSONResponse({tradition: {
+        "chapter": chapter,
+        "count": result
+    }})
\ No newline at end of file
@@ -1,13 +1,17 @@
 """Set of utility functions for variant analysis.
 """
-import re
-from textdistance import levenshtein
-from collatex.core_classes import AlignmentTable
+import sys
+import typing as t
+from functools import lru_cache
+import Levenshtein
+if t.TYPE_CHECKING:
+    from collatex.core_classes import AlignmentTable
+from .normalization import remove_vowels
 
 
 def compute_levensthein(reading_1, reading_2):
     """Compute the levensthein distance between two strings."""
-    return levenshtein(reading_1, reading_2)
+    return Levenshtein.distance(reading_1, reading_2)
 
 
 def compute_letter_difference(reading_1, reading_2):
@@ -43,11 +47,13 @@ def analyze_variants(variant_list: list[str]):
 
 
 def combine_values(dictionary):
+    """Combine the values of every unique pair of keys of a dictionary."""
     result = {}
+    items = list(dictionary.items())
 
     # Iterate through all unique key pairs in the dictionary
-    for i, (key1, value1) in enumerate(dictionary.items()):
-        for key2, value2 in list(dictionary.items())[i + 1 :]:
+    for i, (key1, value1) in enumerate(items):
+        for key2, value2 in items[i + 1 :]:
             # Create a new key by combining the original keys
             new_key = f"{key1}-{key2}"
 
@@ -63,29 +69,56 @@ def combine_values(dictionary):
 def strip_hebrew_vowels(hebrew_string):
     """Strip vowels from Hebrew string.
     """
-    # Define a regular expression to match Hebrew vowels
-    vowels_pattern = re.compile('[\u05B0-\u05C3\u05C7-\u05C8\u05F0-\u05F4\u05BC\u05B0-\u05B9\u05F3-\u05F4\u0591-\u05AF]')  # Hebrew vowels unicode range
+    return remove_vowels(hebrew_string)
 
-    # Use re.sub to replace matched vowels with an empty string
-    stripped_string = re.sub(vowels_pattern, '', hebrew_string)
 
-    return stripped_string
+@lru_cache(maxsize=65536)
+def _compare_readings(reading_1: str, reading_2: str):
+    """Compute, once per pair of readings, the distance and the letter difference."""
+    return (compute_levensthein(reading_1, reading_2),
+            tuple(compute_letter_difference(reading_1, reading_2)))
 
 
-def analyze_collations(alignment_table: AlignmentTable):
-    """Analyze an input collation table."""
+def compare_readings_cache_stats() -> t.Tuple[int, int]:
+    """Return the hits and misses of the cache of the distances between readings."""
+    info = _compare_readings.cache_info()
+    return info.hits, info.misses
+
+
+def _column_reading(tokens) -> str:
+    """Return the interned reading of a witness in a column of the alignment table.
+    Collations are performed without segmentation, hence a witness holds at most one token
+    per column; empty cells are considered as omissions.
+    """
+    if not tokens:
+        return ""
+    token = tokens[0]
+    return sys.intern(token if isinstance(token, str) else token.token_string)
+
+
+def analyze_collations(alignment_table: "AlignmentTable"):
+    """Analyze an input collation table.
+
+    All the pairs of witnesses of a variant column are compared in a single pass, and the
+    comparison of a given pair of readings is memoized across columns.
+    """
     variant_analysis = {}
     for ix, col in enumerate(alignment_table.columns):
-        if col.variant:
-            variants = col.tokens_per_witness
-            for key, val in variants.items():
-                if val == []:
-                    variants[key] = [""]
-                else:
-                    variants[key] = [item for item in val]   
-            combined_values = combine_values(variants)
-            for key, value in combined_values.items():
-                string_value = [val.token_string if type(val) != str else val for val in value]
-                if string_value[0] != string_value[1]:
-                    variant_analysis[str(ix)+":"+key] = analyze_variants(string_value)
+        if not col.variant:
+            continue
+        sigils = list(col.tokens_per_witness)
+        readings = [_column_reading(tokens) for tokens in col.tokens_per_witness.values()]
+        for i, reading_1 in enumerate(readings):
+            for j in range(i + 1, len(readings)):
+                reading_2 = readings[j]
+                if reading_1 == reading_2:
+                    continue
+                distance, letter_difference = _compare_readings(reading_1, reading_2)
+                variant_analysis[f"{ix}:{sigils[i]}-{sigils[j]}"] = {
+                    "guessed_type": "omission" if not (reading_1 and reading_2) else "unknown",
+                    "distance": distance,
+                    "letter_difference": list(letter_difference),
+                    "reading_1": reading_1,
+                    "reading_2": reading_2,
+                }
     return variant_analysis
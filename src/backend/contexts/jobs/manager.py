@@ -0,0 +1,311 @@
+"""Bounded pool of workers running the asynchronous jobs.
+
+The jobs are held in a store shared by the worker processes of the API, and are run by a pool
+of workers bounded across all the processes. Identical submissions are deduplicated: while a
+job is queued, running or retained once done, submitting the same kind and parameters returns
+it, the user being added to its subscribers, rather than queuing a new job. A job is only
+cancelled once all its subscribers cancelled it, and keeps its worker busy until its current
+step returns. Finished jobs, along with their results, are retained for a bounded time and in
+a bounded number.
+
+The store is read and written in threads, so that its lock and its files never block the event
+loop, and each process polls it from a single task.
+"""
+import asyncio
+import tempfile
+import time
+import typing as t
+import uuid
+
+from loguru import logger
+
+from backend.tools.metrics import Counter, Gauge
+from .models import Job, JobCancelled, JobStatus, job_id
+from .store import JobStore, LockFile
+
+JOBS = Counter("qwb_jobs_total", "Number of finished jobs.", ["kind", "status"])
+RUNNING_JOBS = Gauge("qwb_jobs_running", "Number of jobs being run.")
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is full."""
+
+
+class JobRun:
+    """Run of a job, given to its runner to read its parameters and report its progress."""
+
+    def __init__(self, store: JobStore, job: Job) -> None:
+        self.store = store
+        self.job = job
+        self.params = job.params
+
+    async def advance(self, stage: str, progress: float) -> None:
+        """Report the current step of the job and its progress.
+
+        Raises:
+            JobCancelled: If the job has been cancelled, so that the run stops between steps.
+        """
+        await asyncio.to_thread(self._advance, stage, progress)
+
+    def _advance(self, stage: str, progress: float) -> None:
+        with self.store.lock():
+            job = self.store.read(self.job.id)
+            if job is None or job.run_id != self.job.run_id or job.status != JobStatus.RUNNING:
+                raise JobCancelled(self.job.id)
+            job.stage = stage
+            job.progress = progress
+            self.store.write(job)
+
+
+Runner = t.Callable[[JobRun], t.Awaitable[bytes]]
+
+
+class JobManager:
+    """Queue the jobs, run them in a bounded pool of workers and retain their results."""
+
+    def __init__(self, directory: t.Optional[str] = None, workers: int = 2, queue_size: int = 32,
+                 retention: float = 3600, max_jobs: int = 256, poll_interval: float = 0.2) -> None:
+        """
+        Args:
+            directory (Optional[str]): The directory of the store, shared by the worker
+                processes. Defaults to a temporary directory of this process.
+            workers (int): Number of jobs run at once by all the processes. Defaults to 2.
+            queue_size (int): Number of jobs waiting for a worker. Defaults to 32.
+            retention (float): Time, in seconds, finished jobs are retained. Defaults to 3600.
+            max_jobs (int): Number of finished jobs retained, the oldest ones being dropped
+                first. Defaults to 256.
+            poll_interval (float): Time, in seconds, between two checks of the store for
+                queued jobs or for the end of a job. Defaults to 0.2.
+        """
+        # Removed along with the manager
+        self._temporary = tempfile.TemporaryDirectory(prefix="qwb-api-jobs-") if directory is None else None
+        self.store = JobStore(directory or self._temporary.name)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retention = retention
+        self.max_jobs = max_jobs
+        self.poll_interval = poll_interval
+        self.runners: t.Dict[str, Runner] = {}
+        self._submitted = asyncio.Event()
+        self._dispatcher: t.Optional["asyncio.Task[None]"] = None
+
+    def register(self, kind: str, run: Runner) -> None:
+        """Register the runner of a kind of jobs.
+
+        Args:
+            kind (str): The kind of the jobs.
+            run (Runner): The coroutine function running a job, given its run to report its
+                progress, and returning its result.
+        """
+        self.runners[kind] = run
+
+    def start(self) -> None:
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self) -> None:
+        """Stop the workers, the jobs they run being queued again for the other processes."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    async def submit(self, kind: str, params: t.Dict[str, t.Any], subscriber: str) -> Job:
+        """Submit a job, unless an identical one is queued, running or retained, the user
+        being added to its subscribers.
+
+        Args:
+            kind (str): The kind of the job, with a registered runner.
+            params (Dict[str, Any]): The parameters of the job, identifying it along with its kind.
+            subscriber (str): The key of the user submitting the job.
+
+        Raises:
+            JobQueueFull: If the queue of the jobs is full.
+        """
+        if kind not in self.runners:
+            raise ValueError(f"No runner of the {kind} jobs")
+        job = await asyncio.to_thread(self._submit, kind, params, subscriber)
+        self._submitted.set()
+        return job
+
+    def _submit(self, kind: str, params: t.Dict[str, t.Any], subscriber: str) -> Job:
+        with self.store.lock():
+            self.purge()
+            job = self.store.read(job_id(kind, params))
+            if job is not None and job.status not in (JobStatus.FAILED, JobStatus.CANCELLED):
+                if subscriber not in job.subscribers:
+                    job.subscribers.append(subscriber)
+                    self.store.write(job)
+                return job
+            queued = sum(1 for job in self.store.jobs() if job.status == JobStatus.QUEUED)
+            if queued >= self.queue_size:
+                raise JobQueueFull(f"{queued} jobs are already queued")
+            job = Job(kind, params, [subscriber])
+            self.store.delete(job.id, state=False)
+            self.store.write(job)
+        return job
+
+    async def get(self, job_id: str) -> t.Optional[Job]:
+        job = await asyncio.to_thread(self.store.read, job_id)
+        if job is not None and job.finished and job.finished_at < time.time() - self.retention:
+            return None
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> t.Optional[Job]:
+        """Wait for a job to finish, at most timeout seconds.
+
+        Returns:
+            Optional[Job]: The job, if found.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job.finished or remaining <= 0:
+                return job
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def result(self, job_id: str) -> t.Optional[bytes]:
+        """Return the result of a job once done."""
+        return await asyncio.to_thread(self.store.read_result, job_id)
+
+    async def cancel(self, job_id: str, subscriber: str) -> t.Optional[Job]:
+        """Unsubscribe a user from a job, which is cancelled, whether queued or running, once
+        it has no subscriber left. A running job stops at the end of its current step.
+
+        Returns:
+            Optional[Job]: The job, if found.
+
+        Raises:
+            PermissionError: If the user is not a subscriber of the job.
+        """
+        return await asyncio.to_thread(self._cancel, job_id, subscriber)
+
+    def _cancel(self, job_id: str, subscriber: str) -> t.Optional[Job]:
+        with self.store.lock():
+            job = self.store.read(job_id)
+            if job is None:
+                return None
+            if subscriber not in job.subscribers:
+                raise PermissionError(f"{subscriber} did not submit job {job_id}")
+            if job.finished:
+                return job
+            job.subscribers.remove(subscriber)
+            if not job.subscribers:
+                job.finish(JobStatus.CANCELLED)
+                JOBS.inc(kind=job.kind, status=job.status.value)
+            self.store.write(job)
+        return job
+
+    def purge(self) -> None:
+        """Drop the finished jobs older than the retention, then the oldest finished jobs
+        beyond the maximum number of jobs. Called with the lock of the store held."""
+        expired_at = time.time() - self.retention
+        finished = sorted((job for job in self.store.jobs() if job.finished),
+                          key=lambda job: job.finished_at, reverse=True)
+        for ix, job in enumerate(finished):
+            if job.finished_at <= expired_at or ix >= self.max_jobs:
+                self.store.delete(job.id)
+
+    def _claimable(self) -> bool:
+        """Whether a job is queued, or left running by an exited worker, read without the lock
+        of the store so that idle polls do not contend for it."""
+        return any(job.status == JobStatus.QUEUED
+                   or job.status == JobStatus.RUNNING and not self.store.running(job)
+                   for job in self.store.jobs())
+
+    def _claim(self) -> t.Optional[t.Tuple[Job, LockFile, LockFile]]:
+        """Claim the oldest queued job along with a free slot, after queuing again the jobs of
+        the exited workers."""
+        if not self._claimable():
+            return None
+        slot = self.store.acquire_slot(self.workers)
+        if slot is None:
+            return None
+        with self.store.lock():
+            jobs = sorted(self.store.jobs(), key=lambda job: job.submitted_at)
+            for job in jobs:
+                if job.status == JobStatus.RUNNING and not self.store.running(job):
+                    logger.warning(f"Job {job.id} was left by an exited worker, queuing it again")
+                    job.status, job.stage, job.progress = JobStatus.QUEUED, JobStatus.QUEUED.value, 0.0
+                    self.store.write(job)
+            for job in jobs:
+                if job.status != JobStatus.QUEUED or job.kind not in self.runners:
+                    continue
+                lock_file = self.store.lock_run(job)
+                if lock_file is None:
+                    # A cancelled run of the job is still ending its current step
+                    continue
+                job.status, job.stage = JobStatus.RUNNING, JobStatus.RUNNING.value
+                job.started_at = time.time()
+                job.run_id = uuid.uuid4().hex
+                self.store.write(job)
+                return job, lock_file, slot
+        slot.close()
+        return None
+
+    def _finish(self, run: Job, status: JobStatus, result: t.Optional[bytes] = None,
+                error: t.Optional[str] = None) -> None:
+        """Record the end of a run, unless the job has been cancelled meanwhile."""
+        with self.store.lock():
+            job = self.store.read(run.id)
+            if job is None or job.run_id != run.run_id or job.status != JobStatus.RUNNING:
+                return
+            if status == JobStatus.QUEUED:
+                job.status, job.stage, job.progress = status, status.value, 0.0
+            else:
+                if result is not None:
+                    self.store.write_result(job.id, result)
+                job.finish(status, error)
+                JOBS.inc(kind=job.kind, status=status.value)
+            self.store.write(job)
+
+    async def _run(self, job: Job, lock_file: LockFile, slot: LockFile) -> None:
+        """Run a claimed job, and record its end. The slot is held until the runner returns."""
+        RUNNING_JOBS.inc()
+        try:
+            task = asyncio.ensure_future(self.runners[job.kind](JobRun(self.store, job)))
+            try:
+                result = await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # The worker itself is cancelled on shutdown, the loop being about to stop
+                task.cancel()
+                self._finish(job, JobStatus.QUEUED)
+                raise
+            except JobCancelled:
+                pass
+            except Exception as exc:
+                logger.exception(f"Job {job.id} failed")
+                await asyncio.to_thread(self._finish, job, JobStatus.FAILED,
+                                        error=f"{type(exc).__name__}: {exc}")
+            else:
+                await asyncio.to_thread(self._finish, job, JobStatus.DONE, result)
+        finally:
+            lock_file.close()
+            slot.close()
+            RUNNING_JOBS.dec()
+
+    async def _dispatch(self) -> None:
+        """Run the queued jobs while this process holds free slots."""
+        runs: t.Set["asyncio.Future[t.Any]"] = set()
+        try:
+            while True:
+                while len(runs) < self.workers:
+                    claimed = await asyncio.to_thread(self._claim)
+                    if claimed is None:
+                        break
+                    runs.add(asyncio.create_task(self._run(*claimed)))
+                # Wait for a submission to this process or the end of a run, or poll the
+                # submissions to the others. Not through wait_for, which swallows the
+                # cancellation of the dispatcher when the event is set at the same time
+                submitted = asyncio.ensure_future(self._submitted.wait())
+                try:
+                    done, _ = await asyncio.wait({submitted, *runs}, timeout=self.poll_interval,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    submitted.cancel()
+                self._submitted.clear()
+                runs -= done
+        finally:
+            for run in runs:
+                run.cancel()
+            await asyncio.gather(*runs, return_exceptions=True)
@@ -0,0 +1,99 @@
+"""Data model of the asynchronous jobs.
+"""
+import hashlib
+import json
+import time
+import typing as t
+from enum import Enum
+
+
+class JobStatus(str, Enum):
+    """Statuses of a job."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED_STATUSES = {JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED}
+
+
+class JobCancelled(Exception):
+    """Raised within a running job once it has been cancelled."""
+
+
+def job_id(kind: str, params: t.Dict[str, t.Any]) -> str:
+    """Return the id of a job, the digest of its kind and parameters, so that the identical
+    submissions made to any worker share the same job."""
+    data = json.dumps([kind, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf8")).hexdigest()
+
+
+class Job:
+    """Long-running computation, polled by its id until its result is fetched."""
+
+    def __init__(self, kind: str, params: t.Dict[str, t.Any],
+                 subscribers: t.Sequence[str] = ()) -> None:
+        """
+        Args:
+            kind (str): The kind of the job, e.g. collation.
+            params (Dict[str, Any]): The parameters of the job.
+            subscribers (Sequence[str]): The users who submitted the job.
+        """
+        self.id = job_id(kind, params)
+        self.kind = kind
+        self.params = params
+        self.subscribers = list(subscribers)
+        self.status = JobStatus.QUEUED
+        # Current step of the job, and the fraction of the job done
+        self.stage = JobStatus.QUEUED.value
+        self.progress = 0.0
+        self.error: t.Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: t.Optional[float] = None
+        self.finished_at: t.Optional[float] = None
+        # Id of the current run of the job, set once a worker runs it
+        self.run_id: t.Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def finish(self, status: JobStatus, error: t.Optional[str] = None) -> None:
+        self.status = status
+        self.stage = status.value
+        if status == JobStatus.DONE:
+            self.progress = 1.0
+        self.error = error
+        self.finished_at = time.time()
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        """Return the status of the job, without its result."""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status.value,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def state(self) -> t.Dict[str, t.Any]:
+        """Return the state of the job, as stored."""
+        return {**self.as_dict(), "progress": self.progress, "subscribers": self.subscribers,
+                "run_id": self.run_id}
+
+    @classmethod
+    def from_state(cls, state: t.Dict[str, t.Any]) -> "Job":
+        """Create a job from its stored state."""
+        job = cls(state["kind"], state["params"], state["subscribers"])
+        job.status = JobStatus(state["status"])
+        for field in ["stage", "progress", "error", "submitted_at", "started_at", "finished_at",
+                      "run_id"]:
+            setattr(job, field, state[field])
+        return job
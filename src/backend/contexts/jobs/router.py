@@ -0,0 +1,109 @@
+"""Endpoints of the asynchronous jobs, running collations too long for the synchronous routes,
+e.g. of whole chapters or traditions.
+"""
+import typing as t
+from fastapi import APIRouter, Depends, Request, Response
+from starlette.status import HTTP_202_ACCEPTED, HTTP_403_FORBIDDEN, HTTP_503_SERVICE_UNAVAILABLE
+from backend.api.admission import AdmissionController
+from backend.api.oidc.provider import check_user
+from backend.api.responses import APIJSONResponse
+from backend.settings.settings import QWB_READ_ROLE, QWB_CLIENT_ID
+from .manager import JobManager, JobQueueFull
+from .models import Job, JobStatus
+
+
+def job_manager(request: Request) -> JobManager:
+    """Access the job manager from a Starlette/FastAPI request"""
+    return request.app.state.jobs
+
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"]
+)
+
+
+def job_response(job: Job, status_code: int = 200) -> APIJSONResponse:
+    return APIJSONResponse(job.as_dict(), status_code=status_code,
+                           headers={"Location": f"{router.prefix}/{job.id}"})
+
+
+@router.post("/collation", status_code=HTTP_202_ACCEPTED)
+async def submit_collation(request: Request,
+                           tradition: str,
+                           reconstructed: bool,
+                           strip_vowels: bool,
+                           chapter: t.Optional[str] = None,
+                           verse: t.Optional[str] = None,
+                           jobs=Depends(job_manager),
+                           user=check_user(expected_roles=[QWB_READ_ROLE],
+                                           client_id=QWB_CLIENT_ID)):
+    """Submit the collation of the parallels of a tradition, and optionally of a chapter and a
+    verse, and return the job performing it. An identical collation being queued, running or
+    retained is returned rather than submitted again, the user being added to its subscribers.
+    The result, fetched from /jobs/{job_id}/result once done, is encoded as the json format of
+    the collation route."""
+    params = {"tradition": tradition, "chapter": chapter, "verse": verse if chapter else None,
+              "reconstructed": reconstructed, "strip_vowels": strip_vowels}
+    try:
+        job = await jobs.submit("collation", params, AdmissionController.user_key(request, user))
+    except JobQueueFull:
+        return Response(status_code=HTTP_503_SERVICE_UNAVAILABLE, content="Too many queued jobs.",
+                        headers={"Retry-After": str(request.app.state.settings.jobs.retry_after)})
+    return job_response(job, HTTP_202_ACCEPTED)
+
+
+@router.get("/{job_id}")
+async def get_job(request: Request,
+                  job_id: str,
+                  wait: float = 0,
+                  jobs=Depends(job_manager),
+                  user=check_user(expected_roles=[QWB_READ_ROLE],
+                                  client_id=QWB_CLIENT_ID)):
+    """Retrieve the status and the progress of a job. When wait is given, wait at most wait
+    seconds for the job to finish before answering."""
+    job = await jobs.wait(job_id, min(wait, request.app.state.settings.jobs.max_wait))
+    if job is None:
+        return Response(status_code=404, content=f"Job {job_id} not found.")
+    return job_response(job)
+
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str,
+                         jobs=Depends(job_manager),
+                         user=check_user(expected_roles=[QWB_READ_ROLE],
+                                         client_id=QWB_CLIENT_ID)):
+    """Retrieve the result of a job once done. The status of the job is returned with a 202
+    while it is queued or running."""
+    job = await jobs.get(job_id)
+    if job is None:
+        return Response(status_code=404, content=f"Job {job_id} not found.")
+    if not job.finished:
+        return job_response(job, HTTP_202_ACCEPTED)
+    if job.status != JobStatus.DONE:
+        error_message = f"Job {job_id} {job.status.value}."
+        if job.error:
+            error_message += f" {job.error}"
+        return Response(status_code=409, content=error_message)
+    result = await jobs.result(job_id)
+    if result is None:
+        return Response(status_code=404, content=f"Result of job {job_id} not found.")
+    return Response(content=result, media_type="application/json")
+
+
+@router.delete("/{job_id}")
+async def cancel_job(request: Request,
+                     job_id: str,
+                     jobs=Depends(job_manager),
+                     user=check_user(expected_roles=[QWB_READ_ROLE],
+                                     client_id=QWB_CLIENT_ID)):
+    """Withdraw the user from the subscribers of a job, i.e. the users who submitted it. The
+    job, whether queued or running, is cancelled once all its subscribers withdrew."""
+    try:
+        job = await jobs.cancel(job_id, AdmissionController.user_key(request, user))
+    except PermissionError:
+        return Response(status_code=HTTP_403_FORBIDDEN,
+                        content=f"Job {job_id} can only be cancelled by the users who submitted it.")
+    if job is None:
+        return Response(status_code=404, content=f"Job {job_id} not found.")
+    return job_response(job)
@@ -0,0 +1,28 @@
+"""Runners of the asynchronous jobs, registered by kind of job.
+"""
+import asyncio
+import typing as t
+
+from backend.api.responses import dumps
+from ..collations.rendering import alignment_matrix
+from .manager import JobRun
+
+
+def collation_runner(database) -> t.Callable[[JobRun], t.Awaitable[bytes]]:
+    """Return the runner of the collation jobs, collating in a thread so that the event loop
+    keeps serving the other requests."""
+    async def run_collation(run: JobRun) -> bytes:
+        params = run.params
+        await run.advance("parallels", 0.1)
+        records = await database.get_parallels_content(name=params["tradition"],
+                                                       chapter=params["chapter"],
+                                                       verse=params["verse"],
+                                                       reconstructed=params["reconstructed"],
+                                                       strip_vowels=params["strip_vowels"])
+        await run.advance("collation", 0.3)
+        table = await asyncio.to_thread(database.collate_parallels, params["tradition"],
+                                        params["chapter"], params["verse"], records)
+        await run.advance("serialization", 0.9)
+        # Retained serialized, as it is fetched as is
+        return await asyncio.to_thread(lambda: dumps(alignment_matrix(table)))
+    return run_collation
@@ -0,0 +1,118 @@
+"""Store of the asynchronous jobs, shared by the worker processes of the API.
+
+The state of each job is a JSON file of a directory shared by the workers, along with its
+result once done, so that a job submitted to any worker is run by any worker, and is polled,
+fetched and cancelled through any worker. The transitions of the states are serialized by an
+exclusive lock of the store. The processes also hold a lock for each job they run, released
+when they exit, from which the jobs of the exited workers are detected, and a lock for each
+slot of the pool of workers, which bounds the number of jobs run at once by all the workers.
+"""
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+import typing as t
+
+from .models import Job
+
+LockFile = t.IO[str]
+
+
+class JobStore:
+    """Directory holding the state and the result of the jobs."""
+
+    def __init__(self, directory: str) -> None:
+        """
+        Args:
+            directory (str): The directory of the store, created if needed.
+        """
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "slots"), exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextlib.contextmanager
+    def lock(self) -> t.Iterator[None]:
+        """Hold the exclusive lock of the store."""
+        with open(self._path("store.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def try_lock(self, name: str) -> t.Optional[LockFile]:
+        """Take a lock of the store without waiting, released once the returned file is closed.
+
+        Returns:
+            Optional[IO]: The locked file, or None if the lock is held elsewhere.
+        """
+        lock_file = open(self._path(name), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def acquire_slot(self, slots: int) -> t.Optional[LockFile]:
+        """Take a free slot of the pool of workers, if any."""
+        for slot in range(slots):
+            lock_file = self.try_lock(os.path.join("slots", f"{slot}.lock"))
+            if lock_file is not None:
+                return lock_file
+        return None
+
+    def lock_run(self, job: Job) -> t.Optional[LockFile]:
+        """Take the lock held while a job runs."""
+        return self.try_lock(f"{job.id}.lock")
+
+    def running(self, job: Job) -> bool:
+        """Whether a process runs a job."""
+        lock_file = self.lock_run(job)
+        if lock_file is None:
+            return True
+        lock_file.close()
+        return False
+
+    def _write(self, name: str, data: bytes) -> None:
+        """Write a file, atomically replacing the previous one."""
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=".job-")
+        with os.fdopen(descriptor, "wb") as job_file:
+            job_file.write(data)
+        os.replace(temporary, self._path(name))
+
+    def read(self, job_id: str) -> t.Optional[Job]:
+        try:
+            with open(self._path(f"{job_id}.json"), encoding="utf8") as job_file:
+                return Job.from_state(json.load(job_file))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write(self, job: Job) -> None:
+        self._write(f"{job.id}.json", json.dumps(job.state()).encode("utf8"))
+
+    def jobs(self) -> t.List[Job]:
+        """Return all the jobs of the store."""
+        jobs = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                job = self.read(name[:-len(".json")])
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def read_result(self, job_id: str) -> t.Optional[bytes]:
+        try:
+            with open(self._path(f"{job_id}.result"), "rb") as result_file:
+                return result_file.read()
+        except FileNotFoundError:
+            return None
+
+    def write_result(self, job_id: str, result: bytes) -> None:
+        self._write(f"{job_id}.result", result)
+
+    def delete(self, job_id: str, state: bool = True) -> None:
+        """Delete the result of a job, and its state unless state is False."""
+        for extension in [".result", ".json", ".lock"] if state else [".result"]:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self._path(f"{job_id}{extension}"))
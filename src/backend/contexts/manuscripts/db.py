@@ -1,8 +1,11 @@
 """DB client to retrieve manuscript data within the QWB-API.
 """
 import typing as t
+from backend.tools.singleflight import singleflight
 from backend.tools.sql_client import SQLClient
+from backend.tools.tracing import span
 from ..manuscripts.models import FOLLOWED_BY_MAPPER
+from .texts import ManuscriptTexts
 
 
 MANUSCRIPT_TABLE = "manuscript_view"
@@ -12,6 +15,10 @@ MANUSCRIPT_LINE_TABLE = "manuscript_line"
 class ManuscriptClient(SQLClient):
     """Manipulate textual data from the SQL database.
     """
+    # Catalog of the columns of each manuscript, and their texts, when loaded from a snapshot
+    catalog: t.Optional[t.Dict[str, t.List[str]]] = None
+    texts: t.Optional[ManuscriptTexts] = None
+
     def check_manuscript_query(self, manuscript_name: str):
         """Build SQL query to check if a manuscript exists in the database.
         """
@@ -71,14 +78,49 @@ class ManuscriptClient(SQLClient):
             SELECT DISTINCT manuscript FROM manuscript_view
             """)
     
+    def catalog_query(self):
+        """List the columns of all manuscripts available within the database.
+        """
+        return self.format_query(f"""
+            SELECT DISTINCT manuscript, `column` FROM {MANUSCRIPT_TABLE}
+            """)
+
+    def manuscript_rows_query(self, manuscript_name: str):
+        """Build SQL query to retrieve the rows of a manuscript along with their column, in
+        the order of the manuscript query.
+        """
+        return self.format_query(f"""
+            SELECT {MANUSCRIPT_TABLE}.manuscript, {MANUSCRIPT_TABLE}.`column`, {MANUSCRIPT_TABLE}.line, {MANUSCRIPT_TABLE}.reading, {MANUSCRIPT_TABLE}.followed_by
+            FROM {MANUSCRIPT_TABLE}
+            WHERE {MANUSCRIPT_TABLE}.manuscript = '{manuscript_name}'
+            AND {MANUSCRIPT_TABLE}.language_id = 1
+            """)
+
+    async def get_manuscript_rows(self, manuscript_names: t.Iterable[str]) -> t.Dict[str, t.List[t.Dict[str, t.Any]]]:
+        """Get the rows of the given manuscripts, by manuscript.
+        """
+        return {name: await self.fetch_dicts(self.manuscript_rows_query(name), "manuscript_rows")
+                for name in manuscript_names}
+
+    async def get_catalog(self) -> t.Dict[str, t.List[str]]:
+        """Get the columns of all manuscripts.
+        """
+        records = await self.fetch_all(self.catalog_query(), "catalog")
+        catalog: t.Dict[str, t.List[str]] = {}
+        for record in records:
+            catalog.setdefault(record["manuscript"], []).append(record["column"])
+        return catalog
+
     async def check_manuscript_exists(self, manuscript_name: str):
         """Check if a manuscript exists within a database.
         """
+        if self.catalog is not None:
+            return manuscript_name in self.catalog
         query = self.check_manuscript_query(manuscript_name=manuscript_name)
-        records = await self.database.fetch_all(query=query)
-        results = [dict(record) for record in records]
+        results = await self.fetch_dicts(query, "manuscript_exists")
         return results[0]["exist"] > 0
 
+    @singleflight
     async def get_manuscript(self,
                              manuscript_name: str,
                              column: t.Optional[str] = None,
@@ -88,9 +130,13 @@ class ManuscriptClient(SQLClient):
         query = self.manuscript_query(manuscript_name=manuscript_name,
                                       column=column, 
                                       line=line)
-        records = await self.database.fetch_all(query=query)
-        results = [dict(record) for record in records]
-        return self.unpack_manuscript_data(results)
+        if self.texts is not None:
+            results = self.texts.records(manuscript_name, column=column, line=line)
+        else:
+            results = await self.fetch_dicts(query, "manuscript")
+        with span("unpack_manuscript_data", manuscript=manuscript_name, column=column, line=line,
+                  rows=len(results)):
+            return self.unpack_manuscript_data(results)
 
     def unpack_manuscript_data(self, records):
         """Unpack the manuscript data into a single string.
@@ -106,15 +152,19 @@ class ManuscriptClient(SQLClient):
                                        attribute: str):
         """List all columns available for a manuscript.
         """
+        if self.catalog is not None and attribute == "column":
+            return list(self.catalog.get(manuscript_name, []))
         query = self.attribute_query(manuscript_name=manuscript_name, attribute=attribute)
-        records = await self.database.fetch_all(query=query)
+        records = await self.fetch_all(query, "manuscript_attribute")
         results = [dict(record)[attribute] for record in records]
         return results
     
     async def get_distinct_manuscripts(self):
         """Get all distinct manuscripts.
         """
+        if self.catalog is not None:
+            return list(self.catalog)
         query = self.distinct_manuscript_query()
-        records = await self.database.fetch_all(query=query)
+        records = await self.fetch_all(query, "manuscripts")
         results = [dict(record)["manuscript"] for record in records]
         return results
\ No newline at end of file
@@ -1,11 +1,11 @@
 """Endpoints for the manipulation of manuscript data.
 """
 import typing as t
-import json
 from fastapi import APIRouter, Depends, Request, Response
 from fastapi.responses import HTMLResponse
 from .models import ManuscriptAttributes
 from backend.api.oidc.provider import check_user
+from backend.api.responses import APIJSONResponse
 from backend.settings.settings import QWB_READ_ROLE, QWB_CLIENT_ID
 
 
@@ -27,8 +27,7 @@ async def get_manuscripts(database=Depends(sql_database),
     """List all manuscripts available.
     """
     manuscripts = await database.get_distinct_manuscripts()
-    return Response(content=json.dumps({"manuscripts": manuscripts}, ensure_ascii=False).encode('utf8'),
-                    media_type="application/json")
+    return APIJSONResponse({"manuscripts": manuscripts})
 
 
 @router.get("/{manuscript_name}")
@@ -54,8 +53,7 @@ async def get_manuscript(manuscript_name: str,
     else:
         response = {manuscript_name: manuscript}
     if manuscript:
-        return Response(content=json.dumps(response, ensure_ascii=False).encode('utf8'),
-                        media_type="application/json")
+        return APIJSONResponse(response)
     else:
         error_message = "Manuscript {} column {} not found.".format(
             manuscript_name, column)
@@ -113,5 +111,4 @@ async def get_manuscript_attributes(manuscript_name: str,
     response = {
         manuscript_name: {attribute: attributes}
     }
-    return Response(content=json.dumps(response, ensure_ascii=False).encode('utf8'),
-                    media_type="application/json")
+    return APIJSONResponse(response)
@@ -0,0 +1,92 @@
+"""Texts of the manuscripts, held in flat arrays shared through the snapshots.
+
+The rows of each manuscript are stored in the order returned by the manuscript query, so that
+the text of a manuscript, or of one of its columns or lines, is unpacked from its rows as when
+queried from the database. Strings are referenced by their index in a table of interned
+strings, shared with the parallel index within a snapshot.
+"""
+import typing as t
+from array import array
+from bisect import bisect_left
+
+from backend.tools.snapshot import NULL, Interner, KeyStrings
+
+# Arrays holding the string fields of the rows
+ROW_FIELDS = {
+    "column": "columns",
+    "line": "lines",
+    "reading": "readings",
+    "followed_by": "followed_by",
+}
+
+
+class ManuscriptTexts:
+    """Rows of the manuscripts, by manuscript."""
+
+    def __init__(self, strings: t.Sequence[str], arrays: t.Dict[str, t.Sequence[int]]) -> None:
+        """
+        Args:
+            strings (Sequence[str]): The table of interned strings.
+            arrays (Dict[str, Sequence[int]]): The flat arrays of the texts, see build. The
+                manuscript_keys array holds the names of the manuscripts sorted by string, and
+                the manuscript_offsets array the range of the rows of each of them.
+        """
+        self.strings = strings
+        self.arrays = arrays
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+    @classmethod
+    def build(cls,
+              manuscripts: t.Mapping[str, t.Iterable[t.Mapping[str, t.Any]]],
+              strings: t.Sequence[str] = ()) -> "ManuscriptTexts":
+        """Build the texts.
+
+        Args:
+            manuscripts (Mapping[str, Iterable[Mapping]]): The rows of each manuscript, with
+                their column, line, reading and followed_by, in the order of the manuscript
+                query.
+            strings (Sequence[str]): The table of strings the strings of the texts are added
+                to, e.g. the one of the parallel index.
+        """
+        intern = Interner(strings)
+        names = sorted(manuscripts)
+        arrays: t.Dict[str, t.Any] = {
+            "manuscript_keys": array("L", (intern(name) for name in names)),
+            "manuscript_offsets": array("Q", [0]),
+            **{name: array("L") for name in ROW_FIELDS.values()},
+        }
+        for name in names:
+            for row in manuscripts[name]:
+                for field, values in ROW_FIELDS.items():
+                    arrays[values].append(intern(row[field]))
+            arrays["manuscript_offsets"].append(len(arrays["readings"]))
+        return cls(intern.strings, arrays)
+
+    def string(self, ix: int) -> t.Optional[str]:
+        """Return the string of the given index."""
+        return None if ix == NULL else self.strings[ix]
+
+    def records(self,
+                manuscript: str,
+                column: t.Optional[str] = None,
+                line: t.Optional[str] = None) -> t.List[t.Dict[str, t.Optional[str]]]:
+        """Return the records of the readings of a manuscript, or of one of its columns or
+        lines, as returned by the manuscript query. The line is ignored when no column is
+        given."""
+        key_strings = KeyStrings(self.manuscript_keys, self.strings)
+        ix = bisect_left(key_strings, manuscript)
+        if ix == len(key_strings) or key_strings[ix] != manuscript:
+            return []
+        records = []
+        for row in range(self.manuscript_offsets[ix], self.manuscript_offsets[ix + 1]):
+            if column and (self.string(self.columns[row]) != column
+                           or line and self.string(self.lines[row]) != line):
+                continue
+            records.append({
+                "manuscript": manuscript,
+                "reading": self.string(self.readings[row]),
+                "followed_by": self.string(self.followed_by[row]),
+                "line": self.string(self.lines[row]),
+            })
+        return records
@@ -1,6 +1,7 @@
 """DB client to retrieve lexicometric information within the QWB-API.
 """
 import typing as t
+from backend.tools.singleflight import singleflight
 from backend.tools.sql_client import SQLClient
 
 class MorphologicalAnalysisClient(SQLClient):
@@ -10,11 +11,16 @@ class MorphologicalAnalysisClient(SQLClient):
     def morphological_analysis_reading_query(self, word_reading_ids: t.List[str]):
         """Build SQL query to retrieve morphological analysis data given a set of word_reading_ids.
         """
+        if self.dialect == "sqlite":
+            # Strip the leading hashes and spaces without regular expressions, missing from SQLite
+            short_definition = "trim(ltrim(`language_lemma`.`main_meaning`, '# '))"
+        else:
+            short_definition = "trim(regexp_replace(`language_lemma`.`main_meaning`, '^[# ]+', ''))"
         return self.format_query(f"""
                 SELECT
                     `language_lemma_form`.`lemma_form` AS `lemma`,
                     `word_class`.`string` AS `word_class`,
-                    trim(regexp_replace(`language_lemma`.`main_meaning`, '^[# ]+', '')) AS `short_definition`,
+                    {short_definition} AS `short_definition`,
                     `language_lemma_form`.`supplement` AS `root_designation`,
                     `verbal_stem`.`string` AS `verb_stem`,
                     `verbal_tempus`.`string` AS `verb_tense`,
@@ -132,11 +138,13 @@ class MorphologicalAnalysisClient(SQLClient):
                                       line: t.Optional[str] = None):
         """Given a word, returns the corresponding readings and their position in the manuscript.
         """
-        return await self.database.fetch_all(query=self.word_readings_query(word=word,
-                                                                            manuscript=manuscript,
-                                                                            column=column,
-                                                                            line=line))
+        return await self.fetch_all(self.word_readings_query(word=word,
+                                                             manuscript=manuscript,
+                                                             column=column,
+                                                             line=line),
+                                    "word_readings")
 
+    @singleflight
     async def get_word_morphological_analysis(self,
                                               word: str,
                                               manuscript: t.Optional[str] = None,
@@ -157,8 +165,9 @@ class MorphologicalAnalysisClient(SQLClient):
             results = []
             for reading_result in word_readings_info:
                 sub_result = {}
-                morphological_results = await self.database.fetch_all(
-                    query=self.morphological_analysis_reading_query(word_reading_ids=[str((reading_result["manuscript_sign_cluster_reading_id"]))])
+                morphological_results = await self.fetch_all(
+                    self.morphological_analysis_reading_query(word_reading_ids=[str((reading_result["manuscript_sign_cluster_reading_id"]))]),
+                    "morphological_analysis"
                     )
                 morphological_info = [dict(result)
                                   for result in morphological_results]
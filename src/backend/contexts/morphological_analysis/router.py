@@ -1,9 +1,9 @@
 """Endpoints to retrieve the lexicometirc analysis of words found within the QWB database.
 """
 import typing as t
-import json
 from fastapi import APIRouter, Request, Depends, Response
 from backend.api.oidc.provider import check_user
+from backend.api.responses import APIJSONResponse
 from backend.settings.settings import QWB_READ_ROLE, QWB_CLIENT_ID
 
 def sql_database(request: Request):
@@ -37,6 +37,4 @@ async def get_word_analysis(word: str,
     if not word_analysis:
         return Response(status_code=404, content=f"No morphological analysis for word {word} at "
                         "the provided location.")
-    return Response(content=json.dumps({word: word_analysis},
-                    ensure_ascii=False).encode('utf8'),
-                    media_type="application/json")
+    return APIJSONResponse({word: word_analysis})
@@ -0,0 +1,125 @@
+"""Snapshot of the corpus shared by the workers of the API.
+
+The parallel index, the catalog of the manuscripts and their texts are written to a snapshot
+file, that each worker opens with mmap. The workers periodically check whether the file has
+been replaced, and swap to the new snapshot when the version of the corpus changed.
+"""
+import asyncio
+import typing as t
+
+from loguru import logger
+
+from backend.tools.snapshot import Snapshot, reopen, write_snapshot
+from backend.tools.sql_client import SQLClient
+from .collations.index import ParallelIndex
+from .manuscripts.texts import ManuscriptTexts
+
+# Prefix of the names of the arrays of the parallel index and of the texts within the snapshot
+INDEX_PREFIX = "parallel_index."
+TEXTS_PREFIX = "manuscripts."
+
+
+def write_corpus_snapshot(path: str,
+                          index: ParallelIndex,
+                          catalog: t.Dict[str, t.List[str]],
+                          texts: t.Optional[ManuscriptTexts] = None) -> str:
+    """Write the snapshot of a corpus given its parallel index, its catalog and the texts of
+    its manuscripts, whose table of strings extends the one of the index.
+
+    Returns:
+        str: The version of the snapshot.
+    """
+    arrays = {f"{INDEX_PREFIX}{name}": values for name, values in index.arrays.items()}
+    if texts is not None:
+        arrays.update({f"{TEXTS_PREFIX}{name}": values for name, values in texts.arrays.items()})
+    return write_snapshot(path, arrays, {"catalog": catalog},
+                          texts.strings if texts is not None else index.strings)
+
+
+def _prefixed_arrays(snapshot: Snapshot, prefix: str) -> t.Dict[str, t.Sequence[int]]:
+    return {name[len(prefix):]: values for name, values in snapshot.arrays.items()
+            if name.startswith(prefix)}
+
+
+class SnapshotClient(SQLClient):
+    """Write and open the snapshots of the corpus. Mixed in with the manuscript and parallels
+    clients, whose catalog, texts and parallel index are loaded from the snapshot.
+    """
+    # Snapshot currently opened
+    snapshot: t.Optional[Snapshot] = None
+
+    async def save_snapshot(self, path: str) -> str:
+        """Write the snapshot of the corpus from the database.
+
+        Args:
+            path (str): The path of the snapshot file, atomically replaced.
+
+        Returns:
+            str: The version of the snapshot.
+        """
+        if self.parallel_index is None:
+            await self.load_parallel_index()
+        catalog = await self.get_catalog()
+        rows = await self.get_manuscript_rows(catalog)
+        texts = await asyncio.to_thread(ManuscriptTexts.build, rows, self.parallel_index.strings)
+        version = await asyncio.to_thread(write_corpus_snapshot, path, self.parallel_index, catalog,
+                                          texts)
+        logger.info(f"Wrote snapshot {path} of version {version}")
+        return version
+
+    async def open_snapshot(self, path: str) -> bool:
+        """Open the snapshot of the corpus if it has been replaced by a new version, and swap
+        the parallel index, the catalog and the texts with the ones of the snapshot. The texts
+        are queried from the database when the snapshot lacks them.
+
+        Returns:
+            bool: Whether a new snapshot has been opened.
+
+        Raises:
+            ValueError: The snapshot is invalid, e.g. written by a previous version.
+        """
+        snapshot = await asyncio.to_thread(reopen, self.snapshot, path)
+        if snapshot is None:
+            return False
+        parallel_index = ParallelIndex.from_snapshot(snapshot.strings,
+                                                     _prefixed_arrays(snapshot, INDEX_PREFIX))
+        texts_arrays = _prefixed_arrays(snapshot, TEXTS_PREFIX)
+        if not texts_arrays:
+            logger.warning(f"Snapshot {path} lacks the texts of the manuscripts, queried from "
+                           f"the database")
+        self.parallel_index = parallel_index
+        self.catalog = snapshot.sections["catalog"]
+        self.texts = ManuscriptTexts(snapshot.strings, texts_arrays) if texts_arrays else None
+        self.snapshot = snapshot
+        await self.refresh_parallels_density()
+        return True
+
+    async def load_snapshot(self, path: str) -> bool:
+        """Open the snapshot of the corpus on startup. The corpus is queried from the database
+        while there is no valid snapshot, e.g. until one written by a previous version is
+        written again.
+
+        Returns:
+            bool: Whether the snapshot has been opened.
+        """
+        try:
+            if await self.open_snapshot(path):
+                return True
+            logger.warning(f"No snapshot found at {path}")
+        except Exception:
+            logger.exception(f"Failed to open snapshot {path}, querying the database instead")
+        return False
+
+    async def watch_snapshot(self, path: str, interval: float):
+        """Periodically swap to the new version of the snapshot.
+
+        Args:
+            path (str): The path of the snapshot file.
+            interval (float): Time, in seconds, between two checks.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.open_snapshot(path)
+            except Exception:
+                logger.exception(f"Failed to open snapshot {path}")
@@ -1,19 +1,132 @@
+import asyncio
+import glob
+import importlib.util
+import os
+import sys
+import tempfile
+import typing as t
+
 import uvicorn
+from loguru import logger
 
-from backend.api.app import create_app
 from backend.settings.settings import APISettings
 
+# Import string of the application factory, so that every worker creates its own application
+APP_FACTORY = "backend.api.app:create_app"
+
+
+def resolve_implementation(name: str, preferred: str, fallback: str) -> str:
+    """Resolve the implementation selected by uvicorn when set to "auto"."""
+    if name != "auto":
+        return name
+    return preferred if importlib.util.find_spec(preferred) is not None else fallback
+
+
+def resolve_workers(workers: t.Union[int, str]) -> int:
+    """Resolve the number of workers, one for each core when set to "auto"."""
+    if workers == "auto":
+        return os.cpu_count() or 1
+    return max(int(workers), 1)
+
+
+def server_options(api_settings: APISettings) -> t.Dict[str, t.Any]:
+    """Build the options of the uvicorn server from the API settings."""
+    return {
+        "host": api_settings.host,
+        "port": api_settings.port,
+        "workers": resolve_workers(api_settings.workers),
+        "loop": resolve_implementation(api_settings.loop, "uvloop", "asyncio"),
+        "http": resolve_implementation(api_settings.http, "httptools", "h11"),
+        "backlog": api_settings.backlog,
+        "timeout_keep_alive": api_settings.timeout_keep_alive,
+        "timeout_graceful_shutdown": api_settings.timeout_graceful_shutdown,
+    }
+
+
+def share_metrics(workers: int) -> t.Optional[str]:
+    """Set up the directory through which the workers aggregate their metrics, when the metrics
+    are enabled and served by several workers. The directory is created unless given by
+    METRICS_DIRECTORY, and the files of a previous run are removed from it.
+
+    Returns:
+        Optional[str]: The path of the directory, if any.
+    """
+    from backend.api.metrics import MetricsSettings
+    settings = MetricsSettings()
+    if not settings.enabled or workers <= 1:
+        return None
+    directory = settings.directory or tempfile.mkdtemp(prefix="qwb-api-metrics-")
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.unlink(path)
+    # Inherited by the workers
+    os.environ["METRICS_DIRECTORY"] = directory
+    return directory
+
+
+def share_jobs(workers: int) -> t.Optional[str]:
+    """Set up the directory through which the workers share the asynchronous jobs, when served
+    by several workers. The directory is created unless given by JOBS_DIRECTORY.
+
+    Returns:
+        Optional[str]: The path of the directory, if any.
+    """
+    if workers <= 1:
+        return None
+    directory = os.environ.get("JOBS_DIRECTORY") or tempfile.mkdtemp(prefix="qwb-api-jobs-")
+    # Inherited by the workers
+    os.environ["JOBS_DIRECTORY"] = directory
+    return directory
+
 
 def main():
     # TODO: parse settings from YAML files
     api_settings = APISettings()
+    options = server_options(api_settings)
+    share_metrics(options["workers"])
+    share_jobs(options["workers"])
+    logger.info("Starting the API with " + ", ".join(f"{key}={value}" for key, value in options.items()))
     uvicorn.run(
-        port=api_settings.port,
-        host=api_settings.host,
+        APP_FACTORY,
         factory=True,
-        app=create_app,
+        **options,
     )
 
 
+async def write_snapshot(path: str) -> str:
+    """Write the snapshot of the corpus from the database."""
+    from backend.api.app import AppSettings
+    from backend.contexts import APISQLClient
+    settings = AppSettings()
+    db = APISQLClient(settings.database_uri, settings.database_name)
+    await db.connect()
+    try:
+        return await db.save_snapshot(path)
+    finally:
+        await db.database.disconnect()
+
+
+def snapshot():
+    """Write the snapshot of the corpus to the path given as argument, or else to the path of
+    the snapshot settings. Workers opening this path swap to the new snapshot once written.
+    """
+    from backend.api.app import AppSettings
+    path = sys.argv[1] if len(sys.argv) > 1 else AppSettings().snapshot.path
+    if not path:
+        sys.exit("Usage: qwb-api-snapshot PATH")
+    print(asyncio.run(write_snapshot(path)))
+
+
+def load_sqlite():
+    """Load the MySQL dumps given as arguments into the SQLite database given as first argument,
+    so that it stands in for the QWB database.
+    """
+    from backend.tools.sqlite import load_dumps
+    if len(sys.argv) < 3:
+        sys.exit("Usage: qwb-api-load-sqlite DATABASE DUMP [DUMP ...]")
+    counts = load_dumps(sys.argv[1], sys.argv[2:])
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+
+
 if __name__ == "__main__":
     main()
@@ -1,13 +1,28 @@
 """Settings for lauching the API.
 """
-from pydantic_settings import BaseSettings
+import typing as t
+
+from pydantic import AliasChoices, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 
 class APISettings(BaseSettings):
-    port: int = 8000
-    host: str = "127.0.0.1"
+    model_config = SettingsConfigDict(env_prefix="SERVER_")
+
+    # PORT and HOST are still read for the deployments predating the prefix
+    port: int = Field(8000, validation_alias=AliasChoices("server_port", "port"))
+    host: str = Field("127.0.0.1", validation_alias=AliasChoices("server_host", "host"))
+    # Number of worker processes, "auto" runs one for each core
+    workers: t.Union[int, t.Literal["auto"]] = "auto"
+    # Event loop and HTTP protocol implementations, "auto" selects uvloop and httptools
+    # when installed
+    loop: t.Literal["auto", "asyncio", "uvloop"] = "auto"
+    http: t.Literal["auto", "h11", "httptools"] = "auto"
+    backlog: int = 2048
+    timeout_keep_alive: int = 5
+    timeout_graceful_shutdown: t.Optional[int] = 30
 
 
 QWB_CLIENT_ID = "qwb-api"
-QWB_READ_ROLE = "read"
\ No newline at end of file
+QWB_READ_ROLE = "read"
@@ -0,0 +1,133 @@
+"""Parser of the rows of MySQL dumps, as written by mysqldump or phpMyAdmin.
+
+Only the INSERT statements are read, so that the dumps can be used without a MySQL server,
+e.g., as fixtures of the benchmarks.
+"""
+import re
+import typing as t
+
+INSERT_PATTERN = re.compile(
+    r"INSERT\s+INTO\s+`(?P<table>[^`]+)`\s*(?:\((?P<columns>[^)]*)\))?\s*VALUES\s*", re.IGNORECASE
+)
+# A single value of a row: a quoted string, NULL or a number
+VALUE_PATTERN = re.compile(r"\s*(?:'(?P<string>(?:[^'\\]|\\.|'')*)'|(?P<null>NULL)|(?P<number>[-+0-9.eE]+))\s*",
+                           re.IGNORECASE | re.DOTALL)
+ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+ESCAPE_PATTERN = re.compile(r"\\(.)|''", re.DOTALL)
+
+Row = t.Tuple[t.Any, ...]
+
+
+class DumpError(ValueError):
+    """Raised when a dump can not be parsed."""
+
+
+def unescape(value: str) -> str:
+    """Unescape a MySQL string literal."""
+    if "\\" not in value and "''" not in value:
+        return value
+    return ESCAPE_PATTERN.sub(
+        lambda match: "'" if match.group(1) is None else ESCAPES.get(match.group(1), match.group(1)),
+        value
+    )
+
+
+def parse_number(value: str) -> t.Union[int, float]:
+    """Parse a MySQL numeric literal."""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_rows(text: str, position: int) -> t.Tuple[t.List[Row], int]:
+    """Parse the rows of an INSERT statement, starting at the opening parenthesis of the first
+    row, and return them along with the position following the statement."""
+    rows = []
+    while True:
+        if text[position] != "(":
+            raise DumpError(f"Expected a row at position {position}")
+        position += 1
+        row = []
+        while True:
+            match = VALUE_PATTERN.match(text, position)
+            if match is None:
+                raise DumpError(f"Invalid value at position {position}")
+            if match.group("string") is not None:
+                row.append(unescape(match.group("string")))
+            elif match.group("null") is not None:
+                row.append(None)
+            else:
+                row.append(parse_number(match.group("number")))
+            position = match.end()
+            if text[position] == ",":
+                position += 1
+            elif text[position] == ")":
+                position += 1
+                break
+            else:
+                raise DumpError(f"Expected a separator at position {position}")
+        rows.append(tuple(row))
+        while text[position].isspace():
+            position += 1
+        if text[position] == ";":
+            return rows, position + 1
+        if text[position] != ",":
+            raise DumpError(f"Expected a separator at position {position}")
+        position += 1
+        while text[position].isspace():
+            position += 1
+
+
+def iter_inserts(text: str) -> t.Iterator[t.Tuple[str, t.Optional[t.List[str]], t.List[Row]]]:
+    """Iterate over the INSERT statements of a dump, as the name of the table, the names of the
+    columns when given, and the rows."""
+    position = 0
+    while True:
+        match = INSERT_PATTERN.search(text, position)
+        if match is None:
+            return
+        columns = None
+        if match.group("columns") is not None:
+            columns = [column.strip().strip("`") for column in match.group("columns").split(",")]
+        rows, position = parse_rows(text, match.end())
+        yield match.group("table"), columns, rows
+
+
+def iter_file_inserts(path: str) -> t.Iterator[t.Tuple[str, t.Optional[t.List[str]], t.List[Row]]]:
+    """Iterate over the INSERT statements of a dump file, reading one statement at a time so
+    that large dumps are not held in memory."""
+    with open(path, encoding="utf8") as file:
+        statement: t.List[str] = []
+        for line in file:
+            if not statement and not INSERT_PATTERN.match(line):
+                continue
+            statement.append(line)
+            if not line.rstrip().endswith(";"):
+                continue
+            try:
+                inserts = list(iter_inserts("".join(statement)))
+            except (DumpError, IndexError):
+                # The statement ends within a string value spanning several lines
+                continue
+            statement = []
+            yield from inserts
+        if statement:
+            raise DumpError(f"Truncated INSERT statement at the end of {path}")
+
+
+def load_dump(path: str) -> t.Dict[str, t.List[t.Dict[str, t.Any]]]:
+    """Load the rows of every table of a dump as dictionaries.
+
+    Args:
+        path (str): The path of the SQL dump.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: The rows of each table.
+    """
+    tables: t.Dict[str, t.List[t.Dict[str, t.Any]]] = {}
+    for table, columns, rows in iter_file_inserts(path):
+        if columns is None:
+            raise DumpError(f"The columns of table {table} are not named")
+        tables.setdefault(table, []).extend(dict(zip(columns, row)) for row in rows)
+    return tables
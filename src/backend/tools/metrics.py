@@ -0,0 +1,283 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Counters, gauges and histograms are registered in a registry, rendered on demand, without
+any external collector. Gauges may also be computed when rendered, from a callback.
+
+When the API runs several worker processes, each worker periodically writes the values of its
+metrics to a directory shared by the workers, and the worker answering a scrape renders the
+metrics aggregated from all the files: counters and histograms are summed over all the
+processes, including the ones which exited, and gauges according to their multiprocess mode.
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import typing as t
+
+LabelValues = t.Tuple[str, ...]
+
+# Default buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Default buckets of the size histograms
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: t.Sequence[str], values: t.Sequence[str]) -> str:
+    """Format a set of labels."""
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    """Base class of the metrics, holding a value for each combination of label values."""
+    type = "untyped"
+    # How the values of the processes are aggregated: "sum" sums the values of all the
+    # processes, "livesum" those of the live processes, and "all" labels the values of the
+    # live processes with their pid
+    multiprocess_mode = "sum"
+
+    def __init__(self, name: str, documentation: str, labels: t.Sequence[str] = (),
+                 registry: t.Optional["Registry"] = None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: t.Dict[LabelValues, t.Any] = {}
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: t.Mapping[str, t.Any]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} expects labels {self.label_names}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def values(self) -> t.Dict[LabelValues, t.Any]:
+        """Return a copy of the value of each combination of label values."""
+        with self._lock:
+            return {key: value if not isinstance(value, list) else list(value)
+                    for key, value in self._values.items()}
+
+    def merge(self, key: LabelValues, value: t.Any) -> None:
+        """Add the value of another process to the value of a combination of label values."""
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self) -> t.Iterator[t.Tuple[str, t.Sequence[str], LabelValues, float]]:
+        """Yield the samples of the metric, as name suffix, label names, label values and
+        value."""
+        for key, value in self.values().items():
+            yield "", self.label_names, key, value
+
+    def render(self) -> t.List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing value."""
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: t.Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value going up and down, or computed from a callback returning the value of each
+    combination of label values."""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: t.Sequence[str] = (),
+                 registry: t.Optional["Registry"] = None,
+                 callback: t.Optional[t.Callable[[], t.Mapping[LabelValues, float]]] = None,
+                 multiprocess_mode: str = "livesum") -> None:
+        super().__init__(name, documentation, labels, registry)
+        self.callback = callback
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value: float, **labels: t.Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: t.Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: t.Any) -> None:
+        self.inc(-amount, **labels)
+
+    def values(self):
+        if self.callback is None:
+            return super().values()
+        return {tuple(str(label) for label in key): value for key, value in self.callback().items()}
+
+
+class Histogram(Metric):
+    """Distribution of observed values within cumulative buckets."""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: t.Sequence[str] = (),
+                 registry: t.Optional["Registry"] = None,
+                 buckets: t.Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels: t.Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Count of each bucket, followed by the sum of the values
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for ix, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[ix] += 1
+                    break
+            counts[-1] += value
+
+    def merge(self, key, value):
+        with self._lock:
+            counts = self._values.setdefault(key, [0] * len(self.buckets) + [0.0])
+            for ix, count in enumerate(value):
+                counts[ix] += count
+
+    def samples(self):
+        names = self.label_names + ("le",)
+        for key, counts in self.values().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield "_bucket", names, key + (_format_value(bound),), cumulative
+            yield "_sum", self.label_names, key, counts[-1]
+            yield "_count", self.label_names, key, cumulative
+
+
+class Registry:
+    """Set of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self.metrics: t.Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def unregister(self, name: str) -> None:
+        self.metrics.pop(name, None)
+
+    def render(self) -> str:
+        """Render all the metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registry of the metrics of the API
+REGISTRY = Registry()
+
+
+def _alive(pid: int) -> bool:
+    """Whether a process is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsDirectory:
+    """Directory through which the worker processes share the values of their metrics, each
+    process writing them to its own file."""
+
+    def __init__(self, path: str, registries: t.Sequence[Registry]) -> None:
+        """
+        Args:
+            path (str): The path of the directory, shared by the processes.
+            registries (Sequence[Registry]): The registries of the metrics of this process.
+        """
+        self.path = path
+        self.registries = registries
+        os.makedirs(path, exist_ok=True)
+
+    def write(self) -> None:
+        """Write the values of the metrics of this process, atomically replacing the
+        previous ones."""
+        metrics = {}
+        for registry in self.registries:
+            for name, metric in registry.metrics.items():
+                metrics[name] = {
+                    "type": metric.type,
+                    "documentation": metric.documentation,
+                    "labels": metric.label_names,
+                    "mode": metric.multiprocess_mode,
+                    "buckets": getattr(metric, "buckets", ())[:-1],
+                    "values": [[key, value] for key, value in metric.values().items()],
+                }
+        descriptor, temporary = tempfile.mkstemp(dir=self.path, prefix=".metrics-")
+        with os.fdopen(descriptor, "w") as metrics_file:
+            json.dump(metrics, metrics_file)
+        os.replace(temporary, os.path.join(self.path, f"{os.getpid()}.json"))
+
+    def collect(self) -> Registry:
+        """Return the registry of the metrics aggregated from the files of all the
+        processes."""
+        registry = Registry()
+        for file_name in sorted(os.listdir(self.path)):
+            pid, extension = os.path.splitext(file_name)
+            if extension != ".json" or not pid.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.path, file_name)) as metrics_file:
+                    metrics = json.load(metrics_file)
+            except (OSError, ValueError):
+                continue
+            alive = _alive(int(pid))
+            for name, data in metrics.items():
+                if data["mode"] != "sum" and not alive:
+                    continue
+                labels = list(data["labels"]) + (["pid"] if data["mode"] == "all" else [])
+                metric = registry.metrics.get(name)
+                if metric is None:
+                    options = {"buckets": data["buckets"]} if data["type"] == Histogram.type else {}
+                    metric = METRIC_TYPES[data["type"]](name, data["documentation"], labels,
+                                                        registry=registry, **options)
+                for key, value in data["values"]:
+                    metric.merge(tuple(key) + ((pid,) if data["mode"] == "all" else ()), value)
+        return registry
+
+    def render(self) -> str:
+        """Render the metrics aggregated from all the processes, including the current values
+        of this process, in the Prometheus text format."""
+        self.write()
+        return self.collect().render()
+
+
+METRIC_TYPES: t.Dict[str, t.Type[Metric]] = {
+    "counter": Counter,
+    "gauge": Gauge,
+    "histogram": Histogram,
+}
@@ -0,0 +1,97 @@
+"""MessagePack encoding of the JSON-like payloads of the API.
+
+Payloads are encoded with msgpack when it is installed, and otherwise with a minimal encoder
+supporting the types produced by the API: None, booleans, integers, floats, strings, bytes,
+lists, tuples and dictionaries.
+"""
+import struct
+import typing as t
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class MessagePackError(ValueError):
+    """Raised when a value can not be encoded."""
+
+
+# Type byte of the fixed size variant, maximum size of that variant, and limit, struct format
+# and type byte of the other variants, of the sized types
+Header = t.Tuple[int, int, t.Sequence[t.Tuple[int, str, int]]]
+_STR: Header = (0xA0, 0x20, [(0xFF, ">BB", 0xD9), (0xFFFF, ">BH", 0xDA), (0xFFFFFFFF, ">BI", 0xDB)])
+_BIN: Header = (0, 0, [(0xFF, ">BB", 0xC4), (0xFFFF, ">BH", 0xC5), (0xFFFFFFFF, ">BI", 0xC6)])
+_ARRAY: Header = (0x90, 0x10, [(0xFFFF, ">BH", 0xDC), (0xFFFFFFFF, ">BI", 0xDD)])
+_MAP: Header = (0x80, 0x10, [(0xFFFF, ">BH", 0xDE), (0xFFFFFFFF, ">BI", 0xDF)])
+# Limit, struct format and type byte of the unsigned and of the negative integers
+_UINT = [(0xFF, ">BB", 0xCC), (0xFFFF, ">BH", 0xCD), (0xFFFFFFFF, ">BI", 0xCE),
+         (0xFFFFFFFFFFFFFFFF, ">BQ", 0xCF)]
+_INT = [(0x80, ">Bb", 0xD0), (0x8000, ">Bh", 0xD1), (0x80000000, ">Bi", 0xD2),
+        (0x8000000000000000, ">Bq", 0xD3)]
+
+
+def _header(size: int, header: Header) -> bytes:
+    """Encode the type and the size of a string, bytes, array or map."""
+    fixed, fixed_size, variants = header
+    if size < fixed_size:
+        return struct.pack("B", fixed | size)
+    for limit, value_format, code in variants:
+        if size <= limit:
+            return struct.pack(value_format, code, size)
+    raise MessagePackError(f"Value of size {size} too large")
+
+
+def _pack_int(value: int) -> bytes:
+    if -0x20 <= value < 0x80:
+        return struct.pack("b" if value < 0 else "B", value)
+    for limit, value_format, code in (_UINT if value >= 0 else _INT):
+        if abs(value) <= limit:
+            return struct.pack(value_format, code, value)
+    raise MessagePackError(f"Integer out of range: {value}")
+
+
+def _pack(value: t.Any, chunks: t.List[bytes]) -> None:
+    """Append the encoding of a value to a list of chunks."""
+    append = chunks.append
+    if value is None:
+        append(b"\xc0")
+    elif isinstance(value, bool):
+        append(b"\xc3" if value else b"\xc2")
+    elif isinstance(value, int):
+        append(_pack_int(value))
+    elif isinstance(value, float):
+        append(struct.pack(">Bd", 0xCB, value))
+    elif isinstance(value, str):
+        data = value.encode("utf8")
+        append(_header(len(data), _STR))
+        append(data)
+    elif isinstance(value, (bytes, bytearray)):
+        append(_header(len(value), _BIN))
+        append(bytes(value))
+    elif isinstance(value, (list, tuple)):
+        append(_header(len(value), _ARRAY))
+        for item in value:
+            _pack(item, chunks)
+    elif isinstance(value, dict):
+        append(_header(len(value), _MAP))
+        for key, item in value.items():
+            _pack(key, chunks)
+            _pack(item, chunks)
+    else:
+        raise MessagePackError(f"Can not encode value of type {type(value).__name__}")
+
+
+def _packb(value: t.Any) -> bytes:
+    """Encode a value as MessagePack with the minimal encoder."""
+    chunks: t.List[bytes] = []
+    _pack(value, chunks)
+    return b"".join(chunks)
+
+
+if msgpack is not None:
+    def packb(value: t.Any) -> bytes:
+        """Encode a value as MessagePack."""
+        return msgpack.packb(value, use_bin_type=True)
+else:  # pragma: no cover
+    packb = _packb
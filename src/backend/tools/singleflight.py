@@ -0,0 +1,107 @@
+"""Coalescing of identical concurrent calls.
+
+When many clients request the same resource at once, e.g. a newly shared collation, the
+first call runs the computation and the concurrent identical calls await its result rather
+than running it again. The computation runs in its own task, so that a cancelled caller, e.g.
+a dropped client, does not abort the callers still waiting for it: the computation is only
+cancelled once every caller has gone. Results are not kept once the computation ends.
+"""
+import asyncio
+import functools
+import inspect
+import typing as t
+
+from .metrics import Counter
+
+COALESCED_CALLS = Counter("qwb_coalesced_calls_total",
+                          "Number of calls served by the computation of an identical concurrent call.",
+                          ["function"])
+
+T = t.TypeVar("T")
+
+
+class Flight:
+    """Computation shared by concurrent callers."""
+
+    def __init__(self, task: "asyncio.Task[t.Any]") -> None:
+        self.task = task
+        self.callers = 0
+
+
+class SingleFlight:
+    """Run at most one computation at a time for each key."""
+
+    def __init__(self) -> None:
+        self._flights: t.Dict[t.Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def __contains__(self, key: t.Hashable) -> bool:
+        return key in self._flights
+
+    async def do(self, key: t.Hashable, compute: t.Callable[[], t.Awaitable[T]]) -> T:
+        """Return the result of the computation of a key, starting it unless already in flight.
+
+        Args:
+            key (Hashable): The key of the computation.
+            compute (Callable[[], Awaitable]): The computation, only called when no
+                computation of the key is in flight.
+
+        Returns:
+            The result of the computation, its exception being raised to every caller.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(asyncio.ensure_future(compute()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(functools.partial(self._land, key, flight))
+        flight.callers += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.callers == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.callers -= 1
+
+    def _land(self, key: t.Hashable, flight: Flight, task: "asyncio.Task[t.Any]") -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Retrieve the exception of computations whose callers were all cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+def freeze(value: t.Any) -> t.Hashable:
+    """Turn an argument into a hashable key."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def singleflight(method: t.Callable[..., t.Awaitable[T]]) -> t.Callable[..., t.Awaitable[T]]:
+    """Coalesce the identical concurrent calls of a method of a client.
+
+    The calls are keyed by their arguments bound to the signature of the method, with the
+    defaults applied, so that positional and keyword calls with the same values are coalesced.
+    """
+    signature = inspect.signature(method)
+    name = method.__qualname__
+
+    @functools.wraps(method)
+    async def coalesced(self, *args, **kwargs) -> T:
+        flights = self.__dict__.get("_single_flights")
+        if flights is None:
+            flights = self.__dict__.setdefault("_single_flights", SingleFlight())
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (name, freeze(dict(list(bound.arguments.items())[1:])))
+        if key in flights:
+            COALESCED_CALLS.inc(function=name)
+        return await flights.do(key, lambda: method(self, *args, **kwargs))
+
+    return coalesced
@@ -0,0 +1,224 @@
+"""Snapshot files holding flat integer arrays, a table of strings and JSON sections, opened
+with mmap so that a single physical copy of the arrays and strings is shared by all the
+processes opening the same file.
+
+A snapshot file is made of:
+    - the magic bytes,
+    - the size of the header, as an unsigned little-endian 64 bits integer,
+    - the JSON header, giving the version of the snapshot, its sections and the type, offset
+      and length of each array,
+    - the data of the arrays, each aligned on 8 bytes.
+
+Snapshots are written to a temporary file which then atomically replaces the previous one,
+so that readers always see a complete snapshot.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import typing as t
+from array import array
+
+from loguru import logger
+
+MAGIC = b"QWBSNAP1"
+ALIGNMENT = 8
+# Name of the arrays holding the table of strings
+STRING_DATA = "__string_data"
+STRING_OFFSETS = "__string_offsets"
+# Index of None within the arrays of indexes of strings
+NULL = 0xFFFFFFFF
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is invalid."""
+
+
+def _padding(size: int) -> int:
+    """Return the number of bytes to add after size bytes to keep the alignment."""
+    return -size % ALIGNMENT
+
+
+def write_snapshot(path: str,
+                   arrays: t.Mapping[str, array],
+                   sections: t.Mapping[str, t.Any],
+                   strings: t.Sequence[str] = (),
+                   version: t.Optional[str] = None) -> str:
+    """Write a snapshot file, atomically replacing the previous one.
+
+    Args:
+        path (str): The path of the snapshot file.
+        arrays (Mapping[str, array]): The arrays of the snapshot.
+        sections (Mapping[str, Any]): The JSON serializable sections of the snapshot.
+        strings (Sequence[str]): The table of strings of the snapshot.
+        version (Optional[str]): The version of the snapshot. Defaults to the digest of its
+            content.
+
+    Returns:
+        str: The version of the snapshot.
+    """
+    encoded = [string.encode("utf8") for string in strings]
+    string_offsets = array("Q", [0])
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+    arrays = {**arrays, STRING_DATA: array("B", b"".join(encoded)), STRING_OFFSETS: string_offsets}
+    sections_data = json.dumps(sections, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    if version is None:
+        digest = hashlib.sha1(sections_data.encode("utf8"))
+        for name in sorted(arrays):
+            digest.update(name.encode("utf8"))
+            digest.update(arrays[name].tobytes())
+        version = digest.hexdigest()
+    descriptors = {}
+    offset = 0
+    for name, values in arrays.items():
+        descriptors[name] = [values.typecode, values.itemsize, offset, len(values)]
+        offset += len(values) * values.itemsize
+        offset += _padding(offset)
+    header_data = json.dumps({"version": version, "arrays": descriptors, "sections": sections},
+                             ensure_ascii=False, separators=(",", ":")).encode("utf8")
+    header_data += b" " * _padding(len(MAGIC) + 8 + len(header_data))
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(descriptor, "wb") as snapshot_file:
+            snapshot_file.write(MAGIC)
+            snapshot_file.write(struct.pack("<Q", len(header_data)))
+            snapshot_file.write(header_data)
+            for values in arrays.values():
+                data = values.tobytes()
+                snapshot_file.write(data)
+                snapshot_file.write(b"\0" * _padding(len(data)))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return version
+
+
+class Interner:
+    """Table of interned strings, built along with the arrays referencing them."""
+
+    def __init__(self, strings: t.Iterable[str] = ()) -> None:
+        """
+        Args:
+            strings (Iterable[str]): The strings the table starts with, at the same indexes,
+                e.g. the table of strings of another set of arrays.
+        """
+        self.strings: t.List[str] = []
+        self.ids: t.Dict[str, int] = {}
+        for string in strings:
+            self.ids.setdefault(string, len(self.strings))
+            self.strings.append(string)
+
+    def __call__(self, value: t.Optional[str]) -> int:
+        """Return the index of a string, adding it to the table if needed."""
+        if value is None:
+            return NULL
+        if value not in self.ids:
+            self.ids[value] = len(self.strings)
+            self.strings.append(sys.intern(str(value)))
+        return self.ids[value]
+
+
+class KeyStrings(t.Sequence[str]):
+    """Strings of an array of indexes of strings, bisected to look the strings up when the
+    array is sorted by string."""
+
+    def __init__(self, keys: t.Sequence[int], strings: t.Sequence[str]) -> None:
+        self.keys = keys
+        self.strings = strings
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __getitem__(self, ix):
+        return self.strings[self.keys[ix]]
+
+
+class StringTable(t.Sequence[str]):
+    """Table of strings decoded on access from the data of a snapshot."""
+
+    def __init__(self, data: memoryview, offsets: t.Sequence[int]) -> None:
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, ix):
+        if isinstance(ix, slice):
+            return [self[position] for position in range(*ix.indices(len(self)))]
+        return bytes(self.data[self.offsets[ix]:self.offsets[ix + 1]]).decode("utf8")
+
+
+class Snapshot:
+    """Snapshot file opened with mmap. Its arrays are zero copy views of the file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): The path of the snapshot file.
+
+        Raises:
+            SnapshotError: The file is not a valid snapshot.
+        """
+        self.path = path
+        with open(path, "rb") as snapshot_file:
+            self.stat = os.fstat(snapshot_file.fileno())
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot file")
+        header_size, = struct.unpack_from("<Q", buffer, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(buffer[start:start + header_size]))
+        start += header_size
+        self.version: str = header["version"]
+        self.sections: t.Dict[str, t.Any] = header["sections"]
+        self.arrays: t.Dict[str, memoryview] = {}
+        for name, (typecode, itemsize, offset, length) in header["arrays"].items():
+            if array(typecode).itemsize != itemsize:
+                raise SnapshotError(f"Array {name} of {path} has an incompatible item size")
+            view = buffer[start + offset:start + offset + length * itemsize]
+            self.arrays[name] = view.cast(typecode) if typecode != "B" else view
+        self.strings = StringTable(self.arrays.pop(STRING_DATA), self.arrays.pop(STRING_OFFSETS))
+
+    def changed(self) -> bool:
+        """Whether the snapshot file has been replaced since it was opened."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) != \
+            (self.stat.st_ino, self.stat.st_mtime_ns, self.stat.st_size)
+
+
+def reopen(snapshot: t.Optional[Snapshot], path: str) -> t.Optional[Snapshot]:
+    """Open the snapshot file if it has been replaced by a snapshot of another version.
+
+    Args:
+        snapshot (Optional[Snapshot]): The currently opened snapshot, if any.
+        path (str): The path of the snapshot file.
+
+    Returns:
+        Optional[Snapshot]: The new snapshot, or None if the current one is up to date or if
+            there is no snapshot file.
+    """
+    if snapshot is not None and not snapshot.changed():
+        return None
+    if not os.path.exists(path):
+        return None
+    new_snapshot = Snapshot(path)
+    if snapshot is not None and new_snapshot.version == snapshot.version:
+        snapshot.stat = new_snapshot.stat
+        return None
+    logger.info(f"Opened snapshot {path} of version {new_snapshot.version}")
+    return new_snapshot
@@ -0,0 +1,139 @@
+"""Load MySQL dumps of the QWB database into a SQLite database.
+
+The SQLite database stands in for MariaDB, e.g., to test or benchmark the API end to end
+without any outside service:
+```
+qwb-api-load-sqlite data/QD.sqlite deploy/dump/test_dump.sql
+DATABASE_URI=sqlite:///data DATABASE_NAME=QD.sqlite qwb-api
+```
+The tables queried by the API and missing from the dumps are created empty.
+"""
+import os
+import sqlite3
+import typing as t
+
+from .dump import DumpError, iter_file_inserts
+
+# Columns of the tables and views queried by the API
+SCHEMA: t.Dict[str, t.List[str]] = {
+    "manuscript_view": [
+        "manuscript", "column", "line", "reading", "followed_by", "sequence_in_line",
+        "default_language_id", "language_id", "manuscript_id", "manuscript_column_id",
+        "manuscript_line_id", "manuscript_sign_cluster_id", "manuscript_sign_cluster_reading_id",
+        "sequence_of_reading", "position_in_reference", "is_public", "system_user_id",
+        "unique_ordered_id",
+    ],
+    "manuscript_sign_cluster": ["manuscript_sign_cluster_id", "is_fully_reconstructed"],
+    "manuscript_sign_cluster_reading": ["manuscript_sign_cluster_reading_id", "reading"],
+    "parallel_phrase_group_view": [
+        "anchor_reading_id", "manuscript_sign_cluster_reading_id", "parallel_phrase_id",
+    ],
+    "parallel_word_of_phrase": ["parallel_phrase_id", "manuscript_sign_cluster_reading_id"],
+    "language_sign_cluster_reading_parsing": [
+        "manuscript_sign_cluster_reading_id", "element_sequence", "language_lemma_id",
+        "language_verbal_stem_id", "verbal_tempus", "person", "gender", "number", "status",
+        "augment", "suffix_person", "suffix_gender", "suffix_number",
+    ],
+    "language_lemma": ["language_lemma_id", "language_word_class_id", "main_meaning"],
+    "language_lemma_form": ["language_lemma_id", "lemma_form", "supplement", "is_main"],
+    "language_word_class": ["language_word_class_id", "i18n_string_id"],
+    "i18n_view_localized_string": ["string_id", "language_id", "string"],
+    "i18n_view_language": ["language_id", "iso_639_1"],
+    "i18n_localized_string": ["i18n_localized_string_id", "i18n_language_id", "string"],
+    "language_verbal_stem": ["language_verbal_stem_id", "i18n_string_id"],
+    "language_verbal_tempus_definition": ["language_verbal_tempus_definition_id", "i18n_string_id"],
+    "language_person_definition": ["language_person_definition_id", "i18n_string_id"],
+    "language_gender_definition": ["language_gender_definition_id", "i18n_string_id"],
+    "language_number_definition": ["language_number_definition_id", "i18n_string_id"],
+    "language_status_definition": ["language_status_definition_id", "i18n_string_id"],
+    "language_augment_definition": ["language_augment_definition_id", "i18n_string_id"],
+}
+
+# Indexes backing the joins and the filters of the queries, as table and columns
+INDEXES: t.List[t.Tuple[str, t.Tuple[str, ...]]] = [
+    ("manuscript_view", ("manuscript", "column", "line")),
+    ("manuscript_view", ("manuscript_sign_cluster_reading_id",)),
+    ("manuscript_view", ("unique_ordered_id",)),
+    ("manuscript_sign_cluster", ("manuscript_sign_cluster_id",)),
+    ("manuscript_sign_cluster_reading", ("reading",)),
+    ("parallel_phrase_group_view", ("anchor_reading_id",)),
+    ("parallel_phrase_group_view", ("manuscript_sign_cluster_reading_id",)),
+    ("parallel_word_of_phrase", ("parallel_phrase_id",)),
+    ("language_sign_cluster_reading_parsing", ("manuscript_sign_cluster_reading_id",)),
+]
+
+
+def quote(identifier: str) -> str:
+    """Quote an SQL identifier."""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def create_table(connection: sqlite3.Connection, table: str, columns: t.Sequence[str]) -> None:
+    """Create a table, adding the columns it misses when it already exists.
+
+    The columns are declared without type, so that the values keep the type they are
+    inserted with.
+    """
+    existing = [row[1] for row in connection.execute(f"PRAGMA table_info({quote(table)})")]
+    if not existing:
+        connection.execute(f"CREATE TABLE {quote(table)} ({', '.join(map(quote, columns))})")
+        return
+    for column in columns:
+        if column not in existing:
+            connection.execute(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column)}")
+
+
+def load_dump(connection: sqlite3.Connection, path: str) -> t.Dict[str, int]:
+    """Insert the rows of a dump within a database.
+
+    Returns:
+        Dict[str, int]: The number of rows inserted within each table.
+    """
+    counts: t.Dict[str, int] = {}
+    for table, columns, rows in iter_file_inserts(path):
+        if columns is None:
+            columns = SCHEMA.get(table)
+            if columns is None:
+                raise DumpError(f"The columns of table {table} are not named")
+        create_table(connection, table, columns)
+        connection.executemany(
+            f"INSERT INTO {quote(table)} ({', '.join(map(quote, columns))}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            rows,
+        )
+        counts[table] = counts.get(table, 0) + len(rows)
+    return counts
+
+
+def load_dumps(database_path: str, dump_paths: t.Iterable[str], replace: bool = True) -> t.Dict[str, int]:
+    """Load MySQL dumps into a SQLite database, along with the schema queried by the API.
+
+    Args:
+        database_path (str): The path of the SQLite database.
+        dump_paths (Iterable[str]): The paths of the dumps.
+        replace (bool): Whether an existing database is replaced. Defaults to True.
+
+    Returns:
+        Dict[str, int]: The number of rows inserted within each table.
+    """
+    directory = os.path.dirname(os.path.abspath(database_path))
+    os.makedirs(directory, exist_ok=True)
+    if replace and os.path.exists(database_path):
+        os.remove(database_path)
+    counts: t.Dict[str, int] = {}
+    connection = sqlite3.connect(database_path)
+    try:
+        with connection:
+            for path in dump_paths:
+                for table, count in load_dump(connection, path).items():
+                    counts[table] = counts.get(table, 0) + count
+            for table, columns in SCHEMA.items():
+                create_table(connection, table, columns)
+            for table, columns in INDEXES:
+                name = f"ix_{table}_{'_'.join(columns)}"
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {quote(name)} "
+                                   f"ON {quote(table)} ({', '.join(map(quote, columns))})")
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
+    return counts
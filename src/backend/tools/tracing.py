@@ -0,0 +1,258 @@
+"""Structured tracing of the requests.
+
+Spans are nested through a context variable, so that the spans opened while handling a request,
+including within the tasks it creates, are recorded within its trace. Once the root span of a
+trace ends, all its spans are handed over to the exporter. Outside of a trace, opening a span
+does nothing.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import secrets
+import threading
+import time
+import typing as t
+
+import httpx
+from loguru import logger
+
+
+class Span:
+    """Timed operation within a trace, with attributes."""
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start", "end", "status")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: t.Optional[str],
+                 attributes: t.Dict[str, t.Any]) -> None:
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end: t.Optional[int] = None
+        self.status = "ok"
+
+    def set_attribute(self, key: str, value: t.Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: t.Mapping[str, t.Any]) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round((self.end - self.start) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """Spans of a request."""
+
+    def __init__(self, exporter: "Exporter") -> None:
+        self.trace_id = secrets.token_hex(16)
+        self.exporter = exporter
+        self.spans: t.List[Span] = []
+
+
+_current_span: contextvars.ContextVar[t.Optional[Span]] = contextvars.ContextVar("span", default=None)
+
+
+class _NoopSpan:
+    """Span opened outside of a trace."""
+
+    def set_attribute(self, key: str, value: t.Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: t.Mapping[str, t.Any]) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+@contextlib.contextmanager
+def _record(trace: Trace, name: str, parent_id: t.Optional[str], attributes: t.Dict[str, t.Any]):
+    current = Span(trace, name, parent_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.status = "error"
+        current.attributes["exception"] = type(exc).__name__
+        raise
+    finally:
+        current.end = time.time_ns()
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: t.Any):
+    """Open a span nested within the current span, if any."""
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    with _record(parent.trace, name, parent.span_id, attributes) as current:
+        yield current
+
+
+@contextlib.contextmanager
+def trace(exporter: "Exporter", name: str, **attributes: t.Any):
+    """Open the root span of a new trace, exported once it ends."""
+    root = Trace(exporter)
+    try:
+        with _record(root, name, None, attributes) as current:
+            yield current
+    finally:
+        exporter.export([recorded.to_dict() for recorded in root.spans])
+
+
+def current_span():
+    """Return the current span, or a span doing nothing outside of a trace."""
+    return _current_span.get() or NOOP_SPAN
+
+
+class Exporter:
+    """Export the spans of the traces once they end."""
+
+    def export(self, spans: t.List[t.Dict[str, t.Any]]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+def process_path(path: str) -> str:
+    """Return the path of the file of the current process, its pid being inserted before the
+    extension, e.g. spans.1234.jsonl, so that the worker processes never rotate the same file."""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{extension}"
+
+
+class JSONLExporter(Exporter):
+    """Write the spans as JSON lines in a local file of the current process, rotated once it
+    reaches a maximum size."""
+
+    def __init__(self, path: str, max_bytes: int = 10 * 2 ** 20, backup_count: int = 5) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = process_path(path)
+        self.handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf8"
+        )
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def export(self, spans):
+        for recorded in spans:
+            self.handler.emit(logging.makeLogRecord({
+                "msg": json.dumps(recorded, ensure_ascii=False, default=str),
+            }))
+
+    def shutdown(self):
+        self.handler.close()
+
+
+def _otlp_value(value: t.Any) -> t.Dict[str, t.Any]:
+    """Encode an attribute value as an OTLP any value."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans: t.List[t.Dict[str, t.Any]], service_name: str) -> t.Dict[str, t.Any]:
+    """Encode spans as an OTLP/HTTP JSON traces request."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{
+            "scope": {"name": "backend.tools.tracing"},
+            "spans": [{
+                "traceId": recorded["trace_id"],
+                "spanId": recorded["span_id"],
+                **({"parentSpanId": recorded["parent_id"]} if recorded["parent_id"] else {}),
+                "name": recorded["name"],
+                "kind": 2 if recorded["parent_id"] is None else 1,
+                "startTimeUnixNano": str(recorded["start"]),
+                "endTimeUnixNano": str(recorded["end"]),
+                "attributes": [{"key": key, "value": _otlp_value(value)}
+                               for key, value in recorded["attributes"].items()],
+                "status": {"code": 2 if recorded["status"] == "error" else 1},
+            } for recorded in spans],
+        }],
+    }]}
+
+
+class OTLPExporter(Exporter):
+    """Send the spans to an OTLP/HTTP collector, encoded as JSON."""
+
+    def __init__(self, endpoint: str, service_name: str = "qwb-api", timeout: float = 5) -> None:
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=timeout)
+
+    def export(self, spans):
+        try:
+            response = self.client.post(self.endpoint, json=otlp_payload(spans, self.service_name))
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            logger.warning(f"Failed to export {len(spans)} spans to {self.endpoint}: {exc}")
+
+    def shutdown(self):
+        self.client.close()
+
+
+class BackgroundExporter(Exporter):
+    """Hand the spans over to other exporters from a background thread, so that exporting
+    never blocks the requests. Spans are dropped when the queue is full."""
+
+    def __init__(self, exporters: t.Sequence[Exporter], max_queue: int = 1024) -> None:
+        self.exporters = list(exporters)
+        self.queue: "queue.Queue[t.Optional[t.List[t.Dict[str, t.Any]]]]" = queue.Queue(max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            spans = self.queue.get()
+            if spans is None:
+                return
+            for exporter in self.exporters:
+                try:
+                    exporter.export(spans)
+                except Exception:
+                    logger.exception("Failed to export spans")
+            self.queue.task_done()
+
+    def export(self, spans):
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def flush(self, timeout: float = 5) -> None:
+        """Wait until the queued spans are exported."""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def shutdown(self):
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+        for exporter in self.exporters:
+            exporter.shutdown()
@@ -28,3 +28,13 @@ def test(c, coverage=False):
     print("=== Make sure that the package has been installed in dev mode ! ===")
     coverage_mode = "--cov=src/backend" if coverage else ""
     c.run(f"pytest -v tests/integration {coverage_mode}")
+
+
+@task
+def bench(c, tolerance=0.3):
+    """Run the benchmark suite, failing on the regressions against the versioned baseline.
+
+    Args:
+        tolerance (float): Relative slowdown above which a case is a regression.
+    """
+    c.run(f"python -m benchmarks.suite --tolerance {tolerance}")
@@ -0,0 +1,144 @@
+"""Tests for the admission control of the expensive routes.
+"""
+import asyncio
+import time
+import unittest
+import httpx
+from fastapi import FastAPI
+from backend.api.admission import (AdmissionController, AdmissionRejected, AdmissionSettings,
+                                   ConcurrencyLimiter, TokenBuckets, admission)
+from backend.api.app import AppSettings
+from backend.api.oidc.provider import oidc_provider
+from backend.api.responses import APIJSONResponse
+from backend.contexts.collations.db import ParallelsClient
+from backend.contexts.collations.router import router as collations_router
+
+
+class SlowParallelsClient(ParallelsClient):
+    """Client whose collations are CPU bound for half a second."""
+
+    async def get_parallels_content(self, name, reconstructed, chapter=None, verse=None,
+                                    strip_vowels=False):
+        return {"4Q1": "a b c", "4Q2": "a c d"}
+
+    @staticmethod
+    def collate_parallels(name, chapter, verse, records):
+        deadline = time.perf_counter() + 0.5
+        while time.perf_counter() < deadline:
+            pass
+        return ParallelsClient.collate_parallels(name, chapter, verse, records)
+
+
+class TestAdmission(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests for the admission control of the expensive routes.
+    """
+
+    async def test_limiter(self):
+        """
+        Test that the limiter queues the requests beyond its concurrency, and rejects them once
+        its queue is full.
+        """
+        limiter = ConcurrencyLimiter(concurrency=1, queue_size=1, timeout=1)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.waiting, 1)
+        with self.assertRaises(AdmissionRejected) as context:
+            await limiter.acquire()
+        self.assertEqual(context.exception.reason, "queue_full")
+        limiter.release()
+        await waiting
+        self.assertEqual(limiter.waiting, 0)
+
+    async def test_limiter_timeout(self):
+        """
+        Test that the requests waiting longer than the timeout are rejected.
+        """
+        limiter = ConcurrencyLimiter(concurrency=1, queue_size=1, timeout=0.01)
+        await limiter.acquire()
+        with self.assertRaises(AdmissionRejected) as context:
+            await limiter.acquire()
+        self.assertEqual(context.exception.reason, "timeout")
+        self.assertEqual(limiter.waiting, 0)
+
+    def test_token_buckets(self):
+        """
+        Test that each user is limited by its own bucket.
+        """
+        buckets = TokenBuckets(rate=1, burst=2)
+        self.assertEqual(buckets.take("alice"), 0)
+        self.assertEqual(buckets.take("alice"), 0)
+        self.assertGreater(buckets.take("alice"), 0)
+        self.assertEqual(buckets.take("bob"), 0)
+
+    async def test_route(self):
+        """
+        Test that the requests of a limited route beyond its concurrency and its queue are
+        answered at once with a 503, without delaying the other routes.
+        """
+        app = FastAPI()
+        app.state.settings = AppSettings()
+        oidc_provider(app)
+        app.state.admission = AdmissionController(AdmissionSettings(
+            concurrency={"collation": 1}, queue_size={"collation": 1}, retry_after=3
+        ))
+        release = asyncio.Event()
+
+        @app.get("/collation", dependencies=[admission("collation")])
+        async def get_collation():
+            await release.wait()
+            return APIJSONResponse({"collation": True})
+
+        @app.get("/manuscript", dependencies=[admission("manuscript")])
+        async def get_manuscript():
+            return APIJSONResponse({"manuscript": True})
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            admitted = asyncio.create_task(client.get("/collation"))
+            queued = asyncio.create_task(client.get("/collation"))
+            await asyncio.sleep(0.05)
+            rejected = await client.get("/collation")
+            self.assertEqual(rejected.status_code, 503)
+            self.assertEqual(rejected.headers["Retry-After"], "3")
+            self.assertEqual((await client.get("/manuscript")).status_code, 200)
+            release.set()
+            self.assertEqual((await admitted).status_code, 200)
+            self.assertEqual((await queued).status_code, 200)
+
+    async def test_collation_off_loop(self):
+        """
+        Test that a CPU bound collation does not delay the other routes.
+        """
+        app = FastAPI()
+        app.state.settings = AppSettings()
+        oidc_provider(app)
+        app.state.admission = AdmissionController(AdmissionSettings())
+        app.state.database = SlowParallelsClient("sqlite://", "test")
+        app.include_router(collations_router)
+
+        @app.get("/manuscript", dependencies=[admission("manuscript")])
+        async def get_manuscript():
+            return APIJSONResponse({"manuscript": True})
+
+        # Import the collation stack beforehand
+        await asyncio.to_thread(ParallelsClient.collate_parallels, "4Q1", "1", "1", {"4Q1": "a"})
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            collation = asyncio.create_task(client.get(
+                "/parallels/4Q1/1/1/collation", params={"reconstructed": True, "strip_vowels": False}
+            ))
+            latencies = []
+            while not collation.done():
+                started = time.perf_counter()
+                self.assertEqual((await client.get("/manuscript")).status_code, 200)
+                latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+            self.assertGreater(len(latencies), 10)
+            self.assertLess(max(latencies), 0.2)
+            self.assertEqual((await collation).status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
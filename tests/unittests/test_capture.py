@@ -0,0 +1,51 @@
+"""Tests for the capture of the traffic of the API.
+"""
+import unittest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from backend.api.capture import CaptureMiddleware
+from backend.api.responses import APIJSONResponse
+from .test_tracing import ListExporter
+
+
+class TestCapture(unittest.TestCase):
+    """
+    Tests for the capture of the traffic of the API.
+    """
+
+    def test_capture(self):
+        """
+        Test that the requests are captured with their route and parameters, without their
+        headers.
+        """
+        exporter = ListExporter()
+        app = FastAPI()
+
+        @app.get("/parallels/{tradition}/{chapter}/{verse}/collation")
+        async def get_collation(tradition: str, chapter: str, verse: str, reconstructed: bool):
+            return APIJSONResponse({"witnesses": [tradition]})
+
+        app.add_middleware(CaptureMiddleware, exporter=exporter)
+        TestClient(app).get("/parallels/4Q157/frg.%201%20i/1/collation?reconstructed=true",
+                            headers={"Authorization": "Bearer secret"})
+        record, = exporter.spans
+        self.assertEqual(record["route"], "/parallels/{tradition}/{chapter}/{verse}/collation")
+        self.assertEqual(record["path_params"], {"tradition": "4Q157", "chapter": "frg. 1 i", "verse": "1"})
+        self.assertEqual(record["query_params"], [("reconstructed", "true")])
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["size"], len(b'{"witnesses":["4Q157"]}'))
+        self.assertNotIn("secret", str(record))
+
+    def test_sample_rate(self):
+        """
+        Test that no request is captured with a null sample rate.
+        """
+        exporter = ListExporter()
+        app = FastAPI()
+        app.add_middleware(CaptureMiddleware, exporter=exporter, sample_rate=0)
+        TestClient(app).get("/manuscript/")
+        self.assertEqual(exporter.spans, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
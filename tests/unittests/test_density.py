@@ -0,0 +1,42 @@
+"""Tests for the density of the parallels.
+"""
+import gzip
+import json
+import unittest
+from backend.contexts.collations.density import DensityTable
+
+
+class TestDensityTable(unittest.TestCase):
+    """
+    Tests for the density of the parallels.
+    """
+
+    def test_update(self):
+        """
+        Test that the density of all traditions is encoded as a JSON payload and its gzipped
+        version.
+        """
+        table = DensityTable()
+        self.assertTrue(table.empty)
+        changed = table.update([("Gen", "1", "1", 4), ("Gen", "1", "2", 3), ("Exod", "2", "1", 1)])
+        self.assertEqual(changed, ["Gen", "Exod"])
+        expected = {"Gen": {"1": {"1": 4, "2": 3}}, "Exod": {"2": {"1": 1}}}
+        self.assertEqual(json.loads(table.payload), expected)
+        self.assertEqual(json.loads(gzip.decompress(table.gzipped)), expected)
+
+    def test_incremental_update(self):
+        """
+        Test that only the traditions whose counts changed are updated.
+        """
+        table = DensityTable()
+        table.update([("Gen", "1", "1", 4), ("Exod", "2", "1", 1)])
+        etag = table.etag
+        self.assertEqual(table.update([("Gen", "1", "1", 4), ("Exod", "2", "1", 1)]), [])
+        self.assertEqual(table.etag, etag)
+        self.assertEqual(table.update([("Gen", "1", "1", 5)]), ["Gen", "Exod"])
+        self.assertNotEqual(table.etag, etag)
+        self.assertEqual(json.loads(table.payload), {"Gen": {"1": {"1": 5}}})
+
+
+if __name__ == "__main__":
+    unittest.main()
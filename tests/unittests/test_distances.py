@@ -0,0 +1,40 @@
+"""Tests for the distances between witnesses.
+"""
+import unittest
+from backend.contexts.collations.distances import cluster_order, distance_matrix, \
+    witness_distances
+
+
+class TestDistances(unittest.TestCase):
+    """
+    Tests for the distances between witnesses.
+    """
+
+    def test_distance_matrix(self):
+        """
+        Test that the edit distances between witnesses are counted in words.
+        """
+        self.assertEqual(
+            distance_matrix(["a b c", "a x c", "a b"]).tolist(),
+            [[0, 1, 1], [1, 0, 2], [1, 2, 0]],
+        )
+
+    def test_cluster_order(self):
+        """
+        Test that close witnesses are ordered next to each other.
+        """
+        order = cluster_order(distance_matrix(["a b c d", "w x y z", "a b c", "w x y"]))
+        self.assertIn(order, [[0, 2, 1, 3], [1, 3, 0, 2], [2, 0, 3, 1], [3, 1, 2, 0]])
+
+    def test_witness_distances(self):
+        """
+        Test the distances and the clustering of the witnesses of a parallel.
+        """
+        self.assertEqual(
+            witness_distances({"4Q1": "a b", "4Q2": "a b"}),
+            {"witnesses": ["4Q1", "4Q2"], "distances": [[0, 0], [0, 0]], "order": ["4Q1", "4Q2"]},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
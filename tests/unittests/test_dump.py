@@ -0,0 +1,62 @@
+"""Tests for the parser of the MySQL dumps.
+"""
+import os
+import tempfile
+import unittest
+from backend.tools.dump import DumpError, iter_file_inserts, iter_inserts, load_dump
+
+DUMP_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "deploy", "dump", "test_dump.sql")
+
+
+class TestDump(unittest.TestCase):
+    """
+    Tests for the parser of the MySQL dumps.
+    """
+
+    def test_values(self):
+        """
+        Test the parsing of the strings, the numbers and the null values of the rows.
+        """
+        text = ("INSERT INTO `t` (`a`, `b`, `c`) VALUES\n"
+                "('it''s, (1)', NULL, -1),\n"
+                "('a\\\\b\\n\\'c', 'x', 2.5);\n")
+        self.assertEqual(list(iter_inserts(text)), [
+            ("t", ["a", "b", "c"], [("it's, (1)", None, -1), ("a\\b\n'c", "x", 2.5)]),
+        ])
+
+    def test_invalid(self):
+        """
+        Test that a truncated statement is rejected.
+        """
+        with self.assertRaises(DumpError):
+            list(iter_inserts("INSERT INTO `t` (`a`) VALUES ('x') ('y');"))
+
+    def test_file(self):
+        """
+        Test that the statements of a file are read one at a time, including their values
+        spanning several lines.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dump.sql")
+            with open(path, "w", encoding="utf8") as file:
+                file.write("CREATE TABLE `t` (`a` text);\n"
+                           "INSERT INTO `t` (`a`) VALUES\n('x;\n'),\n('y');\n"
+                           "INSERT INTO `u` (`b`) VALUES (1);\n")
+            self.assertEqual(list(iter_file_inserts(path)), [
+                ("t", ["a"], [("x;\n",), ("y",)]),
+                ("u", ["b"], [(1,)]),
+            ])
+
+    def test_test_dump(self):
+        """
+        Test the loading of the test dump of the database.
+        """
+        records = load_dump(DUMP_PATH)["manuscript_view"]
+        self.assertEqual(len(records), 48)
+        self.assertEqual(records[2]["reading"], "עלו]הי")
+        self.assertIsNone(records[2]["system_user_id"])
+        self.assertEqual(records[2]["unique_ordered_id"], 920001002002)
+
+
+if __name__ == "__main__":
+    unittest.main()
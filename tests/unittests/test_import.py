@@ -0,0 +1,31 @@
+"""Tests for the modules imported when creating the application.
+"""
+import subprocess
+import sys
+import unittest
+
+# Packages only imported by the collations, once requested or warmed up
+DEFERRED = ["collatex", "prettytable", "networkx", "IPython", "numpy"]
+
+
+class TestImport(unittest.TestCase):
+    """
+    Tests for the modules imported when creating the application.
+    """
+
+    def test_deferred_imports(self):
+        """
+        Test that the collation stack is not imported when creating the application.
+        """
+        result = subprocess.run([
+            sys.executable, "-c",
+            "import sys\n"
+            "from backend.api.app import AppSettings, create_app\n"
+            "create_app(AppSettings())\n"
+            f"print(','.join(name for name in {DEFERRED!r} if name in sys.modules))",
+        ], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""Tests for the in-memory index of the parallels.
+"""
+import unittest
+from backend.contexts.collations.index import ParallelIndex
+
+
+def reading(reading_id, manuscript, column, line, text, ordered_id, reconstructed=0):
+    """Build a reading of manuscript_view."""
+    return {"manuscript_sign_cluster_reading_id": reading_id, "manuscript": manuscript,
+            "column": column, "line": line, "reading": text, "followed_by": "space",
+            "unique_ordered_id": ordered_id, "is_fully_reconstructed": reconstructed,
+            "language_id": 1, "position_in_reference": 0}
+
+
+READINGS = [
+    reading(1, "Gen", "1", "1", "בראשית", 100),
+    reading(2, "Gen", "1", "1", "ברא", 101),
+    reading(3, "Gen", "1", "2", "והארץ", 102),
+    reading(10, "4Q2", "1", "1", "בראשית", 200),
+    reading(11, "4Q2", "1", "1", "בר[א", 201, 1),
+    reading(12, "4Q2", "1", "2", "ברא", 202),
+    reading(13, "4Q2", "1", "2", "והארץ", 203),
+]
+
+GROUPS = [
+    {"anchor_reading_id": anchor, "manuscript_sign_cluster_reading_id": member,
+     "parallel_phrase_id": phrase}
+    for phrase, anchor, member in [(1, 1, 1), (1, 1, 10), (2, 2, 2), (2, 2, 12),
+                                   (3, 3, 3), (3, 3, 11), (3, 3, 13)]
+]
+
+WORDS = [
+    {"parallel_phrase_id": phrase, "manuscript_sign_cluster_reading_id": word}
+    for phrase, word in [(1, 1), (1, 10), (2, 2), (2, 12), (3, 3), (3, 11), (3, 13)]
+]
+
+
+class TestParallelIndex(unittest.TestCase):
+    """
+    Tests for the in-memory index of the parallels.
+    """
+
+    def setUp(self):
+        self.index = ParallelIndex.build(READINGS, GROUPS, WORDS)
+
+    def test_spans_of(self):
+        """
+        Test the span of the parallels of an anchor within each witness manuscript.
+        """
+        self.assertEqual(list(self.index.spans_of(3)),
+                         [self.index.strings.index("4Q2"), 201, 203])
+        self.assertEqual(list(self.index.spans_of(42)), [])
+
+    def test_resolve_verse(self):
+        """
+        Test that only the readings of the span parallel to the verse are resolved.
+        """
+        records = self.index.resolve("Gen", "1", "1")
+        self.assertEqual(
+            [(record["manuscript"], record["reading"], record["anchor_reading_id"])
+             for record in records],
+            [("Gen", "בראשית", 1), ("Gen", "ברא", 2), ("4Q2", "בראשית", 1), ("4Q2", "ברא", 2)],
+        )
+
+    def test_resolve_chapter(self):
+        """
+        Test the resolution of the parallels of a whole chapter.
+        """
+        records = self.index.resolve("Gen", "1")
+        self.assertEqual([record["unique_ordered_id"] for record in records],
+                         [100, 101, 102, 200, 201, 202, 203])
+        self.assertEqual(records[4]["is_fully_reconstructed"], 1)
+
+    def test_resolve_unknown(self):
+        """
+        Test that an unknown location has no parallels.
+        """
+        self.assertEqual(self.index.resolve("Exod", "1", "1"), [])
+
+    def test_parallel_locations(self):
+        """
+        Test the locations of the parallels of a verse.
+        """
+        self.assertCountEqual(
+            self.index.parallel_locations("Gen", "1", "2"),
+            [{"manuscript": "4Q2", "column": "1", "line": "1"},
+             {"manuscript": "4Q2", "column": "1", "line": "2"}],
+        )
+
+    def test_parallels_count(self):
+        """
+        Test the count of the parallel manuscripts of each chapter and of each verse.
+        """
+        self.assertEqual(self.index.parallels_count("Gen"),
+                         [{"count_manuscript": 2, "chapter": "1"}])
+        self.assertEqual(self.index.parallels_count("Gen", "1"),
+                         [{"count_manuscript": 2, "verse": "1"},
+                          {"count_manuscript": 2, "verse": "2"}])
+        self.assertEqual(self.index.parallels_count("Exod"), [])
+        self.assertEqual(list(self.index.density()), [("Gen", "1", "1", 2), ("Gen", "1", "2", 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,273 @@
+"""Tests for the asynchronous jobs.
+"""
+import asyncio
+import json
+import tempfile
+import threading
+import time
+import unittest
+import httpx
+from fastapi import FastAPI
+from backend.api.app import AppSettings
+from backend.api.oidc.provider import oidc_provider
+from backend.contexts.collations.db import ParallelsClient
+from backend.contexts.jobs.manager import JobManager, JobQueueFull
+from backend.contexts.jobs.models import JobStatus
+from backend.contexts.jobs.router import router as jobs_router
+from backend.contexts.jobs.runners import collation_runner
+
+PARAMS = {"tradition": "4Q157", "chapter": "1", "verse": "1", "reconstructed": False,
+          "strip_vowels": False}
+
+
+class TestJobs(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests for the asynchronous jobs.
+    """
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.release = threading.Event()
+        self.runs = 0
+        self.managers = []
+
+    async def asyncTearDown(self):
+        self.release.set()
+        for jobs in self.managers:
+            await jobs.stop()
+        self.directory.cleanup()
+
+    def manager(self, start=True, **kwargs):
+        """Create a job manager of the shared directory, as created by each worker."""
+        jobs = JobManager(self.directory.name, poll_interval=0.01, **kwargs)
+        jobs.register("collation", self.run_job)
+        if start:
+            jobs.start()
+        self.managers.append(jobs)
+        return jobs
+
+    async def run_job(self, run):
+        self.runs += 1
+        await run.advance("collation", 0.5)
+        # Blocking step run in a thread, as the collations
+        await asyncio.to_thread(self.release.wait, 5)
+        await run.advance("serialization", 0.9)
+        if run.params["tradition"] == "missing":
+            raise KeyError("missing")
+        return run.params["tradition"].encode("utf8")
+
+    async def test_run(self):
+        """
+        Test that a job reports its progress, then its result once done.
+        """
+        jobs = self.manager(workers=1)
+        job = await jobs.submit("collation", {"tradition": "4Q157"}, "alice")
+        job = await jobs.wait(job.id, 0.1)
+        self.assertEqual((job.status, job.stage, job.progress), (JobStatus.RUNNING, "collation", 0.5))
+        self.release.set()
+        job = await jobs.wait(job.id, 1)
+        self.assertEqual((job.status, job.progress), (JobStatus.DONE, 1.0))
+        self.assertEqual(await jobs.result(job.id), b"4Q157")
+
+    async def test_failure(self):
+        """
+        Test that the exception of a failed job is reported as its error.
+        """
+        jobs = self.manager(workers=1)
+        self.release.set()
+        job = await jobs.submit("collation", {"tradition": "missing"}, "alice")
+        job = await jobs.wait(job.id, 1)
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertEqual(job.error, "KeyError: 'missing'")
+        # A failed job is submitted again
+        self.assertEqual((await jobs.submit("collation", {"tradition": "missing"}, "alice")).status,
+                         JobStatus.QUEUED)
+
+    async def test_deduplication(self):
+        """
+        Test that identical submissions return the same job, including once it is done.
+        """
+        jobs = self.manager(workers=1)
+        job = await jobs.submit("collation", {"tradition": "4Q157", "chapter": None}, "alice")
+        same = await jobs.submit("collation", {"chapter": None, "tradition": "4Q157"}, "bob")
+        self.assertEqual(same.id, job.id)
+        self.assertEqual(same.subscribers, ["alice", "bob"])
+        self.release.set()
+        await jobs.wait(job.id, 1)
+        self.assertEqual((await jobs.submit("collation", {"tradition": "4Q157", "chapter": None}, "carol")).status,
+                         JobStatus.DONE)
+        self.assertEqual(self.runs, 1)
+
+    async def test_queue_full(self):
+        """
+        Test that submissions beyond the queue size are rejected.
+        """
+        jobs = self.manager(start=False, queue_size=1)
+        await jobs.submit("collation", {"tradition": "4Q157"}, "alice")
+        with self.assertRaises(JobQueueFull):
+            await jobs.submit("collation", {"tradition": "4Q158"}, "alice")
+
+    async def test_cancel(self):
+        """
+        Test that a job is only cancelled by its subscribers, once all of them cancelled it,
+        and keeps its worker busy until its current step returns.
+        """
+        jobs = self.manager(workers=1)
+        running = await jobs.submit("collation", {"tradition": "4Q157"}, "alice")
+        await jobs.submit("collation", {"tradition": "4Q157"}, "bob")
+        queued = await jobs.submit("collation", {"tradition": "4Q158"}, "alice")
+        await jobs.wait(running.id, 0.1)
+        with self.assertRaises(PermissionError):
+            await jobs.cancel(running.id, "carol")
+        self.assertEqual((await jobs.cancel(running.id, "alice")).status, JobStatus.RUNNING)
+        self.assertEqual((await jobs.cancel(running.id, "bob")).status, JobStatus.CANCELLED)
+        self.assertEqual((await jobs.cancel(queued.id, "alice")).status, JobStatus.CANCELLED)
+        # The worker stays busy until the blocking step of the cancelled job returns
+        self.assertIsNone(jobs.store.acquire_slot(1))
+        self.release.set()
+        await asyncio.sleep(0.1)
+        slot = jobs.store.acquire_slot(1)
+        self.assertIsNotNone(slot)
+        slot.close()
+        self.assertEqual((await jobs.get(running.id)).status, JobStatus.CANCELLED)
+        self.assertIsNone(await jobs.result(running.id))
+        self.assertEqual(self.runs, 1)
+
+    async def test_stop_after_submit(self):
+        """
+        Test that the workers stop when a job is submitted right before, rather than
+        swallowing the cancellation.
+        """
+        jobs = self.manager(workers=1)
+        await asyncio.sleep(0.05)
+        job = await jobs.submit("collation", {"tradition": "4Q157"}, "alice")
+        await asyncio.wait_for(jobs.stop(), 1)
+        self.assertEqual((await jobs.get(job.id)).status, JobStatus.QUEUED)
+
+    async def test_store_off_loop(self):
+        """
+        Test that the event loop keeps running while the lock of the store is held, e.g. by
+        another worker.
+        """
+        jobs = self.manager(workers=1)
+        held, released = threading.Event(), threading.Event()
+
+        def hold():
+            with jobs.store.lock():
+                held.set()
+                released.wait(5)
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait()
+        submit = asyncio.ensure_future(jobs.submit("collation", {"tradition": "4Q157"}, "alice"))
+        started = time.monotonic()
+        await asyncio.sleep(0.1)
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertFalse(submit.done())
+        released.set()
+        self.assertEqual((await submit).status, JobStatus.QUEUED)
+        thread.join()
+
+    async def test_shared_directory(self):
+        """
+        Test that a job submitted to a worker is run, polled and fetched through the others,
+        the number of jobs run at once being bounded across the workers.
+        """
+        first = self.manager(start=False, workers=1)
+        second = self.manager(workers=1)
+        third = self.manager(workers=1)
+        jobs = [await first.submit("collation", {"tradition": tradition}, "alice")
+                for tradition in ["4Q157", "4Q158"]]
+        await asyncio.sleep(0.1)
+        self.assertEqual([(await first.get(job.id)).status for job in jobs],
+                         [JobStatus.RUNNING, JobStatus.QUEUED])
+        self.release.set()
+        for job in jobs:
+            self.assertEqual((await third.wait(job.id, 1)).status, JobStatus.DONE)
+        self.assertEqual(await second.result(jobs[1].id), b"4Q158")
+
+    async def test_exited_worker(self):
+        """
+        Test that the jobs left running by an exited worker are run again.
+        """
+        jobs = self.manager(start=False)
+        job = await jobs.submit("collation", {"tradition": "4Q157"}, "alice")
+        job.status = JobStatus.RUNNING
+        jobs.store.write(job)
+        self.release.set()
+        self.manager()
+        self.assertEqual((await jobs.wait(job.id, 1)).status, JobStatus.DONE)
+
+    async def test_retention(self):
+        """
+        Test that finished jobs are dropped once older than the retention, or beyond the
+        maximum number of jobs.
+        """
+        jobs = self.manager(workers=1, retention=3600, max_jobs=2)
+        self.release.set()
+        finished = []
+        for tradition in ["4Q157", "4Q158", "4Q159"]:
+            job = await jobs.submit("collation", {"tradition": tradition}, "alice")
+            await jobs.wait(job.id, 1)
+            finished.append(job)
+        with jobs.store.lock():
+            jobs.purge()
+        self.assertEqual({job.id for job in jobs.store.jobs()}, {finished[1].id, finished[2].id})
+        jobs.retention = 0
+        self.assertIsNone(await jobs.get(finished[2].id))
+
+
+class FakeDatabase(ParallelsClient):
+    """Client of the texts of the parallels, collated by the actual collation."""
+
+    async def get_parallels_content(self, name, reconstructed, chapter=None, verse=None,
+                                    strip_vowels=False):
+        return {"4Q1": "a b c", "4Q2": "a c d"}
+
+
+class TestJobsRouter(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests for the endpoints of the asynchronous jobs, served by several workers.
+    """
+
+    def worker(self, directory):
+        """Create the application of a worker."""
+        app = FastAPI()
+        app.state.settings = AppSettings()
+        oidc_provider(app)
+        app.state.jobs = JobManager(directory, workers=1, poll_interval=0.01)
+        app.state.jobs.register("collation", collation_runner(FakeDatabase("sqlite://", "test")))
+        app.include_router(jobs_router)
+        return app
+
+    @staticmethod
+    def client(app, address):
+        transport = httpx.ASGITransport(app=app, client=(address, 1234))
+        return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+    async def test_workers(self):
+        """
+        Test that a collation submitted to a worker is polled, fetched and cancelled through
+        another worker.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            first, second = self.worker(directory), self.worker(directory)
+            second.state.jobs.start()
+            async with self.client(first, "10.0.0.1") as alice, \
+                    self.client(second, "10.0.0.1") as alice_second, \
+                    self.client(second, "10.0.0.2") as bob:
+                response = await alice.post("/jobs/collation", params=PARAMS)
+                self.assertEqual(response.status_code, 202)
+                location = response.headers["Location"]
+                response = await alice_second.get(location, params={"wait": 5})
+                self.assertEqual(response.json()["status"], "done")
+                response = await alice_second.get(f"{location}/result")
+                self.assertEqual(json.loads(response.content)["witnesses"], ["4Q1", "4Q2"])
+                self.assertEqual((await bob.delete(location)).status_code, 403)
+                self.assertEqual((await alice_second.delete(location)).json()["status"], "done")
+                self.assertEqual((await bob.get("/jobs/unknown")).status_code, 404)
+            await second.state.jobs.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
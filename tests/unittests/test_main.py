@@ -0,0 +1,41 @@
+"""Tests for the options of the server.
+"""
+import unittest
+import os
+from backend.main import resolve_implementation, resolve_workers, server_options
+from backend.settings.settings import APISettings
+
+
+class TestMain(unittest.TestCase):
+    """
+    Tests for the options of the server.
+    """
+
+    def test_resolve_implementation(self):
+        """
+        Test that automatic implementations fall back when the preferred one is not installed.
+        """
+        self.assertEqual(resolve_implementation("auto", "not_installed_module", "h11"), "h11")
+        self.assertEqual(resolve_implementation("auto", "unittest", "h11"), "unittest")
+        self.assertEqual(resolve_implementation("asyncio", "uvloop", "asyncio"), "asyncio")
+
+    def test_server_options(self):
+        """
+        Test the options of the server built from the settings.
+        """
+        options = server_options(APISettings(workers=0, loop="asyncio", http="h11", backlog=64))
+        self.assertEqual(options["workers"], 1)
+        self.assertEqual((options["loop"], options["http"], options["backlog"]), ("asyncio", "h11", 64))
+
+    def test_resolve_workers(self):
+        """
+        Test that the workers scale with the cores by default, unless set.
+        """
+        self.assertEqual(APISettings().workers, "auto")
+        self.assertEqual(resolve_workers("auto"), os.cpu_count() or 1)
+        self.assertEqual(server_options(APISettings())["workers"], os.cpu_count() or 1)
+        self.assertEqual(resolve_workers(APISettings(workers="3").workers), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""Tests for the metrics of the API.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from backend.api.app import AppSettings
+from backend.api.metrics import MetricsSettings, metrics_provider
+from backend.tools.metrics import Counter, Gauge, Histogram, MetricsDirectory, Registry
+from backend.tools.sql_client import SQLClient
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Tests for the metrics of the API.
+    """
+
+    def test_render(self):
+        """
+        Test the rendering of the metrics in the Prometheus text format.
+        """
+        registry = Registry()
+        counter = Counter("requests_total", "Requests.", ["route"], registry=registry)
+        counter.inc(route='/a"b')
+        counter.inc(2, route='/a"b')
+        histogram = Histogram("duration_seconds", "Duration.", registry=registry, buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+        Gauge("pool", "Pool.", ["state"], registry=registry, callback=lambda: {("free",): 3})
+        self.assertEqual(registry.render().splitlines(), [
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{route="/a\\"b"} 3',
+            "# HELP duration_seconds Duration.",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{le="0.1"} 1',
+            'duration_seconds_bucket{le="1"} 2',
+            'duration_seconds_bucket{le="+Inf"} 3',
+            "duration_seconds_sum 5.55",
+            "duration_seconds_count 3",
+            "# HELP pool Pool.",
+            "# TYPE pool gauge",
+            'pool{state="free"} 3',
+        ])
+
+    def test_labels(self):
+        """
+        Test that the labels of a metric are checked.
+        """
+        counter = Counter("checked_total", "Checked.", ["route"], registry=Registry())
+        with self.assertRaises(ValueError):
+            counter.inc(path="/")
+
+    def test_directory(self):
+        """
+        Test that the metrics of the processes are aggregated through a shared directory.
+        """
+        registry = Registry()
+        counter = Counter("requests_total", "Requests.", registry=registry)
+        gauge = Gauge("in_flight", "In flight.", registry=registry)
+        histogram = Histogram("duration_seconds", "Duration.", registry=registry, buckets=(1,))
+        Gauge("ratio", "Ratio.", registry=registry, callback=lambda: {(): 0.5},
+              multiprocess_mode="all")
+        counter.inc(2)
+        gauge.set(3)
+        histogram.observe(0.5)
+        with tempfile.TemporaryDirectory() as path:
+            directory = MetricsDirectory(path, [registry])
+            directory.write()
+            # Metrics of a worker which exited
+            exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                                    capture_output=True, text=True, check=True)
+            shutil.copy(os.path.join(path, f"{os.getpid()}.json"),
+                        os.path.join(path, f"{exited.stdout.strip()}.json"))
+            counter.inc()
+            lines = directory.render().splitlines()
+        self.assertIn("requests_total 5", lines)
+        self.assertIn("in_flight 3", lines)
+        self.assertIn('duration_seconds_bucket{le="1"} 2', lines)
+        self.assertIn(f'ratio{{pid="{os.getpid()}"}} 0.5', lines)
+        self.assertEqual(len([line for line in lines if line.startswith("ratio{")]), 1)
+
+    def test_endpoint(self):
+        """
+        Test that the requests are measured by route and exposed on /metrics.
+        """
+        app = FastAPI()
+        app.state.settings = AppSettings(metrics=MetricsSettings(enabled=True))
+        app.state.database = SQLClient("sqlite://", "test")
+
+        @app.get("/manuscript/{manuscript_name}")
+        async def get_manuscript(manuscript_name: str):
+            return {}
+
+        metrics_provider(app)
+        client = TestClient(app)
+        client.get("/manuscript/1QS")
+        metrics = client.get("/metrics")
+        self.assertTrue(metrics.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('qwb_http_requests_total{method="GET",route="/manuscript/{manuscript_name}",'
+                      'status="200"}', metrics.text)
+        self.assertIn('qwb_http_requests_in_flight{method="GET",route="/manuscript/{manuscript_name}"} 0',
+                      metrics.text)
+        self.assertIn('qwb_cache_hits{cache="readings"}', metrics.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
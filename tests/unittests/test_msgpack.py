@@ -0,0 +1,47 @@
+"""Tests for the MessagePack encoding.
+"""
+import unittest
+from backend.tools.msgpack import MessagePackError, _packb, msgpack
+
+
+class TestMessagePack(unittest.TestCase):
+    """
+    Tests for the MessagePack encoding.
+    """
+
+    def test_packb(self):
+        """
+        Test the encoding of values against the MessagePack specification.
+        """
+        self.assertEqual(_packb({"a": [1, -1, None, True]}), b"\x81\xa1a\x94\x01\xff\xc0\xc3")
+        self.assertEqual(_packb(300), b"\xcd\x01\x2c")
+        self.assertEqual(_packb(-200), b"\xd1\xff\x38")
+        self.assertEqual(_packb(-2 ** 63), b"\xd3\x80" + b"\x00" * 7)
+        self.assertEqual(_packb("x" * 40), b"\xd9\x28" + b"x" * 40)
+        self.assertEqual(_packb(b"\x00\x01"), b"\xc4\x02\x00\x01")
+        self.assertEqual(_packb(list(range(20)))[:3], b"\xdc\x00\x14")
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        """
+        Test that the minimal encoder gives the same payloads as msgpack.
+        """
+        values = [
+            None, False, 0, 127, 128, 2 ** 16, 2 ** 40, -32, -33, -2 ** 40, 1.5, "", "φ" * 300,
+            b"\x00\x01", list(range(20)), {str(key): key for key in range(20)},
+        ]
+        for value in values:
+            self.assertEqual(_packb(value), msgpack.packb(value, use_bin_type=True))
+
+    def test_errors(self):
+        """
+        Test that unsupported values are rejected.
+        """
+        with self.assertRaises(MessagePackError):
+            _packb(object())
+        with self.assertRaises(MessagePackError):
+            _packb(2 ** 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Regression tests of the normalization pipeline against the previous implementation.
+"""
+import random
+import unittest
+from backend.contexts.collations.models import FOLLOWED_BY_MAPPER
+from backend.contexts.collations.normalization import brackets_balanced, get_pipeline, \
+    remove_vowels
+from benchmarks.legacy import legacy_check_matched_bracket, legacy_strip_hebrew_vowels, \
+    legacy_unpack_parallel_data
+
+READINGS = ["[--]", "[--", "עלו]הי", "עננא", "ביו]מ֯י", "]־־־", "מדנ]ח", "אנ֯[כיר?", "--]",
+            "מא[לה", "ובמלאכו֯[הי", "ד֯בעפרא", "מ֯[ו]עה", "ל־[", "[מפ]ר֯ק[ן?]", "והת־־[",
+            "]־־־[", "]ל֯[", "בְּרֵאשִׁ֖ית", "][", "a]b[c", "[[x]", "]]y[", ""]
+
+
+def random_records(count, seed=0):
+    """Generate records mixing manuscripts, brackets, vowels and separators."""
+    rng = random.Random(seed)
+    alphabet = "אבגדה[]?-\u05BE\u05B0\u05B4\u05AF\u05C7\u0591\u05F3"
+    return [{
+        "manuscript": rng.choice(["4Q1", "4Q2", "1QIsa"]),
+        "reading": rng.choice(READINGS + ["".join(rng.choices(alphabet, k=rng.randint(0, 8)))]),
+        "followed_by": rng.choice(list(FOLLOWED_BY_MAPPER)),
+        "is_fully_reconstructed": rng.random() < 0.1,
+    } for _ in range(count)]
+
+
+class TestNormalization(unittest.TestCase):
+    """
+    Tests of the normalization pipeline.
+    """
+
+    def test_brackets_balanced(self):
+        """
+        Test the bracket check against the previous implementation.
+        """
+        for record in random_records(2000):
+            self.assertEqual(brackets_balanced(record["reading"]),
+                             legacy_check_matched_bracket(record["reading"]))
+
+    def test_remove_vowels(self):
+        """
+        Test the vowels stripping against the previous implementation.
+        """
+        text = "".join(chr(code) for code in range(0x0580, 0x0600)) + " בְּרֵאשִׁ֖ית"
+        self.assertEqual(remove_vowels(text), legacy_strip_hebrew_vowels(text))
+
+    def test_unpack(self):
+        """
+        Test the unpacking of the parallels against the previous implementation, for every
+        combination of options.
+        """
+        records = random_records(5000)
+        for reconstructed in [True, False]:
+            for strip_vowels in [True, False]:
+                expected = legacy_unpack_parallel_data(records, reconstructed)
+                if strip_vowels:
+                    expected = {manuscript: legacy_strip_hebrew_vowels(text)
+                                for manuscript, text in expected.items()}
+                self.assertEqual(get_pipeline(reconstructed, strip_vowels).unpack(records),
+                                 expected)
+
+    def test_unpack_reconstructions(self):
+        """
+        Test that reconstructions are replaced by the fragmentation placeholder.
+        """
+        records = [
+            {"manuscript": "4Q2", "reading": "אלהי[ם", "followed_by": "space",
+             "is_fully_reconstructed": False},
+            {"manuscript": "4Q2", "reading": "את", "followed_by": "space",
+             "is_fully_reconstructed": True},
+            {"manuscript": "4Q2", "reading": "השמים]", "followed_by": "break",
+             "is_fully_reconstructed": False},
+        ]
+        self.assertEqual(get_pipeline(False).unpack(records), {"4Q2": "אלהיφ φ φ"})
+        self.assertEqual(get_pipeline(True).unpack(records), {"4Q2": "אלהי[ם את השמים]"})
+
+
+if __name__ == "__main__":
+    unittest.main()
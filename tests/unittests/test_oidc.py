@@ -0,0 +1,264 @@
+"""Tests for the verification of the tokens.
+"""
+import asyncio
+import json
+import time
+import unittest
+import httpx
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from backend.api.oidc.errors import InvalidCredentialsError, OIDCUnavailableError, \
+    UnknownKeyError
+from backend.api.oidc.oidc_auth_client import OIDCAuthClient
+
+
+def generate_key():
+    """Generate an RSA private key."""
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def issue_token(private_key, expires_in=3600, kid=None, **claims):
+    """Issue a token signed by a private key."""
+    payload = {
+        "given_name": "reader",
+        "resource_access": {"qwb-api": {"roles": ["read"]}},
+        "exp": int(time.time()) + expires_in,
+        **claims,
+    }
+    return jwt.encode(payload, private_key, algorithm="RS256",
+                      headers={"kid": kid} if kid else None)
+
+
+class StubIssuer:
+    """Local OIDC server publishing its metadata and keys."""
+
+    def __init__(self):
+        self.keys = {}
+        self.requests = []
+        self.available = True
+        # Whether the metadata and the keys lack their fields
+        self.malformed = False
+
+    def rotate(self, kid):
+        """Publish a new key, and return its private key."""
+        private_key = generate_key()
+        self.keys = {kid: private_key}
+        return private_key
+
+    def handler(self, request):
+        """Handle a request made to the server."""
+        self.requests.append(request.url.path)
+        if not self.available:
+            return httpx.Response(503)
+        if self.malformed:
+            return httpx.Response(200, json={})
+        if request.url.path.endswith("/.well-known/openid-configuration"):
+            return httpx.Response(200, json={
+                "jwks_uri": "http://issuer/realms/theolab/protocol/openid-connect/certs",
+                "grant_types_supported": ["implicit"],
+                "authorization_endpoint": "http://issuer/auth",
+                "token_endpoint": "http://issuer/token",
+            })
+        keys = []
+        for kid, private_key in self.keys.items():
+            jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+            keys.append({**jwk, "kid": kid, "alg": "RS256", "use": "sig"})
+        return httpx.Response(200, json={"keys": keys})
+
+    def client(self, **kwargs):
+        """Create a client of the server."""
+        return OIDCAuthClient(issuer_url="http://issuer", realm="theolab", client_id="qwb-api",
+                              http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.handler)),
+                              **kwargs)
+
+
+class TestClaimsCache(unittest.TestCase):
+    """
+    Tests for the cache of the claims of verified tokens.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key = generate_key()
+
+    def setUp(self):
+        self.client = OIDCAuthClient(issuer_url="http://localhost", realm="theolab",
+                                     client_id="qwb-api", enabled=False,
+                                     claims_cache_size=2, claims_cache_skew=30)
+        self.client.public_key = self.private_key.public_key()
+
+    def test_hits(self):
+        """
+        Test that the claims of a token are only verified once.
+        """
+        token = issue_token(self.private_key)
+        claims = self.client.verify_token(token)
+        self.assertIs(self.client.verify_token(token), claims)
+        self.assertEqual((self.client.claims_cache.hits, self.client.claims_cache.misses), (1, 1))
+
+    def test_expiration(self):
+        """
+        Test that tokens about to expire are not cached.
+        """
+        token = issue_token(self.private_key, expires_in=10)
+        self.client.verify_token(token)
+        self.assertEqual(len(self.client.claims_cache), 0)
+
+    def test_bounded(self):
+        """
+        Test that the least recently used tokens are evicted.
+        """
+        tokens = [issue_token(self.private_key, sid=str(ix)) for ix in range(3)]
+        for token in tokens:
+            self.client.verify_token(token)
+        self.assertEqual(len(self.client.claims_cache), 2)
+        self.assertIsNone(self.client.claims_cache.get(tokens[0]))
+
+    def test_key_rotation(self):
+        """
+        Test that the cache is flushed when the public key changes.
+        """
+        token = issue_token(self.private_key)
+        self.client.verify_token(token)
+        self.client.public_key = generate_key().public_key()
+        self.assertEqual(len(self.client.claims_cache), 0)
+        with self.assertRaises(InvalidCredentialsError):
+            self.client.verify_token(token)
+
+
+class TestOIDCAuthClient(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests for the retrieval of the keys from the OIDC server.
+    """
+
+    def setUp(self):
+        self.issuer = StubIssuer()
+        self.private_key = self.issuer.rotate("key-1")
+
+    async def test_start(self):
+        """
+        Test that the keys are retrieved when the client is started.
+        """
+        client = self.issuer.client(keys_refresh_interval=0)
+        self.assertFalse(client.ready)
+        await client.start()
+        self.assertTrue(client.ready)
+        claims = await client.get_user_claim(issue_token(self.private_key, kid="key-1"))
+        self.assertEqual(claims.given_name, "reader")
+        await client.stop()
+
+    async def test_start_in_background(self):
+        """
+        Test that the client starts without waiting for the OIDC server when retries are
+        enabled, and is ready once the server is available.
+        """
+        self.issuer.available = False
+        client = self.issuer.client(retry=True, retry_delay=0.01, keys_refresh_interval=0)
+        await client.start()
+        self.assertFalse(client.ready)
+        with self.assertRaises(OIDCUnavailableError):
+            await client.get_user_claim(issue_token(self.private_key, kid="key-1"))
+        self.issuer.available = True
+        for _ in range(100):
+            if client.ready:
+                break
+            await asyncio.sleep(0.01)
+        self.assertTrue(client.ready)
+        await client.stop()
+
+    async def test_start_failure(self):
+        """
+        Test that the client fails to start on the first failure when retries are disabled.
+        """
+        self.issuer.available = False
+        client = self.issuer.client()
+        with self.assertRaises(ValueError):
+            await client.start()
+        await client.stop()
+
+    async def test_malformed_metadata(self):
+        """
+        Test that the retrieval of the metadata is retried when the metadata lacks fields.
+        """
+        self.issuer.malformed = True
+        client = self.issuer.client(retry=True, retry_delay=0.01, keys_refresh_interval=0)
+        await client.start()
+        await asyncio.sleep(0.05)
+        self.assertFalse(client.ready)
+        self.assertFalse(client._task.done())
+        self.issuer.malformed = False
+        for _ in range(100):
+            if client.ready:
+                break
+            await asyncio.sleep(0.01)
+        self.assertTrue(client.ready)
+        await client.stop()
+
+    async def test_unknown_key(self):
+        """
+        Test that a token signed by an unknown key triggers a rate limited refetch of the keys.
+        """
+        client = self.issuer.client(keys_refresh_interval=0, keys_refetch_interval=60)
+        await client.start()
+        client._last_fetch = float("-inf")
+        private_key = self.issuer.rotate("key-2")
+        claims = await client.get_user_claim(issue_token(private_key, kid="key-2"))
+        self.assertEqual(claims.given_name, "reader")
+        fetches = len(self.issuer.requests)
+        with self.assertRaises(UnknownKeyError):
+            await client.get_user_claim(issue_token(private_key, kid="key-3"))
+        self.assertEqual(len(self.issuer.requests), fetches)
+        await client.stop()
+
+    async def test_unknown_key_before_discovery(self):
+        """
+        Test that the refetch of the keys is rate limited while the metadata of the server
+        could not be retrieved.
+        """
+        self.issuer.available = False
+        client = self.issuer.client(keys_refresh_interval=0, keys_refetch_interval=60)
+        for _ in range(2):
+            await client.refetch_keys()
+        self.assertEqual(len(self.issuer.requests), 1)
+        await client.stop()
+
+    async def test_refresh(self):
+        """
+        Test that the keys are refreshed in the background, flushing the claims cache.
+        """
+        client = self.issuer.client(keys_refresh_interval=0.01)
+        await client.start()
+        await client.get_user_claim(issue_token(self.private_key, kid="key-1"))
+        self.assertEqual(len(client.claims_cache), 1)
+        self.issuer.rotate("key-2")
+        for _ in range(100):
+            if "key-2" in client.keys:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(list(client.keys), ["key-2"])
+        self.assertEqual(len(client.claims_cache), 0)
+        await client.stop()
+
+    async def test_refresh_malformed_keys(self):
+        """
+        Test that the keys are still refreshed after the server returned malformed keys.
+        """
+        client = self.issuer.client(keys_refresh_interval=0.01)
+        await client.start()
+        self.issuer.malformed = True
+        with self.assertRaises(ValueError):
+            await client.fetch_keys()
+        await asyncio.sleep(0.05)
+        self.assertFalse(client._task.done())
+        self.issuer.malformed = False
+        self.issuer.rotate("key-2")
+        for _ in range(100):
+            if "key-2" in client.keys:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(list(client.keys), ["key-2"])
+        await client.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
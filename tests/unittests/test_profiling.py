@@ -0,0 +1,111 @@
+"""Tests for the profiling of the requests.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from backend.api.profiling import ProfilingMiddleware, ProfilingSettings, SamplingProfiler
+
+
+def busy_function(duration):
+    """Keep the CPU busy for some time."""
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+class TestProfiling(unittest.TestCase):
+    """
+    Tests for the profiling of the requests.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        app = FastAPI()
+
+        @app.get("/parallels/{tradition}")
+        async def get_parallel(tradition: str):
+            busy_function(0.05)
+            return {"tradition": tradition}
+
+        @app.get("/collation/{tradition}")
+        async def get_collation(tradition: str):
+            await asyncio.to_thread(busy_function, 0.05)
+            return {"tradition": tradition}
+
+        app.add_middleware(ProfilingMiddleware, settings=ProfilingSettings(
+            enabled=True, token="secret", interval=0.001, directory=self.directory.name
+        ))
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def index(self):
+        """Read the index of the profiles."""
+        path = os.path.join(self.directory.name, "index.jsonl")
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf8") as index_file:
+            return [json.loads(line) for line in index_file]
+
+    def test_sampling_profiler(self):
+        """
+        Test that the stacks of the profiled thread are sampled.
+        """
+        profiler = SamplingProfiler(threading.get_ident(), interval=0.001).start()
+        busy_function(0.05)
+        profile = profiler.stop().speedscope("busy")
+        frames = [frame["name"] for frame in profile["shared"]["frames"]]
+        self.assertIn("busy_function", frames)
+        self.assertEqual(profile["profiles"][0]["type"], "sampled")
+        self.assertEqual(len(profile["profiles"][0]["samples"]), len(profile["profiles"][0]["weights"]))
+
+    def test_profiled_request(self):
+        """
+        Test that the requests with the profiling token are profiled by route.
+        """
+        response = self.client.get("/parallels/4Q1", headers={"X-Profile": "secret"})
+        self.assertEqual(response.json(), {"tradition": "4Q1"})
+        [entry] = self.index()
+        self.assertEqual(response.headers["x-profile-id"], entry["id"])
+        self.assertEqual((entry["route"], entry["status"]), ("/parallels/{tradition}", 200))
+        self.assertTrue(entry["profile"].startswith("parallels_tradition"))
+        with open(os.path.join(self.directory.name, entry["profile"]), encoding="utf8") as profile:
+            profile = json.load(profile)
+        self.assertIn("busy_function", [frame["name"] for frame in profile["shared"]["frames"]])
+
+    def test_offloaded_work(self):
+        """
+        Test that the work offloaded to threads by a profiled request is sampled, in the
+        profile of its thread.
+        """
+        response = self.client.get("/collation/4Q1", headers={"X-Profile": "secret"})
+        self.assertEqual(response.json(), {"tradition": "4Q1"})
+        [entry] = self.index()
+        with open(os.path.join(self.directory.name, entry["profile"]), encoding="utf8") as profile:
+            profile = json.load(profile)
+        frames = [frame["name"] for frame in profile["shared"]["frames"]]
+        stacks = [{frames[frame] for sample in thread["samples"] for frame in sample}
+                  for thread in profile["profiles"]]
+        self.assertEqual(len(stacks), 2)
+        self.assertNotIn("busy_function", stacks[0])
+        self.assertIn("busy_function", stacks[1])
+        self.assertTrue(profile["profiles"][1]["name"].startswith("GET /collation/4Q1 (asyncio"))
+
+    def test_unprofiled_request(self):
+        """
+        Test that the requests without the profiling token are not profiled.
+        """
+        response = self.client.get("/parallels/4Q1", headers={"X-Profile": "guess"})
+        self.assertNotIn("x-profile-id", response.headers)
+        self.assertEqual(self.index(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
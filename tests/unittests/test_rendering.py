@@ -0,0 +1,86 @@
+"""Tests for the HTML rendering of the collations.
+"""
+import asyncio
+import unittest
+from collatex import Collation, collate
+from backend.contexts.collations.router import collation_page
+from backend.contexts.collations.rendering import alignment_matrix, html_table, iter_html_page
+
+
+def collate_witnesses(witnesses):
+    """Collate plain witnesses as an alignment table."""
+    collation = Collation()
+    for sigil, content in witnesses.items():
+        collation.add_plain_witness(sigil, content)
+    return collate(collation, output="table", segmentation=False)
+
+
+class TestRendering(unittest.TestCase):
+    """
+    Tests for the HTML rendering of the collations.
+    """
+
+    def test_html_table(self):
+        """
+        Test that each witness is rendered as a row, with omissions as dashes.
+        """
+        table = collate_witnesses({"A": "a b c", "B": "a c"})
+        self.assertEqual(
+            html_table(table),
+            "<table>\n<tbody>\n"
+            "<tr><td>A</td><td>a</td><td>b</td><td>c</td></tr>\n"
+            "<tr><td>B</td><td>a</td><td>-</td><td>c</td></tr>\n"
+            "</tbody>\n</table>",
+        )
+
+    def test_html_table_escaping(self):
+        """
+        Test that the readings and the sigils are escaped.
+        """
+        rendered = html_table(collate_witnesses({"<A>": "x < y & z", "B": "x < y"}))
+        self.assertIn("<tr><td>&lt;A&gt;</td><td>x</td><td>&lt;</td>", rendered)
+        self.assertIn("<td>&amp;</td>", rendered)
+        self.assertNotIn("<A>", rendered)
+
+    def test_alignment_matrix(self):
+        """
+        Test the encoding of an alignment table as a matrix of token indices.
+        """
+        self.assertEqual(
+            alignment_matrix(collate_witnesses({"A": "a b c", "B": "a c"})),
+            {
+                "witnesses": ["A", "B"],
+                "tokens": ["a", "b", "c"],
+                "table": [[0, 1, 2], [0, -1, 2]],
+                "variants": [False, True, False],
+            },
+        )
+
+    def test_iter_html_page(self):
+        """
+        Test that the page wraps the MT text and the table.
+        """
+        table = collate_witnesses({"A": "a", "B": "a"})
+        page = "".join(iter_html_page("4Q1", "1", "2", mt_text="<mt>", table=table))
+        self.assertIn("Collation for <b>4Q1</b> chapter <b>1</b> verse <b>2</b>", page)
+        self.assertIn("&lt;mt&gt;", page)
+        self.assertIn(html_table(table), page)
+        self.assertTrue(page.endswith("</div></body></html>\n"))
+
+    def test_collation_page_error(self):
+        """
+        Test that the errors of the collation are raised before the page is streamed.
+        """
+        class Database:
+            async def get_manuscript(self, manuscript_name, column, line):
+                return "mt"
+
+            async def get_collation(self, name, chapter, verse, reconstructed, strip_vowels):
+                raise KeyError(name)
+
+        with self.assertRaises(KeyError):
+            asyncio.run(collation_page(Database(), "4Q1", "1", "2", True, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+"""Tests for the shared JSON response.
+"""
+import json
+import unittest
+from backend.api.responses import APIJSONResponse, dumps
+
+
+class TestResponses(unittest.TestCase):
+    """
+    Tests for the shared JSON response.
+    """
+
+    def test_dumps(self):
+        """
+        Test that the content is serialized as compact UTF-8 JSON.
+        """
+        content = {"1QS": {"1": "שמע ישראל"}, "count": [("1", 2)], 3: None}
+        self.assertEqual(
+            dumps(content),
+            '{"1QS":{"1":"שמע ישראל"},"count":[["1",2]],"3":null}'.encode("utf8"),
+        )
+
+    def test_response(self):
+        """
+        Test the body and the media type of the response.
+        """
+        response = APIJSONResponse({"manuscripts": ["1QS", "4Q1"]})
+        self.assertEqual(response.media_type, "application/json")
+        self.assertEqual(json.loads(response.body), {"manuscripts": ["1QS", "4Q1"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Tests for the coalescing of identical concurrent calls.
+"""
+import asyncio
+import unittest
+from backend.tools.singleflight import singleflight
+
+
+class Client:
+    """Client counting the computations of its coalesced method."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    @singleflight
+    async def get_collation(self, name: str, chapter: str, reconstructed: bool = False):
+        self.calls += 1
+        await self.release.wait()
+        if name == "missing":
+            raise KeyError(name)
+        return {"name": name, "chapter": chapter, "reconstructed": reconstructed}
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests for the coalescing of identical concurrent calls.
+    """
+
+    async def test_coalescing(self):
+        """
+        Test that identical concurrent calls share a computation, whether their arguments are
+        given by position, by keyword or by default, while different calls do not.
+        """
+        client = Client()
+        calls = [
+            asyncio.create_task(client.get_collation("Genesis", "1")),
+            asyncio.create_task(client.get_collation(name="Genesis", chapter="1", reconstructed=False)),
+            asyncio.create_task(client.get_collation("Genesis", "1", True)),
+        ]
+        await asyncio.sleep(0)
+        client.release.set()
+        first, second, third = await asyncio.gather(*calls)
+        self.assertIs(first, second)
+        self.assertTrue(third["reconstructed"])
+        self.assertEqual(client.calls, 2)
+        # Results are not kept once the computation ends
+        await client.get_collation("Genesis", "1")
+        self.assertEqual(client.calls, 3)
+
+    async def test_exception(self):
+        """
+        Test that the exception of a computation is raised to every caller.
+        """
+        client = Client()
+        calls = [asyncio.create_task(client.get_collation("missing", "1")) for _ in range(2)]
+        await asyncio.sleep(0)
+        client.release.set()
+        for result in await asyncio.gather(*calls, return_exceptions=True):
+            self.assertIsInstance(result, KeyError)
+        self.assertEqual(client.calls, 1)
+
+    async def test_cancelled_leader(self):
+        """
+        Test that cancelling the first caller does not abort the computation awaited by the
+        other callers, which is only cancelled once every caller is.
+        """
+        client = Client()
+        leader = asyncio.create_task(client.get_collation("Genesis", "1"))
+        follower = asyncio.create_task(client.get_collation("Genesis", "1"))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        client.release.set()
+        self.assertEqual((await follower)["name"], "Genesis")
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(client.calls, 1)
+
+        client.release.clear()
+        call = asyncio.create_task(client.get_collation("Genesis", "2"))
+        await asyncio.sleep(0)
+        flight, = client._single_flights._flights.values()
+        call.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await flight.task
+        self.assertEqual(len(client._single_flights), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
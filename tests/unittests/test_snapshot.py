@@ -0,0 +1,155 @@
+"""Tests for the snapshots of the corpus.
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+from array import array
+from backend.contexts import APISQLClient
+from backend.contexts.collations.index import ParallelIndex
+from backend.contexts.manuscripts.texts import ManuscriptTexts
+from backend.contexts.snapshot import INDEX_PREFIX, write_corpus_snapshot
+from backend.tools.snapshot import Snapshot, SnapshotError, reopen, write_snapshot
+from .test_index import GROUPS, READINGS, WORDS
+
+# Rows of the manuscripts, in the order of the manuscript query
+MANUSCRIPT_ROWS = {
+    "Gen": [
+        {"column": "1", "line": "1", "reading": "בראשית", "followed_by": "space"},
+        {"column": "1", "line": "1", "reading": "ברא", "followed_by": "break"},
+        {"column": "1", "line": "2", "reading": "אלהים", "followed_by": "none"},
+        {"column": "2", "line": "1", "reading": "את", "followed_by": "space"},
+    ],
+    "4Q2": [
+        {"column": "1", "line": None, "reading": "ברא", "followed_by": "none"},
+    ],
+}
+
+
+class TestSnapshot(unittest.TestCase):
+    """
+    Tests for the snapshot files.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "corpus.snapshot")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        """
+        Test that the arrays, strings and sections are read back from the snapshot.
+        """
+        version = write_snapshot(self.path, {
+            "ids": array("Q", [1, 2, 2 ** 40]),
+            "flags": array("B", [0, 1, 1]),
+            "empty": array("L"),
+        }, {"catalog": {"1QS": ["1", "2"]}}, ["4Q1", "בראשית", ""])
+        snapshot = Snapshot(self.path)
+        self.assertEqual(snapshot.version, version)
+        self.assertEqual(list(snapshot.arrays["ids"]), [1, 2, 2 ** 40])
+        self.assertEqual(list(snapshot.arrays["flags"]), [0, 1, 1])
+        self.assertEqual(list(snapshot.arrays["empty"]), [])
+        self.assertEqual(list(snapshot.strings), ["4Q1", "בראשית", ""])
+        self.assertEqual(snapshot.sections, {"catalog": {"1QS": ["1", "2"]}})
+
+    def test_version(self):
+        """
+        Test that the version is the digest of the content.
+        """
+        first = write_snapshot(self.path, {"ids": array("Q", [1])}, {}, ["a"])
+        self.assertEqual(write_snapshot(self.path, {"ids": array("Q", [1])}, {}, ["a"]), first)
+        self.assertNotEqual(write_snapshot(self.path, {"ids": array("Q", [2])}, {}, ["a"]), first)
+
+    def test_reopen(self):
+        """
+        Test that a snapshot is only reopened when replaced by another version.
+        """
+        self.assertIsNone(reopen(None, self.path))
+        write_snapshot(self.path, {"ids": array("Q", [1])}, {})
+        snapshot = reopen(None, self.path)
+        self.assertIsNotNone(snapshot)
+        self.assertIsNone(reopen(snapshot, self.path))
+        write_snapshot(self.path, {"ids": array("Q", [1])}, {})
+        self.assertIsNone(reopen(snapshot, self.path))
+        write_snapshot(self.path, {"ids": array("Q", [2])}, {})
+        new_snapshot = reopen(snapshot, self.path)
+        self.assertEqual(list(new_snapshot.arrays["ids"]), [2])
+        # The previous snapshot is still readable
+        self.assertEqual(list(snapshot.arrays["ids"]), [1])
+
+    def test_invalid(self):
+        """
+        Test that files which are not snapshots are rejected.
+        """
+        with open(self.path, "wb") as snapshot_file:
+            snapshot_file.write(b"not a snapshot")
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path)
+
+    def test_parallel_index(self):
+        """
+        Test that the parallel index and the catalog are served from the snapshot.
+        """
+        index = ParallelIndex.build(READINGS, GROUPS, WORDS)
+        write_corpus_snapshot(self.path, index, {"Gen": ["1"], "4Q2": ["1"]})
+        client = APISQLClient("sqlite://", "test")
+        self.assertTrue(asyncio.run(client.open_snapshot(self.path)))
+        for location in [("Gen",), ("Gen", "1"), ("Gen", "1", "2"), ("4Q2", "1", "1")]:
+            self.assertEqual(client.parallel_index.resolve(*location), index.resolve(*location))
+            self.assertEqual(client.parallel_index.parallel_locations(*location),
+                             index.parallel_locations(*location))
+        self.assertEqual(client.parallel_index.parallels_count("Gen", "1"),
+                         index.parallels_count("Gen", "1"))
+        self.assertEqual(asyncio.run(client.get_distinct_manuscripts()), ["Gen", "4Q2"])
+        self.assertTrue(asyncio.run(client.check_manuscript_exists("4Q2")))
+        self.assertEqual(asyncio.run(client.get_manuscript_attribute("Gen", "column")), ["1"])
+        self.assertFalse(client.density_table.empty)
+        self.assertFalse(asyncio.run(client.open_snapshot(self.path)))
+        self.assertEqual(sorted(client.parallel_index.density()), sorted(index.density()))
+        self.assertEqual(set(Snapshot(self.path).sections), {"catalog"})
+        # Snapshots without the texts leave them to the database
+        self.assertIsNone(client.texts)
+
+    def test_manuscript_texts(self):
+        """
+        Test that the texts of the manuscripts are served from the snapshot, along with the
+        parallel index sharing their table of strings.
+        """
+        index = ParallelIndex.build(READINGS, GROUPS, WORDS)
+        texts = ManuscriptTexts.build(MANUSCRIPT_ROWS, index.strings)
+        self.assertEqual(texts.strings[:len(index.strings)], index.strings)
+        write_corpus_snapshot(self.path, index, {"Gen": ["1", "2"], "4Q2": ["1"]}, texts)
+        client = APISQLClient("sqlite://", "test")
+        self.assertTrue(asyncio.run(client.open_snapshot(self.path)))
+        self.assertEqual(client.parallel_index.resolve("Gen", "1"), index.resolve("Gen", "1"))
+        for (manuscript, column, line), text in [
+            (("Gen", None, None), "בראשית ברא\nאלהיםאת "),
+            (("Gen", "1", None), "בראשית ברא\nאלהים"),
+            (("Gen", "1", "1"), "בראשית ברא\n"),
+            (("Gen", "3", None), ""),
+            (("4Q2", None, None), "ברא"),
+            (("1QS", None, None), ""),
+        ]:
+            self.assertEqual(asyncio.run(client.get_manuscript(manuscript, column, line)), text)
+        with self.assertRaises(ValueError):
+            asyncio.run(client.get_manuscript("Gen", line="1"))
+
+    def test_previous_parallel_index(self):
+        """
+        Test that a snapshot lacking the arrays of the parallel index is rejected.
+        """
+        write_snapshot(self.path, {f"{INDEX_PREFIX}location_rows": array("Q")}, {"catalog": {}})
+        client = APISQLClient("sqlite://", "test")
+        with self.assertRaises(ValueError):
+            asyncio.run(client.open_snapshot(self.path))
+        # On startup, the corpus is queried from the database instead
+        self.assertFalse(asyncio.run(client.load_snapshot(self.path)))
+        self.assertIsNone(client.parallel_index)
+        self.assertIsNone(client.catalog)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Tests for the SQLite database standing in for the QWB database.
+"""
+import os
+import tempfile
+import unittest
+from backend.contexts import APISQLClient
+from backend.tools.sqlite import load_dumps
+
+DUMP_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "deploy", "dump", "test_dump.sql")
+
+
+class TestSQLite(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests for the SQLite database standing in for the QWB database.
+    """
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.counts = load_dumps(os.path.join(self.directory.name, "QD.sqlite"), [DUMP_PATH])
+        self.client = APISQLClient(f"sqlite:///{self.directory.name}", "QD.sqlite")
+        await self.client.connect()
+
+    async def asyncTearDown(self):
+        await self.client.database.disconnect()
+        self.directory.cleanup()
+
+    async def test_manuscript(self):
+        """
+        Test that the manuscripts of the dump are retrieved.
+        """
+        self.assertEqual(self.counts, {"manuscript_view": 48})
+        self.assertEqual(self.client.dialect, "sqlite")
+        self.assertTrue(await self.client.check_manuscript_exists("4Q157"))
+        self.assertEqual(await self.client.get_manuscript("4Q157", "frg. 1 i", "2"), "[-- עלו]הי עננא\n")
+        self.assertEqual(await self.client.get_manuscript_attribute("4Q157", "column"),
+                         ["frg. 1 i", "frg. 1 ii"])
+
+    async def test_parallels(self):
+        """
+        Test that the queries of the parallels and of the morphological analysis are compatible
+        with SQLite.
+        """
+        self.assertEqual(await self.client.get_parallels_content("4Q157", True, "frg. 1 i", "2"),
+                         {"4Q157": "[-- עלו]הי עננא"})
+        self.assertEqual(await self.client.get_parallels_count("4Q157"), [])
+        await self.client.fetch_all(self.client.mt_query("4Q157", "frg. 1 i", "2"), "mt")
+        # The readings of the sign clusters are missing from the dump, their table being empty
+        self.assertEqual(await self.client.get_word_morphological_analysis("עננא"), [])
+        await self.client.fetch_all(self.client.morphological_analysis_reading_query(["34211"]),
+                                    "morphological_analysis")
+
+
+if __name__ == "__main__":
+    unittest.main()
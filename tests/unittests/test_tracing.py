@@ -0,0 +1,116 @@
+"""Tests for the tracing of the requests.
+"""
+import json
+import os
+import tempfile
+import unittest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from backend.api.responses import APIJSONResponse
+from backend.api.tracing import TracingMiddleware
+from backend.tools.tracing import Exporter, JSONLExporter, otlp_payload, span, trace
+
+
+class ListExporter(Exporter):
+    """Keep the exported spans in memory."""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+class TestTracing(unittest.TestCase):
+    """
+    Tests for the tracing of the requests.
+    """
+
+    def test_nesting(self):
+        """
+        Test that the spans are nested within the trace and exported once the root span ends.
+        """
+        exporter = ListExporter()
+        with trace(exporter, "request"):
+            with span("db.fetch_all", query="manuscript") as current:
+                current.set_attribute("rows", 3)
+            with self.assertRaises(KeyError):
+                with span("unpack"):
+                    raise KeyError("reading")
+            self.assertEqual(exporter.spans, [])
+        fetch, unpack, root = exporter.spans
+        self.assertEqual({fetch["trace_id"], unpack["trace_id"]}, {root["trace_id"]})
+        self.assertEqual(fetch["parent_id"], root["span_id"])
+        self.assertIsNone(root["parent_id"])
+        self.assertEqual(fetch["attributes"], {"query": "manuscript", "rows": 3})
+        self.assertEqual(unpack["status"], "error")
+        self.assertEqual(unpack["attributes"]["exception"], "KeyError")
+
+    def test_outside_trace(self):
+        """
+        Test that the spans opened outside of a trace are not recorded.
+        """
+        with span("db.fetch_all") as current:
+            current.set_attribute("rows", 3)
+
+    def test_middleware(self):
+        """
+        Test that the spans of a request carry its route and path parameters.
+        """
+        exporter = ListExporter()
+        app = FastAPI()
+
+        @app.get("/manuscript/{manuscript_name}")
+        async def get_manuscript(manuscript_name: str):
+            return APIJSONResponse({"manuscript": manuscript_name})
+
+        app.add_middleware(TracingMiddleware, exporter=exporter)
+        TestClient(app).get("/manuscript/1QS")
+        serialization, root = exporter.spans
+        self.assertEqual(serialization["name"], "serialization")
+        self.assertEqual(serialization["parent_id"], root["span_id"])
+        self.assertEqual(root["attributes"], {
+            "http.method": "GET",
+            "http.route": "/manuscript/{manuscript_name}",
+            "http.status_code": 200,
+            "manuscript_name": "1QS",
+        })
+
+    def test_jsonl_rotation(self):
+        """
+        Test that the JSONL file of the process is rotated once it reaches its maximum size.
+        """
+        exporter = ListExporter()
+        with trace(exporter, "request", tradition="Isaiah"):
+            pass
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces", "spans.jsonl")
+            jsonl = JSONLExporter(path, max_bytes=300, backup_count=1)
+            for _ in range(3):
+                jsonl.export(exporter.spans)
+            jsonl.shutdown()
+            self.assertEqual(jsonl.path, os.path.join(directory, "traces", f"spans.{os.getpid()}.jsonl"))
+            self.assertTrue(os.path.exists(f"{jsonl.path}.1"))
+            with open(jsonl.path, encoding="utf8") as file:
+                self.assertEqual(json.loads(file.readline())["attributes"], {"tradition": "Isaiah"})
+
+    def test_otlp_payload(self):
+        """
+        Test the encoding of the spans as an OTLP/HTTP JSON request.
+        """
+        exporter = ListExporter()
+        with trace(exporter, "request"):
+            with span("collation", witnesses=4, tradition="Isaiah"):
+                pass
+        payload = otlp_payload(exporter.spans, "qwb-api")
+        collation, root = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual(collation["parentSpanId"], root["spanId"])
+        self.assertNotIn("parentSpanId", root)
+        self.assertEqual(collation["attributes"], [
+            {"key": "witnesses", "value": {"intValue": "4"}},
+            {"key": "tradition", "value": {"stringValue": "Isaiah"}},
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
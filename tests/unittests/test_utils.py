@@ -1,8 +1,10 @@
 """Tests for variant analysis.
 """
 import unittest
+from collatex import Collation, collate
 from backend.contexts.collations.utils import compute_levensthein, compute_letter_difference, \
-    retrieve_morphological_analysis, detect_omission, analyze_variants, combine_values
+    retrieve_morphological_analysis, detect_omission, analyze_variants, combine_values, \
+    analyze_collations
 
 
 class TestUtils(unittest.TestCase):
@@ -104,6 +106,30 @@ class TestUtils(unittest.TestCase):
             },
         )
 
+    def test_analyze_collations(self):
+        """
+        Test the analysis of every pair of witnesses of the variant columns of a collation.
+        """
+        collation = Collation()
+        collation.add_plain_witness("A", "the cat sat on mat")
+        collation.add_plain_witness("B", "the dog sat on the mat")
+        collation.add_plain_witness("C", "a cat sat mat")
+        analysis = analyze_collations(
+            collate(collation, output="table", segmentation=False, near_match=True)
+        )
+        self.assertEqual(list(analysis), ["0:A-C", "0:B-C", "1:B-A", "1:B-C"])
+        self.assertEqual(
+            {key: (value["reading_1"], value["reading_2"], value["distance"], value["guessed_type"])
+             for key, value in analysis.items()},
+            {
+                "0:A-C": ("the", "a", 3, "unknown"),
+                "0:B-C": ("the", "a", 3, "unknown"),
+                "1:B-A": ("dog", "cat", 3, "unknown"),
+                "1:B-C": ("dog", "cat", 3, "unknown"),
+            },
+        )
+        self.assertCountEqual(analysis["1:B-A"]["letter_difference"], ["d", "o", "g", "c", "a", "t"])
+
 
 if __name__ == "__main__":
     unittest.main()